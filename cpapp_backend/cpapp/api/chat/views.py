@@ -12,7 +12,7 @@ import datetime
 # Import and set up environment variables first
 import os
 
-from cpapp.services.agent import CarepayAgent
+from cpapp.services.agent import get_agent
 from cpapp.api.login.authentication import JWTAuthentication
 from cpapp.services.url_shortener import get_long_url
 from cpapp.services.api_client import CarepayAPIClient
@@ -26,7 +26,7 @@ from django.db import models
 logger = logging.getLogger(__name__)
 
 # Initialize agent
-carepay_agent = CarepayAgent()
+carepay_agent = get_agent()
 # Initialize API client
 api_client = CarepayAPIClient()
 
@@ -3,7 +3,7 @@ from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.response import Response
 from rest_framework import status
 from cpapp.services.document_service import DocumentService
-from cpapp.services.agent import CarepayAgent
+from cpapp.services.agent import get_agent
 import logging
 import tempfile
 import os
@@ -18,7 +18,7 @@ class AadhaarUploadView(APIView):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.document_service = DocumentService()
-        self.agent = CarepayAgent()
+        self.agent = get_agent()
     
     def post(self, request):
         """
@@ -157,7 +157,7 @@ class PanCardUploadView(APIView):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.document_service = DocumentService()
-        self.agent = CarepayAgent()
+        self.agent = get_agent()
     
     def post(self, request):
         """
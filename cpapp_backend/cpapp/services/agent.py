@@ -1,37 +1,1232 @@
 import os
 import json
+import orjson
+import hashlib
+import asyncio
 import logging
-from typing import Dict, Any, List, Optional
+import reprlib
+from typing import Dict, Any, Callable, Final, List, Mapping, Optional, Sequence, Tuple
+from types import MappingProxyType
+from collections import Counter
 from datetime import datetime
 import uuid
 import re  # for phone number detection and OTP regex
 import tempfile
 import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
 
-from langchain_community.utilities import BingSearchAPIWrapper
 from langchain.agents import Tool, AgentExecutor
+from langchain.agents.agent import RunnableMultiActionAgent
 from langchain.tools import StructuredTool
-from langchain.agents import create_openai_functions_agent
+from langchain.agents import create_openai_tools_agent
 from langchain_core.prompts import PromptTemplate, ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.runnables import RunnableBranch
 from langchain_openai import ChatOpenAI
 from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
 from langchain_core.tools import ArgsSchema
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.agents import AgentAction
+from pydantic import BaseModel, Field
 from cpapp.services.api_client import CarepayAPIClient
 from cpapp.services.loan_api_client import LoanAPIClient
 from cpapp.models.session_data import SessionData
 from cpapp.services.session_manager import SessionManager
+from cpapp.services.agent_messages import (
+    EMPLOYMENT_TYPE_PROMPT,
+    MARITAL_PROMPT,
+    EDUCATION_PROMPT,
+    TREATMENT_NAME_PROMPT,
+    EMAIL_PROMPT,
+    ORGANIZATION_NAME_PROMPT,
+    BUSINESS_NAME_PROMPT,
+    WORKPLACE_PINCODE_PROMPT,
+    BUSINESS_PINCODE_PROMPT,
+)
 from cpapp.services.helper import Helper
 from cpapp.services.url_shortener import shorten_url
 from cpapp.services.ocr_service import extract_aadhaar_details
 
 logger = logging.getLogger(__name__)
 logger.addHandler(logging.StreamHandler())
-logger.setLevel(logging.DEBUG)
+# Raise to INFO or above in production to skip serializing full API payloads for debug logs
+logger.setLevel(os.environ.get("AGENT_LOG_LEVEL", "DEBUG").upper())
 
 logger_session = logging.getLogger('session_management')
 logger_session.addHandler(logging.StreamHandler())
 logger_session.setLevel(logging.DEBUG)
 
+# Education level aliases (lowercase) mapped to the API format
+_EDU_MAP: Dict[str, str] = {
+    # Number mappings
+    "1": "LESS THAN 10TH",
+    "2": "PASSED 10TH",
+    "3": "PASSED 12TH",
+    "4": "DIPLOMA",
+    "5": "GRADUATION",
+    "6": "POST GRADUATION",
+    "7": "P.H.D.",
+
+    # Text mappings
+    "less than 10th": "LESS THAN 10TH",
+    "less than 10": "LESS THAN 10TH",
+    "below 10th": "LESS THAN 10TH",
+    "below 10": "LESS THAN 10TH",
+    "under 10th": "LESS THAN 10TH",
+    "under 10": "LESS THAN 10TH",
+
+    "passed 10th": "PASSED 10TH",
+    "10th": "PASSED 10TH",
+    "10th standard": "PASSED 10TH",
+    "sslc": "PASSED 10TH",
+
+    "passed 12th": "PASSED 12TH",
+    "12th": "PASSED 12TH",
+    "12th standard": "PASSED 12TH",
+    "hsc": "PASSED 12TH",
+    "higher secondary": "PASSED 12TH",
+
+    "diploma": "DIPLOMA",
+    "diploma course": "DIPLOMA",
+
+    "graduation": "GRADUATION",
+    "graduate": "GRADUATION",
+    "bachelor": "GRADUATION",
+    "bachelor's": "GRADUATION",
+    "bachelors": "GRADUATION",
+    "b.tech": "GRADUATION",
+    "b.e": "GRADUATION",
+    "b.com": "GRADUATION",
+    "b.sc": "GRADUATION",
+    "b.a": "GRADUATION",
+    "b.b.a": "GRADUATION",
+    "b.c.a": "GRADUATION",
+
+    "post graduation": "POST GRADUATION",
+    "post graduate": "POST GRADUATION",
+    "postgraduate": "POST GRADUATION",
+    "master": "POST GRADUATION",
+    "master's": "POST GRADUATION",
+    "masters": "POST GRADUATION",
+    "m.tech": "POST GRADUATION",
+    "m.e": "POST GRADUATION",
+    "m.com": "POST GRADUATION",
+    "m.sc": "POST GRADUATION",
+    "m.a": "POST GRADUATION",
+    "m.b.a": "POST GRADUATION",
+    "m.c.a": "POST GRADUATION",
+
+    "p.h.d": "P.H.D.",
+    "phd": "P.H.D.",
+    "doctorate": "P.H.D.",
+    "doctor of philosophy": "P.H.D.",
+    "ph.d": "P.H.D.",
+    "ph.d.": "P.H.D.",
+}
+
+# Education levels already in the API format
+_EDU_CANONICAL = frozenset((
+    "LESS THAN 10TH", "PASSED 10TH", "PASSED 12TH", "DIPLOMA",
+    "GRADUATION", "POST GRADUATION", "P.H.D.",
+))
+
+# Canonical values (by lowercase) and aliases resolved with a single lookup
+_EDU_UNIFIED: Dict[str, str] = {**{c.lower(): c for c in _EDU_CANONICAL}, **_EDU_MAP}
+
+
+def _trie_regex(words) -> str:
+    """
+    Build a regex pattern matching any of the given words, compressed into a
+    trie so shared prefixes are only tested once
+
+    Args:
+        words: Iterable of literal strings
+
+    Returns:
+        Regex pattern string (longest alternative wins at a given position)
+    """
+    trie: Dict[str, Any] = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def to_pattern(node: Dict[str, Any]) -> str:
+        alternatives = [re.escape(ch) + to_pattern(child) for ch, child in sorted(node.items()) if ch]
+        if not alternatives:
+            return ""
+        pattern = alternatives[0] if len(alternatives) == 1 else "(?:" + "|".join(alternatives) + ")"
+        if "" in node:
+            pattern = "(?:" + pattern + ")?"
+        return pattern
+
+    return to_pattern(trie)
+
+
+# Single-pass partial matcher over all education aliases
+_EDU_RE = re.compile(_trie_regex(_EDU_MAP))
+
+# Input validation patterns (use with fullmatch)
+_EMAIL_RE = re.compile(r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}')
+_PAN_RE = re.compile(r'[A-Z]{5}[0-9]{4}[A-Z]')
+# ASCII digits only: \d and str.isdigit also accept other scripts' digits and superscripts
+_PINCODE_RE = re.compile(r'[0-9]{6}')
+_NON_DIGIT_RE = re.compile(r'[^0-9]+')
+
+# Explicitly labelled treatment cost in a user message, e.g. "treatment cost: ₹2,500".
+# A bare "cost 6" (as in "no cost 6 month EMI") is not a treatment cost, and amounts
+# followed by a unit (k, lakh, ...) are left to the LLM.
+_COST_RE = re.compile(
+    r'(?<!no[\s-])\btreatment\s+cost\s*(?:is|:|=|-)?\s*(?:rs\.?|inr|₹)?\s*(\d[\d,]*(?:\.\d+)?)'
+    r'(?![\d,.]|\s*(?:k|l|lakh|lakhs|lac|lacs|thousand|cr|crore)\b)',
+    re.IGNORECASE,
+)
+
+
+def _json_dumps(obj: Any) -> str:
+    """
+    Serialize obj to a JSON string with orjson, falling back to the json module
+    for values orjson rejects (e.g. non-string dict keys).
+    """
+    try:
+        return orjson.dumps(obj).decode()
+    except TypeError:
+        return json.dumps(obj)
+
+
+def _api_response_json(result: Any) -> str:
+    """
+    Serialize a response from the API client that is being returned unchanged,
+    reusing the upstream body when the client kept it (see APIResponse).
+    """
+    raw = getattr(result, "raw", None)
+    if raw is not None:
+        return raw.decode()
+    return _json_dumps(result)
+
+
+def _validate_id(value: Any) -> Optional[str]:
+    """
+    Check an identifier (loan ID, user ID) read from the session in one pass.
+    
+    Returns:
+        None if value is a non-blank string, otherwise a short reason to log
+    """
+    if not isinstance(value, str):
+        return "missing" if not value else f"not a string ({type(value).__name__})"
+    return None if value.strip() else "blank"
+
+
+def _dig(node: Any, *keys: str, default: Any = None) -> Any:
+    """
+    Follow keys through nested dicts without building empty dicts for missing levels.
+    
+    Returns:
+        The value at the end of the path, or default if any level is missing,
+        None or not a dict
+    """
+    for key in keys:
+        if not isinstance(node, dict):
+            return default
+        node = node.get(key)
+        if node is None:
+            return default
+    return node
+
+
+# Bounded repr for log arguments: nested containers and long strings are elided
+# while the repr is built, so a large response never gets rendered in full
+_LOG_REPR = reprlib.Repr()
+_LOG_REPR.maxlevel = 3
+_LOG_REPR.maxdict = 12
+_LOG_REPR.maxlist = 4
+_LOG_REPR.maxstring = 80
+_LOG_REPR.maxother = 80
+
+
+def _short(obj: Any, n: int = 256) -> str:
+    """
+    Render obj for a log line, cut to at most n characters.
+    
+    Args:
+        obj: Value to log (typically an API response or payload dict)
+        n: Maximum length of the rendered text
+    """
+    s = _LOG_REPR.repr(obj)
+    return s if len(s) <= n else s[:n] + "…"
+
+
+def _pincode_log_fields(pincode_data: Any) -> Tuple[Any, Any, Any]:
+    """status, city and state of a state_and_city_by_pincode response, for logging"""
+    if not isinstance(pincode_data, dict):
+        return None, None, None
+    return pincode_data.get("status"), pincode_data.get("city"), pincode_data.get("state")
+
+
+# Fixed error responses returned by the tools, serialized once
+_ERR_LOAN_ID_REQUIRED: Final[str] = _json_dumps({"status": 400, "error": "Loan ID is required"})
+_ERR_PAN_USER_ID_REQUIRED: Final[str] = _json_dumps({"status": 400, "error": "User ID is required for PAN verification"})
+_ERR_PREFILL_FAILED: Final[str] = _json_dumps({
+    "status": 500,
+    "error": "phoneToPrefill_failed",
+    "message": "Follow workflow B. Please provide 6-digit pincode of Patient's Current address: ",
+    "requires_pincode_collection": True
+})
+_ERR_PREFILL_EMPTY: Final[str] = _json_dumps({
+    "status": 500,
+    "error": "phoneToPrefill_empty_data",
+    "message": "Follow workflow B. Please provide 6-digit pincode of Patient's Current address:",
+    "requires_pincode_collection": True
+})
+_ERR_SESSION_NOT_FOUND: Final[str] = _json_dumps({"status": "error", "message": "Session not found"})
+_ERR_PHONE_REQUIRED: Final[str] = _json_dumps({"status": "error", "failed_step": "get_user_id_from_phone_number", "message": "Phone number is required"})
+_ERR_NO_PROFILE_DETAILS: Final[str] = _json_dumps({"status": "error", "message": "No profile details provided"})
+
+
+# Where the employment verification responseBody keeps the current employer's name
+_ESTABLISHMENT_NAME_PATH = ("result", "result", "summary", "recentEmployerData", "establishmentName")
+
+
+def _employer_establishment_name(session_data: Dict[str, Any], response_body: Any) -> Optional[str]:
+    """
+    Return the employer name from an employment verification responseBody, using
+    the value get_employment_verification extracted at fetch time when stored.
+    
+    Args:
+        session_data: Session data dict
+        response_body: responseBody of the stored verification (JSON string or dict)
+        
+    Returns:
+        establishmentName, or None if absent or unreadable
+    """
+    if "employment_establishment_name" in session_data:
+        return session_data["employment_establishment_name"]
+    try:
+        node = orjson.loads(response_body) if isinstance(response_body, (str, bytes)) else response_body
+        for key in _ESTABLISHMENT_NAME_PATH[:-1]:
+            node = node.get(key, {})
+        return node.get(_ESTABLISHMENT_NAME_PATH[-1]) or None
+    except Exception as parse_exc:
+        logger.warning(f"Could not parse establishmentName from employment_verification: {parse_exc}")
+        return None
+
+
+def _replayable_response(data: Dict[str, Any], api_name: str) -> Optional[Dict[str, Any]]:
+    """
+    Return the stored successful response for api_name if it was saved within
+    _API_REPLAY_TTL seconds, else None.
+    
+    Args:
+        data: Session data dict
+        api_name: Key under data.api_responses
+    """
+    response = _dig(data, "api_responses", api_name)
+    if not isinstance(response, dict) or response.get("status") != 200:
+        return None
+    stored_at = _dig(data, "api_response_times", api_name)
+    if not stored_at or time.time() - stored_at > _API_REPLAY_TTL:
+        return None
+    return response
+
+
+def _input_hash(payload: Any) -> str:
+    """Short digest of a request payload, stored with a save's response to detect a repeat"""
+    return hashlib.blake2b(orjson.dumps(payload, option=orjson.OPT_SORT_KEYS), digest_size=8).hexdigest()
+
+
+def _replayable_save(data: Dict[str, Any], api_name: str, input_hash: str) -> Optional[Dict[str, Any]]:
+    """
+    Return the stored successful response for a save made with the same input
+    within _API_REPLAY_TTL seconds, else None. Repeating such a save (an LLM
+    retrying a tool) would not change anything upstream.
+    
+    Args:
+        data: Session data dict
+        api_name: Key under data.api_responses
+        input_hash: _input_hash of the payload about to be sent
+    """
+    if _dig(data, "api_input_hashes", api_name) != input_hash:
+        return None
+    return _replayable_response(data, api_name)
+
+
+def _bureau_reply_input_hash(data: Dict[str, Any]) -> str:
+    """
+    _input_hash of the session fields the formatted bureau decision reply is built
+    from besides the decision itself (patient name, treatment cost and doctor)
+    
+    Args:
+        data: Session data dict
+    """
+    return _input_hash([
+        data.get("treatmentCost"),
+        data.get("name") or data.get("fullName"),
+        data.get("doctorId") or data.get("doctor_id"),
+    ])
+
+
+# userId value in a raw JSON response body
+_USERID_RE = re.compile(r'"userId"\s*:\s*"([^"]+)"')
+
+# Rupee sign, thousands separators and spaces removed before parsing an amount
+_AMOUNT_STRIP = str.maketrans("", "", "₹, ")
+
+# Typed argument schemas for the structured tools, so the model gets field
+# types in the function definitions instead of untyped lambda parameters
+class InitialUserData(BaseModel):
+    fullName: str = Field(description="Patient's full name")
+    phoneNumber: str = Field(description="Patient's 10 digit phone number")
+    treatmentCost: int = Field(description="Treatment cost in rupees")
+    monthlyIncome: int = Field(description="Patient's monthly income in rupees")
+
+
+class LoanDetailsInput(BaseModel):
+    fullName: str = Field(description="Patient's full name")
+    treatmentCost: int = Field(description="Treatment cost in rupees")
+    userId: str = Field(description="User ID returned by get_user_id_from_phone_number")
+
+
+class PincodeInput(BaseModel):
+    pincode: str = Field(description="6-digit pincode of the patient's current address")
+
+
+class ProfileDetailsInput(BaseModel):
+    gender: Optional[str] = Field(default=None, description="Patient's gender, e.g. 'Male', 'Female', '1' or '2'")
+    marital_status: Optional[str] = Field(default=None, description="Patient's marital status, e.g. 'Married', 'Unmarried/Single', '1' or '2'")
+    education_level: Optional[str] = Field(default=None, description="Patient's education level, e.g. 'Graduation', 'Passed 12th' or a number 1-7")
+
+
+class RepeatedToolCallError(Exception):
+    """Raised to stop an agent turn that calls the same tool twice in a row with identical input"""
+
+
+class RepeatedToolCallGuard(BaseCallbackHandler):
+    """
+    Callback for one agent turn that stops the executor loop when the model calls
+    the same tool with identical input twice in a row
+    """
+    # Exceptions from callbacks are only logged unless the handler asks to raise them
+    raise_error = True
+
+    def __init__(self) -> None:
+        self._last_call: Optional[Tuple[str, Any]] = None
+
+    def on_agent_action(self, action: AgentAction, **kwargs: Any) -> Any:
+        call = (action.tool, action.tool_input)
+        if call == self._last_call:
+            raise RepeatedToolCallError(f"{action.tool} called twice in a row with the same input")
+        self._last_call = call
+
+
+# Tools whose output may be the final bureau decision message
+_BUREAU_DECISION_TOOLS = frozenset(("get_bureau_decision", "run_post_prefill_chain"))
+
+# Session statuses whose replies are scripted, mapped to the CarepayAgent method
+# that handles them. Messages in these statuses never reach the agent executor.
+_STATUS_HANDLERS = {
+    "collecting_additional_details": "_handle_additional_details_collection",
+    "additional_details_completed": "_handle_post_approval_address_details",
+    "post_approval_address_details": "_handle_address_details_completion",
+    "kyc_completed": "_handle_kyc_completed_status",
+    "loan_disbursal_ready": "_handle_loan_disbursal_ready_status",
+}
+
+# Exact answers to the employment type question
+_EMPLOYMENT_TYPE_OPTIONS: Final[Mapping[str, str]] = MappingProxyType({
+    "1": "SALARIED",
+    "salaried": "SALARIED",
+    "2": "SELF_EMPLOYED",
+    "self_employed": "SELF_EMPLOYED",
+    "self employed": "SELF_EMPLOYED",
+    "self-employed": "SELF_EMPLOYED",
+})
+# Keywords that pick an employment type inside a longer reply, found in one scan
+_EMPLOYMENT_TYPE_KEYWORDS_RE = re.compile(r"1|2|salaried|self|employed")
+
+# Keywords used to spot milestones in lowercased user messages for the conversation summary
+_INITIAL_DATA_KEYWORDS_RE = re.compile(r"name:|phone:|cost:|income:")
+_EMPLOYMENT_ANSWER_KEYWORDS_RE = re.compile(r"1|2|salaried|self-employed")
+
+# Markers of the employment type and limit options prompts, in the order they appear
+_EMPLOYMENT_PROMPT_RE = re.compile(
+    r"Patient's employment type:.*1\. SALARIED.*2\. SELF_EMPLOYED.*Please Enter input 1 or 2 only",
+    re.DOTALL,
+)
+_LIMIT_OPTIONS_RE = re.compile(r"Continue with this limit.*Continue with limit enhancement", re.DOTALL)
+
+
+def _coerce_prefill_scalar(value: Any) -> Optional[str]:
+    """Stringify a scalar prefill value; None, dicts and lists yield None"""
+    if value is None or isinstance(value, (dict, list)):
+        return None
+    return str(value)
+
+
+def _coerce_prefill_email(value: Any) -> Optional[str]:
+    """Read an email given as a string, a {"email": ...} dict or a list of either"""
+    if isinstance(value, list):
+        if not value:
+            return None
+        value = value[0]
+        if not (isinstance(value, dict) and value.get("email") is not None):
+            return str(value)
+    if isinstance(value, dict):
+        value = value.get("email")
+        return None if value is None else str(value)
+    if isinstance(value, str) and value.strip():
+        return value
+    return None
+
+
+def _coerce_prefill_email_field(value: Any) -> Optional[str]:
+    """emailId value: a scalar as given, otherwise the first email of a list or dict"""
+    scalar = _coerce_prefill_scalar(value)
+    return scalar if scalar is not None else _coerce_prefill_email(value)
+
+
+# Coercion per save_basic_details field; fields not listed take scalars only
+_PREFILL_COERCERS: Final[Mapping[str, Callable[[Any], Optional[str]]]] = MappingProxyType({
+    "emailId": _coerce_prefill_email_field,
+})
+
+
+def _extract_prefill_fields(candidates: Sequence[Mapping[str, Any]], data: Dict[str, Any]) -> None:
+    """
+    Copy the save_basic_details fields phoneToPrefill response objects provide into
+    data in one pass, leaving fields data already holds untouched
+    
+    Args:
+        candidates: Response objects in priority order (the top level, then its nested "response")
+        data: Payload being built, updated in place
+    """
+    # Only keys present in both are visited; per target the earliest candidate wins,
+    # then the highest-priority source within it
+    best_sources = {}
+    for depth, candidate in enumerate(candidates):
+        for source_field in candidate.keys() & _PREFILL_SOURCE_TO_TARGET.keys():
+            target_field, rank = _PREFILL_SOURCE_TO_TARGET[source_field]
+            if target_field in data:
+                continue
+            value = _PREFILL_COERCERS.get(target_field, _coerce_prefill_scalar)(candidate[source_field])
+            if value is None:
+                continue
+            priority = (depth, rank)
+            if target_field not in best_sources or priority < best_sources[target_field][0]:
+                best_sources[target_field] = (priority, value)
+    for target_field, (_, value) in best_sources.items():
+        data[target_field] = value
+
+
+# Exceptions that mean a prefill response is not in the common shape a fast path expects
+_SHAPE_MISS = (KeyError, IndexError, TypeError, AttributeError)
+
+# Fast path hits/misses per extractor, to notice when the prefill response shape drifts
+_prefill_fast_path_counts: Counter = Counter()
+_prefill_fast_path_lock = threading.Lock()
+
+
+def _count_fast_path(name: str, hit: bool) -> None:
+    """Record a fast path hit or miss for the named extractor"""
+    with _prefill_fast_path_lock:
+        _prefill_fast_path_counts[(name, hit)] += 1
+
+
+def _fast_extract_basic(prefill_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    _extract_basic_fields for the common phoneToPrefill shape: string pan, gender
+    and dob, an email string or list of {"email": ...}, and no nested "response"
+    
+    Raises:
+        One of _SHAPE_MISS when prefill_data is not in that shape
+    """
+    pan = prefill_data["pan"]
+    gender = prefill_data["gender"]
+    dob = prefill_data["dob"]
+    email = prefill_data["email"]
+    if type(email) is list:
+        email = email[0]["email"]
+    if "response" in prefill_data or not (type(pan) is type(gender) is type(dob) is type(email) is str):
+        raise TypeError("not the common prefill shape")
+    return {"panCard": pan, "gender": gender, "dateOfBirth": dob, "emailId": email}
+
+
+def _extract_basic_fields(prefill_data: Any) -> Dict[str, Any]:
+    """
+    Read the save_basic_details fields a phoneToPrefill response provides, from its
+    top level first and then its nested "response"
+    
+    Args:
+        prefill_data: Stored phoneToPrefill response
+        
+    Returns:
+        Dict of save_basic_details fields; empty if prefill_data is not a dict
+    """
+    fields: Dict[str, Any] = {}
+    if not isinstance(prefill_data, dict):
+        return fields
+    try:
+        fields = _fast_extract_basic(prefill_data)
+    except _SHAPE_MISS:
+        _count_fast_path("basic_fields", False)
+    else:
+        _count_fast_path("basic_fields", True)
+        return fields
+    response = prefill_data.get("response")
+    if not isinstance(response, dict):
+        _extract_prefill_fields((prefill_data,), fields)
+        return fields
+    _extract_prefill_fields((prefill_data, response), fields)
+    # The phone number is only read from the nested response
+    if response.get("mobile") is not None:
+        fields["mobileNumber"] = response["mobile"]
+    return fields
+
+
+def _prefill_details_payload(user_id: str, session_data: Dict[str, Any]) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+    """
+    Build the save_prefill_details payload from the session's name and phone and the
+    fields the stored phoneToPrefill response provides
+    
+    Args:
+        user_id: User identifier
+        session_data: Session data dict
+        
+    Returns:
+        Tuple of (payload, data.derived.basic_fields entry to store, or None)
+    """
+    basic_fields, derived_entry = _derived_from_prefill(session_data, "basic_fields", _extract_basic_fields)
+    data = {"userId": user_id, "formStatus": "Basic"}
+
+    # Get name and phone from session if available
+    if "name" in session_data and session_data["name"] is not None:
+        data["firstName"] = session_data["name"]
+    elif "fullName" in session_data and session_data["fullName"] is not None:
+        data["firstName"] = session_data["fullName"]
+
+    if "phone" in session_data and session_data["phone"] is not None:
+        data["mobileNumber"] = session_data["phone"]
+    elif "phoneNumber" in session_data and session_data["phoneNumber"] is not None:
+        data["mobileNumber"] = session_data["phoneNumber"]
+    elif "mobileNumber" in session_data and session_data["mobileNumber"] is not None:
+        data["mobileNumber"] = session_data["mobileNumber"]
+
+    # Add the prefill fields; name and phone from the session take precedence
+    for field, value in basic_fields.items():
+        data.setdefault(field, value)
+    return data, derived_entry
+
+
+# States and the 3-digit pincode prefixes they cover, in lookup priority order
+_PINCODE_STATE_MAP: Final[Tuple[Tuple[str, Tuple[str, ...]], ...]] = (
+    ("Andaman & Nicobar Islands", ("744",)),
+    ("Andhra Pradesh", tuple(str(i) for i in range(500, 536))),
+    ("Arunachal Pradesh", tuple(str(i) for i in range(790, 793))),
+    ("Assam", tuple(str(i) for i in range(781, 789))),
+    ("Bihar", tuple(str(i) for i in range(800, 856))),
+    ("Chhattisgarh", tuple(str(i) for i in range(490, 498))),
+    ("Chandigarh", ("160",)),
+    ("Daman & Diu", ("362", "396")),
+    ("Delhi", ("110",)),
+    ("Dadra & Nagar Haveli", ("396",)),
+    ("Goa", ("403",)),
+    ("Gujarat", tuple(str(i) for i in range(360, 397))),
+    ("Himachal Pradesh", tuple(str(i) for i in range(171, 178))),
+    ("Haryana", tuple(str(i) for i in range(121, 137))),
+    ("Jharkhand", tuple(str(i) for i in range(813, 836))),
+    ("Jammu & Kashmir", tuple(str(i) for i in range(180, 195))),
+    ("Karnataka", tuple(str(i) for i in range(560, 592))),
+    ("Kerala", tuple(str(i) for i in range(670, 696))),
+    ("Lakshadweep", ("682",)),
+    ("Maharashtra", tuple(str(i) for i in range(400, 446))),
+    ("Meghalaya", tuple(str(i) for i in range(793, 795))),
+    ("Manipur", ("795",)),
+    ("Madhya Pradesh", tuple(str(i) for i in range(450, 489))),
+    ("Mizoram", ("796",)),
+    ("Nagaland", ("797", "798")),
+    ("Odisha", tuple(str(i) for i in range(751, 771))),
+    ("Punjab", tuple(str(i) for i in range(140, 161))),
+    ("Pondicherry/Puducherry", ("533", "605", "607", "609")),
+    ("Rajasthan", tuple(str(i) for i in range(301, 346))),
+    ("Sikkim", ("737",)),
+    ("Telangana", tuple(str(i) for i in range(500, 510))),
+    ("Tamil Nadu", tuple(str(i) for i in range(600, 644))),
+    ("Tripura", ("799",)),
+    ("Uttarakhand", tuple(str(i) for i in range(244, 264))),
+    ("Uttar Pradesh", tuple(str(i) for i in range(201, 286))),
+    ("West Bengal", tuple(str(i) for i in range(700, 744))),
+)
+# Pincode prefix -> state; the first state listing a prefix wins, as in a linear scan
+_PINCODE_PREFIX_TO_STATE: Final[Mapping[str, str]] = MappingProxyType({
+    prefix: state_name
+    for state_name, prefixes in reversed(_PINCODE_STATE_MAP)
+    for prefix in prefixes
+})
+
+# State codes used in prefill addresses -> state names
+_STATE_CODE_TO_NAME: Final[Mapping[str, str]] = MappingProxyType({
+    "AN": "Andaman & Nicobar Islands",
+    "AP": "Andhra Pradesh",
+    "AR": "Arunachal Pradesh",
+    "AS": "Assam",
+    "BR": "Bihar",
+    "CG": "Chhattisgarh",
+    "CT": "Chhattisgarh",
+    "CH": "Chandigarh",
+    "DD": "Daman & Diu",
+    "DL": "Delhi",
+    "DN": "Dadra & Nagar Haveli",
+    "GA": "Goa",
+    "GJ": "Gujarat",
+    "HP": "Himachal Pradesh",
+    "HR": "Haryana",
+    "JH": "Jharkhand",
+    "JK": "Jammu & Kashmir",
+    "KA": "Karnataka",
+    "KL": "Kerala",
+    "LD": "Lakshadweep",
+    "MH": "Maharashtra",
+    "ML": "Meghalaya",
+    "MN": "Manipur",
+    "MP": "Madhya Pradesh",
+    "MZ": "Mizoram",
+    "NL": "Nagaland",
+    "OR": "Odisha",
+    "PB": "Punjab",
+    "PY": "Pondicherry/Puducherry",
+    "RJ": "Rajasthan",
+    "SK": "Sikkim",
+    "TG": "Telangana",
+    "TS": "Telangana",
+    "TN": "Tamil Nadu",
+    "TR": "Tripura",
+    "UL": "Uttarakhand",
+    "UP": "Uttar Pradesh",
+    "WB": "West Bengal",
+})
+
+
+def _state_from_pincode(pincode: str) -> Optional[str]:
+    """State for a pincode from its 3-digit prefix, or None if the prefix is unknown"""
+    if not pincode or len(pincode) < 3:
+        return None
+    return _PINCODE_PREFIX_TO_STATE.get(pincode[:3])
+
+
+def _is_valid_pincode(pincode: Any) -> bool:
+    """Check if a string is a valid 6-digit pincode"""
+    if not pincode:
+        return False
+    # Clean the pincode string
+    return _PINCODE_RE.fullmatch(_NON_DIGIT_RE.sub('', str(pincode))) is not None
+
+
+def _extract_pincode_from_postal(postal: Any) -> Optional[str]:
+    """Extract valid pincode from postal field"""
+    if not postal:
+        return None
+    # Clean the postal string and extract digits; with more than 6, use the first 6
+    clean_postal = _NON_DIGIT_RE.sub('', str(postal))
+    return clean_postal[:6] if len(clean_postal) >= 6 else None
+
+
+def _city_from_address(address: str) -> Optional[str]:
+    """Last word of an address in title case, the city fallback when the pincode API has none"""
+    words = address.rsplit(None, 1)
+    return words[-1].title() if words else None
+
+
+# phoneToPrefill address Types (lowercased) preferred as the address to save
+_PRIMARY_TYPES: Final[frozenset] = frozenset({"primary", "permanent"})
+
+
+def _fast_extract_address(address_list: List[Any]) -> Dict[str, str]:
+    """
+    _extract_address_fields for the common phoneToPrefill shape, where the first
+    address is the Primary or Permanent one and its Postal is the bare 6-digit pincode
+    
+    Raises:
+        One of _SHAPE_MISS when address_list is not in that shape
+    """
+    addr = address_list[0]
+    postal = addr["Postal"]
+    if addr["Type"].lower() not in _PRIMARY_TYPES or type(postal) is not str or not _PINCODE_RE.fullmatch(postal):
+        raise TypeError("not the common prefill address shape")
+    return {"address": addr["Address"], "pincode": postal, "state": addr["State"]}
+
+
+def _extract_address_fields(prefill_data: Any) -> Optional[Dict[str, str]]:
+    """
+    Pick the address to save from a phoneToPrefill response: a Primary or Permanent
+    address with a valid pincode, else any address with one, else the first address
+    
+    Args:
+        prefill_data: Stored phoneToPrefill response
+        
+    Returns:
+        Dict with address, pincode ("" when none is valid) and state as given by
+        the prefill data; empty if the address list is empty, None if there is none
+    """
+    if not (isinstance(prefill_data, dict) and isinstance(prefill_data.get("address"), list)):
+        return None
+    address_list = prefill_data["address"]
+    try:
+        fields = _fast_extract_address(address_list)
+    except _SHAPE_MISS:
+        _count_fast_path("address_fields", False)
+    else:
+        _count_fast_path("address_fields", True)
+        return fields
+    primary_address = None
+    valid_pincode = None
+
+    # First, try to find address with Type "Primary" or "Permanent"
+    for addr in address_list:
+        if addr.get("Type", "").lower() in _PRIMARY_TYPES:
+            primary_address = addr
+            # Check if this address has a valid pincode
+            extracted_pincode = _extract_pincode_from_postal(addr.get("Postal", ""))
+            if _is_valid_pincode(extracted_pincode):
+                valid_pincode = extracted_pincode
+                break
+
+    # If no primary address with valid pincode found, search all addresses for valid pincode
+    if not valid_pincode:
+        for addr in address_list:
+            extracted_pincode = _extract_pincode_from_postal(addr.get("Postal", ""))
+            if _is_valid_pincode(extracted_pincode):
+                primary_address = addr
+                valid_pincode = extracted_pincode
+                break
+
+    # If still no valid pincode found, use the first address in the list
+    if not primary_address and address_list:
+        primary_address = address_list[0]
+    if not primary_address:
+        return {}
+
+    # Use the valid pincode we found, or try to extract from the chosen address
+    if not valid_pincode:
+        valid_pincode = _extract_pincode_from_postal(primary_address.get("Postal", "")) or ""
+    return {
+        "address": primary_address.get("Address", ""),
+        "pincode": valid_pincode,
+        "state": primary_address.get("State", ""),
+    }
+
+
+def _stored_prefill_response(session_data: Dict[str, Any]) -> Tuple[Any, Optional[float]]:
+    """
+    Return the phoneToPrefill response stored in session data with the time it was
+    fetched, falling back to prefill_api_response (which has no fetch time)
+    
+    Args:
+        session_data: Session data dict
+        
+    Returns:
+        Tuple of (prefill response or {}, get_prefill_data fetch time or None)
+    """
+    prefill_data = _dig(session_data, "api_responses", "get_prefill_data", "data", "response")
+    if prefill_data:
+        return prefill_data, _dig(session_data, "api_response_times", "get_prefill_data")
+    return session_data.get("prefill_api_response") or {}, None
+
+
+def _derived_from_prefill(
+    session_data: Dict[str, Any],
+    name: str,
+    extract: Callable[[Any], Any],
+) -> Tuple[Any, Optional[Dict[str, Any]]]:
+    """
+    Run extract over the stored phoneToPrefill response, reusing the result memoized
+    under data.derived.<name> while it belongs to the same get_prefill_data fetch
+    
+    Args:
+        session_data: Session data dict
+        name: Key under data.derived
+        extract: Pure function of the prefill response
+        
+    Returns:
+        Tuple of (extracted value, entry for the caller to store at data.derived.<name>,
+        or None when the memoized value was used or there is no fetch time to key it by)
+    """
+    prefill_data, fetched_at = _stored_prefill_response(session_data)
+    if fetched_at is not None:
+        entry = _dig(session_data, "derived", name)
+        if isinstance(entry, dict) and entry.get("prefill_fetched_at") == fetched_at:
+            return entry.get("value"), None
+    value = extract(prefill_data)
+    if fetched_at is None:
+        return value, None
+    return value, {"prefill_fetched_at": fetched_at, "value": value}
+
+
+def _is_employment_type_prompt(text: str) -> bool:
+    """Return True if text contains the employment type question."""
+    return _EMPLOYMENT_PROMPT_RE.search(text) is not None
+
+
+def _is_limit_options_prompt(text: str) -> bool:
+    """Return True if text contains the limit options question."""
+    return (
+        _LIMIT_OPTIONS_RE.search(text) is not None
+        and "1." in text
+        and "2." in text
+    )
+
+
+# Messages of stored history sent to the LLM each turn; the full history stays in the DB
+_MAX_CHAT_HISTORY = 12
+
+# save_basic_details API fields and the session data keys they can be read from, in priority order
+_BASIC_FIELD_MAPPINGS: Final[Mapping[str, Tuple[str, ...]]] = MappingProxyType({
+    "panCard": ("panCard", "pan", "panNo", "panNumber", "pan_card", "pan_number"),
+    "gender": ("gender", "sex"),
+    "dateOfBirth": ("dateOfBirth", "dob", "birthDate", "birth_date", "date_of_birth"),
+    "emailId": ("emailId", "email", "email_id", "emailAddress", "email_address"),
+    "firstName": ("firstName", "name", "first_name", "fullName", "full_name", "givenName", "given_name"),
+    "treatmentCost": ("treatmentCost", "treatment_cost", "loanAmount", "loan_amount", "amount"),
+    "monthlyIncome": ("monthlyIncome", "monthly_income", "income", "salary", "netTakeHomeSalary", "net_take_home_salary"),
+})
+# Session data key -> (API field, priority among that field's sources)
+_BASIC_SOURCE_TO_TARGET: Final[Mapping[str, Tuple[str, int]]] = MappingProxyType({
+    source: (target, rank)
+    for target, sources in _BASIC_FIELD_MAPPINGS.items()
+    for rank, source in enumerate(sources)
+})
+
+# save_basic_details API fields read from the phoneToPrefill response
+_PREFILL_FIELD_MAPPINGS: Final[Mapping[str, Tuple[str, ...]]] = MappingProxyType({
+    "panCard": ("pan",),
+    "gender": ("gender",),
+    "dateOfBirth": ("dob",),
+    "emailId": ("email",),
+})
+# phoneToPrefill response key -> (API field, priority among that field's sources)
+_PREFILL_SOURCE_TO_TARGET: Final[Mapping[str, Tuple[str, int]]] = MappingProxyType({
+    source: (target, rank)
+    for target, sources in _PREFILL_FIELD_MAPPINGS.items()
+    for rank, source in enumerate(sources)
+})
+
+# Education qualification options as numbered in EDUCATION_PROMPT
+_EDUCATION_OPTIONS: Final[Mapping[str, str]] = MappingProxyType({
+    "1": "Less than 10th",
+    "2": "Passed 10th",
+    "3": "Passed 12th",
+    "4": "Diploma",
+    "5": "Graduation",
+    "6": "Post graduation",
+    "7": "P.H.D",
+})
+
+# Additional-details answers mapped to the basic details API values
+# Keywords that pick an education option inside a longer reply, found in one scan.
+# "post graduation" is listed before "post" and "graduation" so it matches as one keyword.
+_EDUCATION_KEYWORDS_RE = re.compile(r"post ?graduation|post|graduation|less|10th|12th|diploma|phd|p\.h\.d")
+
+_MARITAL_STATUS_API_VALUES: Final[Mapping[str, str]] = MappingProxyType({"1": "Yes", "2": "No"})
+_EDUCATION_LEVEL_API_VALUES: Final[Mapping[str, str]] = MappingProxyType({
+    "1": "LESS THAN 10TH",
+    "2": "PASSED 10TH",
+    "3": "PASSED 12TH",
+    "4": "DIPLOMA",
+    "5": "GRADUATION",
+    "6": "POST GRADUATION",
+    "7": "P.H.D.",
+})
+
+# EMI plan fields kept as strings in stored bureau decisions
+_EMI_PLAN_STRING_FIELDS = ("creditLimitCalculated", "emi", "downPayment", "netLoanAmount", "grossTreatmentAmount")
+
+
+def _normalize_emi_plans(bureau_result: Any) -> None:
+    """
+    Coerce the amount fields of every EMI plan in a bureau decision response to
+    strings, in place. Called once when the response arrives (and for responses
+    stored before that), so extract_bureau_decision_details can read plans as-is.
+    Safe to repeat.
+    """
+    data = bureau_result.get("data") if isinstance(bureau_result, dict) else None
+    if not isinstance(data, dict):
+        return
+    # Handle nested structure where actual data is in data.data
+    if isinstance(data.get("data"), dict):
+        data = data["data"]
+    plans = data.get("emiPlanList")
+    if not isinstance(plans, list):
+        plans = data.get("emiPlans")
+    if not isinstance(plans, list):
+        return
+    for plan in plans:
+        if not isinstance(plan, dict):
+            continue
+        for key in _EMI_PLAN_STRING_FIELDS:
+            value = plan.get(key)
+            if value is not None and not isinstance(value, str):
+                plan[key] = str(value)
+
+# Fallback reply when a bureau decision cannot be formatted; never cached
+_BUREAU_FORMAT_ERROR = "There was an error processing the loan decision. Please try again."
+
+# AgentExecutor's output when max_iterations or max_execution_time stops a turn
+# (the multi-action agents built by create_openai_tools_agent use the first)
+_AGENT_STOPPED_OUTPUTS = frozenset((
+    "Agent stopped due to max iterations.",
+    "Agent stopped due to iteration limit or time limit.",
+))
+# Reply sent instead when a turn is stopped by those limits or by RepeatedToolCallGuard
+_AGENT_RETRY_REPLY = "Sorry, I couldn't finish processing that just now. Please send your last message again."
+
+# Seconds a stored successful prefill / employment verification response is reused
+_API_REPLAY_TTL = 15 * 60
+
+# Cap on agent turns run concurrently through arun, to stay within LLM rate limits
+_ARUN_CONCURRENCY = int(os.environ.get("AGENT_MAX_CONCURRENT_RUNS", "8"))
+_arun_semaphore = asyncio.Semaphore(_ARUN_CONCURRENCY)
+
+# Shared pool for Aadhaar OCR calls; the worker count caps concurrent OCR requests
+_OCR_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="aadhaar-ocr")
+
+# Shared pool for upstream API calls started ahead of the chain step that consumes them
+_API_PREFETCH_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="api-prefetch")
+
+# Shared pool for independent upstream save calls a handler issues together
+_API_SAVE_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="api-save")
+
+# Marital status inputs mapped to the API values
+_MARRIED = frozenset(("married", "yes", "1", "marriage"))
+_UNMARRIED = frozenset(("unmarried", "single", "no", "2", "unmarried/single", "unmarried or single"))
+_MS_CANONICAL = frozenset(("Yes", "No"))
+# Word answers accepted for the "Unmarried/Single" option during additional details collection
+_UNMARRIED_OPTION_WORDS = frozenset(("unmarried", "single", "unmarried/single"))
+
+
+# Static system prompt. It is kept byte-identical across turns and placed first
+# in the message list so OpenAI can reuse the cached prefix; per-session context
+# is sent in a separate system message after it.
+_SYSTEM_PROMPT = """You are a healthcare loan application assistant for CarePay. Your role is to help users apply for loans for medical treatments in a professional and friendly manner.
+
+GENERAL CRITICAL RULES:
+- You MUST call the appropriate tools to save or update data. Do NOT generate success messages without calling the tools first. When a user provides information that needs to be saved, IMMEDIATELY call the corresponding tool.
+- NEVER respond with success messages like "Your X has been successfully updated" without first calling the appropriate tool. Use the tool's response to inform the user.
+- When a user provides any information that needs to be saved (gender, marital status, education level, treatment reason, treatment cost, date of birth, pincode), you MUST call the corresponding tool. Do NOT generate any response until you have called the tool.
+- When a user provides a treatment reason (e.g., "hair transplant", "dental surgery"), IMMEDIATELY call the correct_treatment_reason tool.
+- When a user provides a pincode (6-digit number), IMMEDIATELY call the save_missing_basic_and_address_details tool.
+- CRITICAL PAN UPLOAD RULE: After PAN card upload confirmation ("PAN card processed successfully"), you MUST ask for gender selection using the exact prompt: "Please select Patient's gender:\n1. Male\n2. Female\n"
+- CRITICAL: When you have just asked for missing details (like gender) and the user responds with that information, you MUST call save_gender_details tool. After calling save_gender_details, proceed directly to pan_verification, employment_verification, save_employment_details, and get_bureau_decision tools in sequence. Do NOT call save_basic_details again after save_gender_details.
+- CRITICAL: After calling save_missing_basic_and_address_details tool, DO NOT call save_basic_details tool again. Follow the workflow sequence directly.
+- CRITICAL: after calling save_missing_basic_and_address_details, According Workflow A or B continue the next step
+- NEVER generate any success message without calling the tool first.
+- NEVER modify, truncate, or duplicate any formatted messages. Use all markdown formatting, line breaks, and sections exactly as provided by the tools. Do NOT add, merge, or change any text or formatting.
+- If the user provides a pincode, IMMEDIATELY proceed to PAN card collection.
+- You MUST execute ALL steps in sequence for the chosen workflow. Do NOT stop until the workflow is complete.
+- CRITICAL: After collecting date of birth with correct_date_of_birth tool, NEVER call save_basic_details. Proceed directly to gender collection.
+- CRITICAL: After collecting gender with save_gender_B_details tool, NEVER call save_basic_details. Proceed directly to Step 3 (PAN verification).
+- CRITICAL: After PAN card upload confirmation ("PAN card processed successfully"), IMMEDIATELY ask for gender selection and call save_gender_B_details tool.
+- CRITICAL: PAN UPLOAD FLOW: When user uploads PAN card and you receive "PAN card processed successfully" message, you MUST immediately ask: "Please select Patient's gender:\n1. Male\n2. Female\n" and wait for user response, then call save_gender_B_details tool.
+
+----
+
+## Workflow A: Normal Flow
+
+This workflow is followed when `get_prefill_data` returns status 200.
+
+1. **Initial Data Collection**
+   - Greet the user and introduce yourself as CarePay's healthcare loan assistant.
+   - Collect and validate:
+     * Patient's full name
+     * Patient's phoneNumber (must be a 10 digit number)
+     * treatmentCost (minimum ₹3,000, must be positive)
+     * monthlyIncome (must be positive)
+   - If any are missing, ask for the remaining ones.
+   - If treatmentCost < ₹3,000 or treatmentCost > ₹10,00,000, STOP and return:
+     "I understand your treatment cost is below ₹3,000 or above ₹10,00,000. Currently, I can only process loan applications for treatments costing ₹3,000 or more and up to ₹10,00,000. Please let me know if your treatment cost is ₹3,000 or above and up to ₹10,00,000, and I'll be happy to help you with the loan application process."
+   - Use `store_user_data` tool to save these details.
+   - Then call `start_loan_application` ONCE. It runs steps 2-5 below server-side in order; do NOT call their individual tools. Handle its result as described in steps 2-5.
+
+2. **User ID Creation**
+   - Use `get_user_id_from_phone_number` tool.
+   - If status 500, ask for a valid phone number.
+   - Store userId for all subsequent API calls.
+
+3. **Basic Details Submission**
+   - Use `save_basic_details` tool with session_id.
+
+4. **Save Loan Details**
+   - Use `save_loan_details` tool with fullName, treatmentCost, userId.
+
+5. **Check for Cardless Loan**
+   - Use `check_jp_cardless using session_id` tool.
+   - If "ELIGIBLE": show approval message and END. always ask "What is the name of treatment?" and save by calling correct_treatment_reason tool and show same approved message again with link(get_profile_link).
+   - If "NOT_ELIGIBLE" or "API_ERROR": show message and IMMEDIATELY proceed to step 6.
+
+6. **Data Prefill**
+   - Steps 6-12 run server-side: call `run_post_prefill_chain` ONCE instead of calling their tools one by one. When it returns the bureau decision, return it EXACTLY as provided. When it stops early (Workflow B, missing/invalid pincode, missing details or PAN failure), handle its result as described in the matching step below and continue with the individual tools for the remaining steps.
+   - Use `get_prefill_data using session_id` tool.
+   - If `get_prefill_data using session_id` returns status 200, continue with steps 7-12.
+
+7. **Address Processing**
+   - Use `process_address_data using session_id` tool.
+   - If `process_address_data using session_id` returns status "missing_pincode" or "invalid_pincode":
+       - Inform the user using the "message" field from the tool response.
+       - When user provides pincode, call `save_missing_basic_and_address_details` tool with the pincode.
+       - Then proceed directly to steps 8-12.
+   - If `process_address_data using session_id` returns status 200, continue with step 8.
+
+8 - process_prefill_data_for_basic_details
+   - Use `process_prefill_data_for_basic_details using session_id` tool.
+   - If `process_prefill_data_for_basic_details using session_id` returns status 200, continue with steps 9-10.
+   - If `process_prefill_data_for_basic_details using session_id` returns "status": "missing_details":
+       - Inform the user using the "message" field from the tool response.
+       - When user provides missing details (like gender), call the appropriate tool (save_gender_details) and then proceed directly to steps 9-12.
+       - Do NOT call save_basic_details again after collecting missing details.
+
+9. **PAN Card Collection**
+   - Use `pan_verification using session_id` tool.
+   - If pan_verification using session_id returns status 500 or error:
+     - Ask: "Please provide Patient's PAN card details. You can either:\n\n**Upload Patient's PAN card** by clicking the file upload button below\n**Enter Patient's PAN card number manually** (10-character alphanumeric code)\n\n"
+   - If pan_verification using session_id returns status 200, continue.
+
+10. **Employment Verification**
+   - Use `get_employment_verification using session_id` tool (continue even if it fails).
+
+11. **Save Employment Details**
+   - Use `save_employment_details using session_id` tool.
+
+12. **Process Loan Application**
+   - Use `get_bureau_decision using session_id` tool and return the formatted response exactly as provided.
+
+**CRITICAL RULES FOR WORKFLOW A:**
+- NEVER stop after process_prefill_data; always continue to get_bureau_decision.
+- NEVER mix Workflow A and Workflow B.
+- Workflow A is used when prefill data contains valid information (not empty).
+- Only STOP after get_bureau_decision or if treatmentCost < ₹3,000 or Juspay Cardless is ELIGIBLE.
+- pan_verification and get_employment_verification do not depend on each other: call both in the same turn, then call save_employment_details and get_bureau_decision once they have returned.
+- CRITICAL: After calling save_gender_details (or any other missing details tool), proceed directly to pan_verification using session_id, employment_verification, save_employment_details, and get_bureau_decision. Do NOT call save_basic_details again.
+- CRITICAL: After pan upload, calling pan_verification using session_id, proceed directly to employment_verification, save_employment_details, and get_bureau_decision. Do NOT call save_basic_details again.
+- CRITICAL: PAN UPLOAD GENDER REQUIREMENT: After PAN card upload confirmation ("PAN card processed successfully"), you MUST ask for gender selection before proceeding to pan_verification.
+- CRITICAL: Use the exact gender prompt: "Please select Patient's gender:\n1. Male\n2. Female\n"
+- CRITICAL: Wait for user response and call save_gender_details tool before proceeding to pan_verification.
+- CRITICAL: when follow workflow B then After calling save_missing_basic_and_address_details (when pincode is provided), ask for PAN card details and then call pan_verification using session_id, employment_verification, save_employment_details, and get_bureau_decision. Do NOT call process_address_data again and Do NOT call proces_prefill_data_for_basic_details again.
+- CRITICAL: when follow workflow A then After calling save_missing_basic_and_address_details (when pincode is provided), proceed directly to process_prefill_data_for_basic_details, pan_verification using session_id, employment_verification, save_employment_details, and get_bureau_decision. Do NOT call process_address_data again.
+
+
+----
+
+## Workflow B: Direct Pincode Collection Flow (STRICT CHECKLIST)
+
+Trigger:
+- Use this ONLY when `get_prefill_data` returns status 500 with error "phoneToPrefill_failed" OR when prefill data is empty (all important fields like pan, name, income, gender, age, dob are empty).
+- NEVER mix with Workflow A.
+- CRITICAL: when follow workflow B then After calling save_missing_basic_and_address_details (when pincode is provided), ask for PAN card details and then call pan_verification using session_id, employment_verification, save_employment_details, and get_bureau_decision. Do NOT call process_address_data again and Do NOT call proces_prefill_data_for_basic_details again.
+
+
+State Flags (internal):
+- pan_verified = false
+- employment_verified = false
+- employment_details_submitted = false
+- bureau_decision_processed = false
+
+Step 1: Current Address Pincode Collection
+- Ask ONLY "Please provide 6-digit pincode of Patient's Current address:" and wait for response
+- After collecting pincode, call save_missing_basic_and_address_details
+- Then proceed directly to Step 2 (PAN collection)
+
+Step 2: PAN Card Collection
+- Ask: "Please provide Patient's PAN card details. You can either:\n\n**Upload Patient's PAN card** by clicking the file upload button below\n**Enter Patient's PAN card number manually** (10-character alphanumeric code)\n\n"
+- IF user provides a PAN number → handle_pan_card_number → then ask for date of birth (DD-MM-YYYY) and call save by correct_date_of_birth tool → then must ask for gender: "Please select Patient's gender:\n1. Male\n2. Female\n" and wait for user response, then call save_gender_B_details
+- IF user uploads PAN card → wait for upload confirmation message("PAN card processed successfully") → then MUST ask for gender: "Please select Patient's gender:\n1. Male\n2. Female\n" and wait for user response, then call save_gender_B_details
+- After PAN is saved and additional details collected, continue with Step 3
+
+Step 3: PAN Verification
+- Call pan_verification using session_id
+- IF it fails → return to Step 2 (re-collect PAN) and retry
+- IF it succeeds → set pan_verified = true → go to Step 4
+
+Step 4: Employment Verification
+- Call get_employment_verification (continue even if it fails)
+- If status 200 → set employment_verified = true
+- Proceed to Step 5
+
+Step 5: Save Employment Details
+- Call save_employment_details
+- If status 200 → set employment_details_submitted = true
+- Proceed to Step 6
+
+Step 6: Process Loan Application
+- Call get_bureau_decision
+- Use its formatted response exactly as provided; set bureau_decision_processed = true
+- END
+
+Do Not Repeat Rules:
+- Never mix Workflow A and Workflow B.
+
+**CRITICAL RULES FOR WORKFLOW B:**
+- CRITICAL: After PAN card upload confirmation ("PAN card processed successfully"), you MUST ask for gender selection before proceeding to Step 3 (PAN verification).
+- CRITICAL: Use the exact gender prompt: "Please select Patient's gender:\n1. Male\n2. Female\n"
+- CRITICAL: Wait for user response and call save_gender_B_details tool before proceeding.
+
+End Condition:
+- Workflow B stops ONLY after get_bureau_decision is called and its formatted response is shown.
+
+Auto-Chain Rule:
+- If any tool output includes continue_chain = true, immediately execute Steps 4-7 without asking for more user input.
+
+----
+
+## Additional CRITICAL Rules (Apply to Both Workflows)
+
+- When process_prefill_data returns "status": "missing_details", inform the user and use handle_missing_details_collection until all details are collected, then continue.
+- CRITICAL: After handle_missing_details_collection returns "All required details have been collected and saved successfully", IMMEDIATELY proceed to the next step in the workflow (PAN verification, employment verification, etc.). DO NOT restart the workflow or call basic workflow steps again.
+- NEVER assume or guess user's gender, marital status, or education level.
+- NEVER use name, age, or any other data to determine gender.
+- The ONLY way to get gender is to ask: "Please select Patient's gender:\n1. Male\n2. Female\n"
+- NEVER assume gender from PAN card data or any other source - ALWAYS ask the user explicitly
+- When get_bureau_decision tool returns a formatted response, use it EXACTLY as provided.
+- NEVER duplicate or modify any part of the tool's formatted response.
+- NEVER concatenate or merge multiple formatted responses.
+- NEVER add, modify, or skip any steps in the workflow.
+- If any step fails, continue to the next step unless otherwise specified.
+- Only STOP the process when you reach get_bureau_decision (or if treatmentCost < ₹3,000 or Juspay Cardless is ELIGIBLE).
+- CRITICAL: After collecting date of birth using correct_date_of_birth tool, NEVER call save_basic_details. Proceed directly to the next step in the workflow.
+- CRITICAL: After collecting gender using save_gender_B_details tool, NEVER call save_basic_details. Proceed directly to PAN verification.
+- CRITICAL: After PAN card upload confirmation message ("PAN card processed successfully"), IMMEDIATELY ask for gender selection using the exact prompt: "Please select Patient's gender:\n1. Male\n2. Female\n" and wait for user response, then call save_gender_B_details tool.
+
+----
+
+CRITICAL CONTEXT AWARENESS RULES:
+1. ALWAYS refer to the conversation context and memory provided with each turn to understand the current state
+2. DO NOT repeat questions or steps that have already been completed
+3. Use the stored data to provide personalized responses
+4. If the user asks about previously provided information, refer to the stored data
+5. Maintain consistency with previous responses and collected information
+6. If the user wants to change something, use the appropriate correction tools
+7. Remember the current workflow (A or B) and application status
+8. NEVER ask for Aadhaar upload in Workflow A
+9. NEVER mix Workflow A and Workflow B - stick to the current workflow
+10. Continue from where you left off based on the current step in the workflow
+11. CRITICAL: After missing details collection is complete, proceed to the next workflow step (PAN verification, employment verification, etc.) - DO NOT restart the workflow
+12. Workflow B is triggered when prefill data is empty (all important fields are empty) or when phoneToPrefill API fails
+13. CRITICAL: After PAN card upload confirmation message ("PAN card processed successfully"), IMMEDIATELY ask for gender selection using the exact prompt: "Please select Patient's gender:\n1. Male\n2. Female\n"
+"""
+
+# Agent prompt built once at import; the per-session context is passed in as the
+# "context" variable on each invoke. The byte-identical system prompt and the
+# append-only chat history come first so OpenAI's automatic prefix cache can
+# reuse them; the context block changes every turn, so it goes after them.
+_PROMPT = ChatPromptTemplate.from_messages([
+    SystemMessage(content=_SYSTEM_PROMPT),
+    MessagesPlaceholder(variable_name="chat_history"),
+    ("system", "{context}"),
+    ("human", "{input}"),
+    MessagesPlaceholder(variable_name="agent_scratchpad"),
+])
+
+
 class CarepayAgent:
     """
     Carepay AI Agent using LangChain for managing loan application processes
@@ -44,201 +1239,27 @@ class CarepayAgent:
             openai_api_key=os.environ.get("OPENAI_API_KEY", ""),
             model=os.environ.get("OPENAI_MODEL", "gpt-4o"),
             temperature=0.2,
+            extra_body={"prompt_cache_key": "carepay-agent-v1"},
+        )
+        # Smaller model for the initial data collection turns
+        self.llm_fast = ChatOpenAI(
+            openai_api_key=os.environ.get("OPENAI_API_KEY", ""),
+            model=os.environ.get("OPENAI_FAST_MODEL", "gpt-4o-mini"),
+            temperature=0,
+            extra_body={"prompt_cache_key": "carepay-agent-v1"},
         )
 
         # Initialize API client
         self.api_client = CarepayAPIClient()
 
-        # Define base system prompt
-        self.base_system_prompt = """
-        You are a healthcare loan application assistant for CarePay. Your role is to help users apply for loans for medical treatments in a professional and friendly manner.
-
-        GENERAL CRITICAL RULES:
-        - You MUST call the appropriate tools to save or update data. Do NOT generate success messages without calling the tools first. When a user provides information that needs to be saved, IMMEDIATELY call the corresponding tool.
-        - NEVER respond with success messages like "Your X has been successfully updated" without first calling the appropriate tool. Use the tool's response to inform the user.
-        - When a user provides any information that needs to be saved (gender, marital status, education level, treatment reason, treatment cost, date of birth, pincode), you MUST call the corresponding tool. Do NOT generate any response until you have called the tool.
-        - When a user provides a treatment reason (e.g., "hair transplant", "dental surgery"), IMMEDIATELY call the correct_treatment_reason tool.
-        - When a user provides a pincode (6-digit number), IMMEDIATELY call the save_missing_basic_and_address_details tool.
-        - CRITICAL PAN UPLOAD RULE: After PAN card upload confirmation ("PAN card processed successfully"), you MUST ask for gender selection using the exact prompt: "Please select Patient's gender:\n1. Male\n2. Female\n"
-        - CRITICAL: When you have just asked for missing details (like gender) and the user responds with that information, you MUST call save_gender_details tool. After calling save_gender_details, proceed directly to pan_verification, employment_verification, save_employment_details, and get_bureau_decision tools in sequence. Do NOT call save_basic_details again after save_gender_details.
-        - CRITICAL: After calling save_missing_basic_and_address_details tool, DO NOT call save_basic_details tool again. Follow the workflow sequence directly.
-        - CRITICAL: after calling save_missing_basic_and_address_details, According Workflow A or B continue the next step
-        - NEVER generate any success message without calling the tool first.
-        - NEVER modify, truncate, or duplicate any formatted messages. Use all markdown formatting, line breaks, and sections exactly as provided by the tools. Do NOT add, merge, or change any text or formatting.
-        - If the user provides a pincode, IMMEDIATELY proceed to PAN card collection.
-        - You MUST execute ALL steps in sequence for the chosen workflow. Do NOT stop until the workflow is complete.
-        - CRITICAL: After collecting date of birth with correct_date_of_birth tool, NEVER call save_basic_details. Proceed directly to gender collection.
-        - CRITICAL: After collecting gender with save_gender_B_details tool, NEVER call save_basic_details. Proceed directly to Step 3 (PAN verification).
-        - CRITICAL: After PAN card upload confirmation ("PAN card processed successfully"), IMMEDIATELY ask for gender selection and call save_gender_B_details tool.
-        - CRITICAL: PAN UPLOAD FLOW: When user uploads PAN card and you receive "PAN card processed successfully" message, you MUST immediately ask: "Please select Patient's gender:\n1. Male\n2. Female\n" and wait for user response, then call save_gender_B_details tool.
-
-        ----
-
-        ## Workflow A: Normal Flow
-
-        This workflow is followed when `get_prefill_data` returns status 200.
-
-        1. **Initial Data Collection**
-           - Greet the user and introduce yourself as CarePay's healthcare loan assistant.
-           - Collect and validate:
-             * Patient's full name
-             * Patient's phoneNumber (must be a 10 digit number)
-             * treatmentCost (minimum ₹3,000, must be positive)
-             * monthlyIncome (must be positive)
-           - If any are missing, ask for the remaining ones.
-           - If treatmentCost < ₹3,000 or treatmentCost > ₹10,00,000, STOP and return:  
-             "I understand your treatment cost is below ₹3,000 or above ₹10,00,000. Currently, I can only process loan applications for treatments costing ₹3,000 or more and up to ₹10,00,000. Please let me know if your treatment cost is ₹3,000 or above and up to ₹10,00,000, and I'll be happy to help you with the loan application process."
-           - Use `store_user_data` tool to save these details.
-
-        2. **User ID Creation**
-           - Use `get_user_id_from_phone_number` tool.
-           - If status 500, ask for a valid phone number.
-           - Store userId for all subsequent API calls.
-
-        3. **Basic Details Submission**
-           - Use `save_basic_details` tool with session_id.
-
-        4. **Save Loan Details**
-           - Use `save_loan_details` tool with fullName, treatmentCost, userId.
-
-        5. **Check for Cardless Loan**
-           - Use `check_jp_cardless using session_id` tool.
-           - If "ELIGIBLE": show approval message and END. always ask "What is the name of treatment?" and save by calling correct_treatment_reason tool and show same approved message again with link(get_profile_link).
-           - If "NOT_ELIGIBLE" or "API_ERROR": show message and IMMEDIATELY proceed to step 6.
-
-        6. **Data Prefill**
-           - Use `get_prefill_data using session_id` tool.
-           - If `get_prefill_data using session_id` returns status 200, continue with steps 7-12.
-
-        7. **Address Processing**
-           - Use `process_address_data using session_id` tool.
-           - If `process_address_data using session_id` returns status "missing_pincode" or "invalid_pincode":
-               - Inform the user using the "message" field from the tool response.
-               - When user provides pincode, call `save_missing_basic_and_address_details` tool with the pincode.
-               - Then proceed directly to steps 8-12.
-           - If `process_address_data using session_id` returns status 200, continue with step 8.
-
-        8 - process_prefill_data_for_basic_details
-           - Use `process_prefill_data_for_basic_details using session_id` tool.
-           - If `process_prefill_data_for_basic_details using session_id` returns status 200, continue with steps 9-10.
-           - If `process_prefill_data_for_basic_details using session_id` returns "status": "missing_details":
-               - Inform the user using the "message" field from the tool response.
-               - When user provides missing details (like gender), call the appropriate tool (save_gender_details) and then proceed directly to steps 9-12.
-               - Do NOT call save_basic_details again after collecting missing details.
-
-        9. **PAN Card Collection**
-           - Use `pan_verification using session_id` tool.
-           - If pan_verification using session_id returns status 500 or error:
-             - Ask: "Please provide Patient's PAN card details. You can either:\n\n**Upload Patient's PAN card** by clicking the file upload button below\n**Enter Patient's PAN card number manually** (10-character alphanumeric code)\n\n"
-           - If pan_verification using session_id returns status 200, continue.
-
-        10. **Employment Verification**
-           - Use `get_employment_verification using session_id` tool (continue even if it fails).
-
-        11. **Save Employment Details**
-           - Use `save_employment_details using session_id` tool.
-
-        12. **Process Loan Application**
-           - Use `get_bureau_decision using session_id` tool and return the formatted response exactly as provided.
-
-        **CRITICAL RULES FOR WORKFLOW A:**
-        - NEVER stop after process_prefill_data; always continue to get_bureau_decision.
-        - NEVER mix Workflow A and Workflow B.
-        - Workflow A is used when prefill data contains valid information (not empty).
-        - Only STOP after get_bureau_decision or if treatmentCost < ₹3,000 or Juspay Cardless is ELIGIBLE.
-        - CRITICAL: After calling save_gender_details (or any other missing details tool), proceed directly to pan_verification using session_id, employment_verification, save_employment_details, and get_bureau_decision. Do NOT call save_basic_details again.
-        - CRITICAL: After pan upload, calling pan_verification using session_id, proceed directly to employment_verification, save_employment_details, and get_bureau_decision. Do NOT call save_basic_details again.
-        - CRITICAL: PAN UPLOAD GENDER REQUIREMENT: After PAN card upload confirmation ("PAN card processed successfully"), you MUST ask for gender selection before proceeding to pan_verification.
-        - CRITICAL: Use the exact gender prompt: "Please select Patient's gender:\n1. Male\n2. Female\n"
-        - CRITICAL: Wait for user response and call save_gender_details tool before proceeding to pan_verification.
-        - CRITICAL: when follow workflow B then After calling save_missing_basic_and_address_details (when pincode is provided), ask for PAN card details and then call pan_verification using session_id, employment_verification, save_employment_details, and get_bureau_decision. Do NOT call process_address_data again and Do NOT call proces_prefill_data_for_basic_details again.
-        - CRITICAL: when follow workflow A then After calling save_missing_basic_and_address_details (when pincode is provided), proceed directly to process_prefill_data_for_basic_details, pan_verification using session_id, employment_verification, save_employment_details, and get_bureau_decision. Do NOT call process_address_data again.
-        
-
-        ----
-
-        ## Workflow B: Direct Pincode Collection Flow (STRICT CHECKLIST)
+        # Static system prompt shared by every turn
+        self.base_system_prompt = _SYSTEM_PROMPT
 
-        Trigger:
-        - Use this ONLY when `get_prefill_data` returns status 500 with error "phoneToPrefill_failed" OR when prefill data is empty (all important fields like pan, name, income, gender, age, dob are empty).
-        - NEVER mix with Workflow A.
-        - CRITICAL: when follow workflow B then After calling save_missing_basic_and_address_details (when pincode is provided), ask for PAN card details and then call pan_verification using session_id, employment_verification, save_employment_details, and get_bureau_decision. Do NOT call process_address_data again and Do NOT call proces_prefill_data_for_basic_details again.
-        
-
-        State Flags (internal):
-        - pan_verified = false
-        - employment_verified = false
-        - employment_details_submitted = false
-        - bureau_decision_processed = false
-
-        Step 1: Current Address Pincode Collection
-        - Ask ONLY "Please provide 6-digit pincode of Patient's Current address:" and wait for response
-        - After collecting pincode, call save_missing_basic_and_address_details
-        - Then proceed directly to Step 2 (PAN collection)
-
-        Step 2: PAN Card Collection
-        - Ask: "Please provide Patient's PAN card details. You can either:\n\n**Upload Patient's PAN card** by clicking the file upload button below\n**Enter Patient's PAN card number manually** (10-character alphanumeric code)\n\n"
-        - IF user provides a PAN number → handle_pan_card_number → then ask for date of birth (DD-MM-YYYY) and call save by correct_date_of_birth tool → then must ask for gender: "Please select Patient's gender:\n1. Male\n2. Female\n" and wait for user response, then call save_gender_B_details
-        - IF user uploads PAN card → wait for upload confirmation message("PAN card processed successfully") → then MUST ask for gender: "Please select Patient's gender:\n1. Male\n2. Female\n" and wait for user response, then call save_gender_B_details
-        - After PAN is saved and additional details collected, continue with Step 3
-      
-        Step 3: PAN Verification
-        - Call pan_verification using session_id
-        - IF it fails → return to Step 2 (re-collect PAN) and retry
-        - IF it succeeds → set pan_verified = true → go to Step 4
-
-        Step 4: Employment Verification
-        - Call get_employment_verification (continue even if it fails)
-        - If status 200 → set employment_verified = true
-        - Proceed to Step 5
-
-        Step 5: Save Employment Details
-        - Call save_employment_details
-        - If status 200 → set employment_details_submitted = true
-        - Proceed to Step 6
-
-        Step 6: Process Loan Application
-        - Call get_bureau_decision
-        - Use its formatted response exactly as provided; set bureau_decision_processed = true
-        - END
-
-        Do Not Repeat Rules:
-        - Never mix Workflow A and Workflow B.
-
-        **CRITICAL RULES FOR WORKFLOW B:**
-        - CRITICAL: After PAN card upload confirmation ("PAN card processed successfully"), you MUST ask for gender selection before proceeding to Step 3 (PAN verification).
-        - CRITICAL: Use the exact gender prompt: "Please select Patient's gender:\n1. Male\n2. Female\n"
-        - CRITICAL: Wait for user response and call save_gender_B_details tool before proceeding.
-
-        End Condition:
-        - Workflow B stops ONLY after get_bureau_decision is called and its formatted response is shown.
-
-        Auto-Chain Rule:
-        - If any tool output includes continue_chain = true, immediately execute Steps 4-7 without asking for more user input.
-
-        ----
-
-        ## Additional CRITICAL Rules (Apply to Both Workflows)
-
-        - When process_prefill_data returns "status": "missing_details", inform the user and use handle_missing_details_collection until all details are collected, then continue.
-        - CRITICAL: After handle_missing_details_collection returns "All required details have been collected and saved successfully", IMMEDIATELY proceed to the next step in the workflow (PAN verification, employment verification, etc.). DO NOT restart the workflow or call basic workflow steps again.
-        - NEVER assume or guess user's gender, marital status, or education level.
-        - NEVER use name, age, or any other data to determine gender.
-        - The ONLY way to get gender is to ask: "Please select Patient's gender:\n1. Male\n2. Female\n"
-        - NEVER assume gender from PAN card data or any other source - ALWAYS ask the user explicitly
-        - When get_bureau_decision tool returns a formatted response, use it EXACTLY as provided.
-        - NEVER duplicate or modify any part of the tool's formatted response.
-        - NEVER concatenate or merge multiple formatted responses.
-        - NEVER add, modify, or skip any steps in the workflow.
-        - If any step fails, continue to the next step unless otherwise specified.
-        - Only STOP the process when you reach get_bureau_decision (or if treatmentCost < ₹3,000 or Juspay Cardless is ELIGIBLE).
-        - CRITICAL: After collecting date of birth using correct_date_of_birth tool, NEVER call save_basic_details. Proceed directly to the next step in the workflow.
-        - CRITICAL: After collecting gender using save_gender_B_details tool, NEVER call save_basic_details. Proceed directly to PAN verification.
-        - CRITICAL: After PAN card upload confirmation message ("PAN card processed successfully"), IMMEDIATELY ask for gender selection using the exact prompt: "Please select Patient's gender:\n1. Male\n2. Female\n" and wait for user response, then call save_gender_B_details tool.
-
-        ----
-
-        """
+        # The agent runnable (prompt plus model bound to the tool schemas) does not
+        # depend on the session, so one is built per model and forced tool and reused
+        # by every session; session_id is bound per turn through the executor's tools
+        self._agent_cache: Dict[Tuple[str, Optional[str]], Any] = {}
+        self._agent_cache_lock = threading.Lock()
     
     def create_session(self, doctor_id=None, doctor_name=None, phone_number=None) -> str:
         """
@@ -268,7 +1289,7 @@ class CarepayAgent:
             # Create session with initial data using single history approach
             session = {
                 "id": session_id,
-                "created_at": datetime.now().isoformat(),
+                "created_at": datetime.now().isoformat(timespec="seconds"),
                 "status": "active",  
                 "history": [{
                     "type": "AIMessage",
@@ -297,18 +1318,20 @@ class CarepayAgent:
     
     def _create_context_aware_system_prompt(self, session_id: str) -> str:
         """
-        Create a context-aware system prompt that includes conversation history and session data
+        Create the per-session context section of the system prompt from
+        conversation history and session data. It is sent as a separate system
+        message after the static _SYSTEM_PROMPT.
         
         Args:
             session_id: Session identifier
             
         Returns:
-            Enhanced system prompt with context
+            Conversation context prompt (empty string if unavailable)
         """
         try:
             session = SessionManager.get_session_from_db(session_id)
             if not session:
-                return self.base_system_prompt
+                return ""
             
             # Get conversation history
             history = session.get("history", [])
@@ -317,33 +1340,13 @@ class CarepayAgent:
             # Create conversation context
             conversation_context = self._extract_conversation_context(history, data, session_id)
             
-            # Create enhanced system prompt
-            enhanced_prompt = f"""{self.base_system_prompt}
-
-CONVERSATION CONTEXT AND MEMORY:
+            return f"""CONVERSATION CONTEXT AND MEMORY:
 {conversation_context}
-
-CRITICAL CONTEXT AWARENESS RULES:
-1. ALWAYS refer to the conversation history above to understand the current state
-2. DO NOT repeat questions or steps that have already been completed
-3. Use the stored data to provide personalized responses
-4. If the user asks about previously provided information, refer to the stored data
-5. Maintain consistency with previous responses and collected information
-6. If the user wants to change something, use the appropriate correction tools
-7. Remember the current workflow (A or B) and application status
-8. NEVER ask for Aadhaar upload in Workflow A
-9. NEVER mix Workflow A and Workflow B - stick to the current workflow
-10. Continue from where you left off based on the current step in the workflow
-11. CRITICAL: After missing details collection is complete, proceed to the next workflow step (PAN verification, employment verification, etc.) - DO NOT restart the workflow
-12. Workflow B is triggered when prefill data is empty (all important fields are empty) or when phoneToPrefill API fails
-13. CRITICAL: After PAN card upload confirmation message ("PAN card processed successfully"), IMMEDIATELY ask for gender selection using the exact prompt: "Please select Patient's gender:\n1. Male\n2. Female\n"
-
 """
-            return enhanced_prompt
             
         except Exception as e:
             logger.error(f"Error creating context-aware system prompt: {e}")
-            return self.base_system_prompt
+            return ""
     
     def _extract_conversation_context(self, history: List[Dict[str, Any]], data: Dict[str, Any], session_id: str = None) -> str:
         """
@@ -393,7 +1396,7 @@ CRITICAL CONTEXT AWARENESS RULES:
                 # Add collection status
                 if data.get("additional_details"):
                     context_parts.append(f"- Additional Details Collection: In Progress")
-                    collection_step = data.get("additional_details", {}).get("collection_step")
+                    collection_step = _dig(data, "additional_details", "collection_step")
                     if collection_step:
                         context_parts.append(f"- Current Collection Step: {collection_step}")
             
@@ -526,7 +1529,7 @@ CRITICAL CONTEXT AWARENESS RULES:
                 return "Step 8: Process Prefill Data for Basic Details"
             
             # Check for missing details collection
-            if data.get("additional_details", {}).get("collection_step"):
+            if _dig(data, "additional_details", "collection_step"):
                 return f"Step 8: Collecting Missing Details - {data.get('additional_details', {}).get('collection_step')}"
             
             # Check if missing details collection is complete but basic details prefill is not processed
@@ -772,13 +1775,13 @@ CRITICAL CONTEXT AWARENESS RULES:
                 msg_type = msg.get("type", "")
                 
                 if msg_type == "HumanMessage":
-                    if any(keyword in content for keyword in ["name:", "phone:", "cost:", "income:"]):
+                    if _INITIAL_DATA_KEYWORDS_RE.search(content):
                         milestones.append(f"Step {i//2 + 1}: User provided initial data")
                     elif "pincode" in content and len(content.strip()) == 6:
                         milestones.append(f"Step {i//2 + 1}: User provided pincode")
                     elif "pan" in content and ("upload" in content or len(content.strip()) == 10):
                         milestones.append(f"Step {i//2 + 1}: User provided PAN")
-                    elif any(keyword in content for keyword in ["1", "2", "salaried", "self-employed"]):
+                    elif _EMPLOYMENT_ANSWER_KEYWORDS_RE.search(content):
                         milestones.append(f"Step {i//2 + 1}: User selected employment type")
                     elif "@" in content and "." in content:
                         milestones.append(f"Step {i//2 + 1}: User provided email")
@@ -825,7 +1828,7 @@ CRITICAL CONTEXT AWARENESS RULES:
             logger.error(f"Error creating conversation summary: {e}")
             return ""
     
-    def _get_optimized_chat_history(self, session_id: str, max_messages: int = 10) -> List:
+    def _get_optimized_chat_history(self, session_id: str, max_messages: int = _MAX_CHAT_HISTORY) -> List:
         """
         Get optimized chat history for the agent with context preservation
         
@@ -847,18 +1850,10 @@ CRITICAL CONTEXT AWARENESS RULES:
             if len(history) <= max_messages:
                 return self._convert_to_langchain_messages(history)
             
-            # For longer histories, keep the first message (greeting) and recent messages
-            optimized_history = []
-            
-            # Always keep the first message (initial greeting)
-            if history:
-                optimized_history.append(history[0])
-            
-            # Add recent messages
-            recent_messages = history[-(max_messages-1):] if len(history) > 1 else []
-            optimized_history.extend(recent_messages)
-            
-            return self._convert_to_langchain_messages(optimized_history)
+            # For longer histories, keep the opening exchange (greeting and the patient's
+            # initial details) and the most recent messages. Slice before converting so
+            # dropped messages are never turned into LangChain objects.
+            return self._convert_to_langchain_messages(history[:2] + history[-(max_messages - 2):])
             
         except Exception as e:
             logger.error(f"Error getting optimized chat history: {e}")
@@ -912,14 +1907,83 @@ CRITICAL CONTEXT AWARENESS RULES:
                 progress_updates["employment_type_collected"] = True
             
             # Update progress in session data
-            for key, value in progress_updates.items():
-                SessionManager.update_session_data_field(session_id, f"data.{key}", value)
-                logger.info(f"Updated progress for session {session_id}: {key} = {value}")
+            if progress_updates:
+                SessionManager.update_session_data_fields(
+                    session_id, {f"data.{key}": value for key, value in progress_updates.items()}
+                )
+                logger.info(f"Updated progress for session {session_id}: {progress_updates}")
                 
         except Exception as e:
             logger.error(f"Error updating conversation progress: {e}")
     
+    def _precheck_user_input(self, message: str) -> Optional[str]:
+        """
+        Reject an out-of-range treatment cost stated explicitly in the message
+        without invoking the LLM
+        
+        Args:
+            message: User message
+            
+        Returns:
+            Rejection message, or None if the message should go to the agent
+        """
+        match = _COST_RE.search(message)
+        if not match:
+            return None
+        try:
+            cost_value = float(match.group(1).replace(',', ''))
+        except ValueError:
+            return None
+        
+        if cost_value < 3000:
+            return f"I understand your treatment cost is ₹{cost_value:,.0f}. Currently, I can only process loan applications for treatments costing ₹3,000 or more. Please let me know if your treatment cost is ₹3,000 or above, and I'll be happy to help you with the loan application process."
+        if cost_value > 1000000:
+            return f"I understand your treatment cost is ₹{cost_value:,.0f}. Currently, I can only process loan applications for treatments costing up to ₹10,00,000. Please let me know if your treatment cost is ₹10,00,000 or below, and I'll be happy to help you with the loan application process."
+        return None
+    
+    def _select_forced_tool(self, message: str, session: Dict[str, Any]) -> Optional[str]:
+        """
+        Pick a tool the first agent step must call when the reply unambiguously
+        answers the last question (pincode, PAN number or email address)
+        
+        Args:
+            message: User message
+            session: Session dictionary
+            
+        Returns:
+            Tool name, or None to let the model choose
+        """
+        history = session.get("history") or []
+        last_ai_message = next(
+            (msg.get("content", "") for msg in reversed(history) if msg.get("type") == "AIMessage"),
+            ""
+        ).lower()
+        text = message.strip()
+        
+        if "pincode" in last_ai_message and _PINCODE_RE.fullmatch(text):
+            return "save_missing_basic_and_address_details"
+        if "pan card" in last_ai_message and _PAN_RE.fullmatch(text.upper()):
+            return "handle_pan_card_number"
+        if "email" in last_ai_message and _EMAIL_RE.fullmatch(text):
+            return "handle_email_address"
+        return None
+    
     def run(self, session_id: str, message: str) -> str:
+        """
+        Process a user message within a session. The session is read once and
+        written back once for the whole turn.
+
+        Args:
+            session_id: Session identifier
+            message: User message
+
+        Returns:
+            Agent response
+        """
+        with SessionManager.session_scope(session_id):
+            return self._process_message(session_id, message)
+
+    def _process_message(self, session_id: str, message: str) -> str:
         """
         Process a user message within a session
 
@@ -934,309 +1998,220 @@ CRITICAL CONTEXT AWARENESS RULES:
             # Get session from database once
             session = SessionManager.get_session_from_db(session_id)
             current_status = session.get("status", "active")
-            logger.info(f"Session {session_id} current status: {current_status}")
-
-            # Helper: detect employment type prompt in a string
-            def is_employment_type_prompt(text: str) -> bool:
-                return (
-                    "Patient's employment type:" in text
-                    and "1. SALARIED" in text
-                    and "2. SELF_EMPLOYED" in text
-                    and "Please Enter input 1 or 2 only" in text
-                )
-
-            # Helper: detect limit options prompt in a string
-            def is_limit_options_prompt(text: str) -> bool:
-                return (
-                    "Continue with this limit" in text
-                    and "Continue with limit enhancement" in text
-                    and ("1." in text and "2." in text)
-                )
-
-            # If already collecting additional details, use the sequential handler,
-            # but allow status to be changed if agent message contains employment type question
-            if current_status == "collecting_additional_details":
-                logger.info(f"Session {session_id}: Entering additional details collection mode")
-                ai_message = self._handle_additional_details_collection(session_id, message)
-                # If the AI message contains the employment type prompt, update status accordingly
-                if is_employment_type_prompt(ai_message):
-                    logger.info(f"Employment type prompt detected in collecting_additional_details mode, updating session status for {session_id}")
-                    SessionManager.update_session_data_field(session_id, "status", "collecting_additional_details")
-                    SessionManager.update_session_data_field(session_id, "data.collection_step", "employment_type")
-                    updated_session = SessionManager.get_session_from_db(session_id)
-                    if not updated_session.get("data", {}).get("additional_details"):
-                        SessionManager.update_session_data_field(session_id, "data.additional_details", {})
-                    logger.info(f"Session {session_id} marked as collecting_additional_details (from collecting_additional_details branch)")
-                self._update_session_history(session_id, message, ai_message)
-                return ai_message
-
-            # Handle post-approval address details flow when additional_details_completed
-            if current_status == "additional_details_completed":
-                logger.info(f"Session {session_id}: Handling post-approval address details flow")
-                ai_message = self._handle_post_approval_address_details(session_id, message)
-                self._update_session_history(session_id, message, ai_message)
-                return ai_message
-
-            # Handle post-approval address details completion
-            if current_status == "post_approval_address_details":
-                logger.info(f"Session {session_id}: Handling post-approval address details completion")
-                ai_message = self._handle_address_details_completion(session_id, message)
-                self._update_session_history(session_id, message, ai_message)
-                return ai_message
-
-            # Handle KYC completed status
-            if current_status == "kyc_completed":
-                logger.info(f"Session {session_id}: Handling KYC completed status")
-                ai_message = self._handle_kyc_completed_status(session_id, message)
-                self._update_session_history(session_id, message, ai_message)
+            logger.info("Session %s current status: %s", session_id, current_status)
+
+            # The last reply asked for employment type but the status switch was lost;
+            # answer through the additional details flow instead of the agent
+            history = session.get("history") or []
+            if (
+                current_status not in _STATUS_HANDLERS
+                and history
+                and history[-1].get("type") == "AIMessage"
+                and _is_employment_type_prompt(history[-1].get("content", ""))
+            ):
+                logger.warning("Session %s: Last reply asked for employment type while status is %s; resuming additional details collection", session_id, current_status)
+                current_status = "collecting_additional_details"
+                updates = {"status": current_status, "data.collection_step": "employment_type"}
+                if not _dig(session, "data", "additional_details"):
+                    updates["data.additional_details"] = {}
+                SessionManager.update_session_data_fields(session_id, updates)
+
+            # Statuses with a scripted flow are answered by their handler without an LLM turn
+            handler_name = _STATUS_HANDLERS.get(current_status)
+            if handler_name:
+                logger.info("Session %s: Handling %s status with %s", session_id, current_status, handler_name)
+                ai_message = getattr(self, handler_name)(session_id, message)
+                # The additional details flow can restart at the employment type question
+                collection_step = None
+                if current_status == "collecting_additional_details" and _is_employment_type_prompt(ai_message):
+                    logger.info("Employment type prompt detected in collecting_additional_details mode, updating session status for %s", session_id)
+                    collection_step = "employment_type"
+                self._update_session_history(session_id, message, ai_message, collection_step=collection_step)
                 return ai_message
 
-            # Handle loan disbursal ready status
-            if current_status == "loan_disbursal_ready":
-                logger.info(f"Session {session_id}: Handling loan disbursal ready status")
-                ai_message = self._handle_loan_disbursal_ready_status(session_id, message)
-                self._update_session_history(session_id, message, ai_message)
-                return ai_message
+            # Out-of-range treatment cost needs no LLM turn; only checked while the
+            # initial details are collected, before a userId exists
+            rejection = None if _dig(session, "data", "userId") else self._precheck_user_input(message)
+            if rejection:
+                logger.info("Session %s: Treatment cost outside supported range, skipping agent executor", session_id)
+                self._update_session_history(session_id, message, rejection)
+                return rejection
 
-            logger.info(f"Session {session_id}: Using full agent executor (status: {current_status})")
-            session_tools = self._create_session_aware_tools(session_id)
+            logger.info("Session %s: Using full agent executor (status: %s)", session_id, current_status)
 
             # Create context-aware system prompt with conversation history and session data
             context_aware_system_prompt = self._create_context_aware_system_prompt(session_id)
             
             # Get optimized chat history for better context management
-            optimized_chat_history = self._get_optimized_chat_history(session_id, max_messages=12)
+            optimized_chat_history = self._get_optimized_chat_history(session_id)
             
-            prompt = ChatPromptTemplate.from_messages([
-                ("system", context_aware_system_prompt),
-                ("human", "{input}"),
-                MessagesPlaceholder(variable_name="chat_history"),
-                MessagesPlaceholder(variable_name="agent_scratchpad"),
-            ])
-
-            agent = create_openai_functions_agent(self.llm, session_tools, prompt)
-            session_agent_executor = AgentExecutor(
-                agent=agent,
-                tools=session_tools,
-                verbose=True,
-                max_iterations=50,
-                handle_parsing_errors=True,
-                return_intermediate_steps=True,  # Ensure we get intermediate steps
-            )
+            # Until a userId exists the turn is only collecting the initial details,
+            # which the smaller model handles well
+            use_fast_llm = not _dig(session, "data", "userId")
 
-            # Use optimized chat history instead of full history
-            chat_history = optimized_chat_history.copy()
-            chat_history.append(HumanMessage(content=message))
+            # When the reply clearly answers the last question, force that tool on the first step
+            forced_tool = self._select_forced_tool(message, session)
+            if forced_tool:
+                logger.info("Session %s: Forcing first tool call to %s", session_id, forced_tool)
+            session_agent_executor = self._get_session_executor(session_id, use_fast_llm, forced_tool)
 
-            # Check if the message might trigger employment type questions
-            message_triggers_employment_check = any(keyword in message.lower() for keyword in [
-                "continue", "next", "proceed", "what", "employment", "type", "salaried", "self-employed"
-            ])
-            
-            response = session_agent_executor.invoke({
-                "input": message,
-                "chat_history": chat_history
-            })
+            # Use optimized chat history instead of full history; the current
+            # message is passed separately as the human input
+            chat_history = optimized_chat_history
 
-            logger.info(f"Agent executor response keys: {list(response.keys())}")
-            logger.info(f"Agent executor output: {response.get('output', 'No output')}")
-            
-            # Check if get_bureau_decision was called by looking at intermediate steps
-            bureau_decision_response = None
-            if "intermediate_steps" in response:
-                for step in response.get("intermediate_steps", []):
-                    if len(step) >= 2 and hasattr(step[0], 'tool') and step[0].tool == "get_bureau_decision":
-                        tool_output = step[1]
-                        logger.info(f"Found get_bureau_decision in intermediate steps with output: {tool_output}")
-                        if "Patient's employment type:" in str(tool_output):
-                            bureau_decision_response = str(tool_output)
-                            logger.info(f"Using bureau decision tool output as final response")
-                            break
-            
-            # If bureau decision was called and has employment type prompt, use its response
-            if bureau_decision_response:
-                ai_message = bureau_decision_response
-            else:
-                ai_message = response.get("output", "I'm processing your request. Please wait.")
-                
-            # Additional check: if the response is just "1. SALARIED" or similar, it's wrong
-            if ai_message.strip() in ["1. SALARIED", "2. SELF_EMPLOYED", "1", "2", "SALARIED", "SELF_EMPLOYED"]:
-                logger.error(f"Agent returned incorrect simplified response: {ai_message}")
-                # Try to get the bureau decision directly
+            try:
+                response = session_agent_executor.invoke({
+                    "input": message,
+                    "context": context_aware_system_prompt,
+                    "chat_history": chat_history
+                }, config={"callbacks": [RepeatedToolCallGuard()]})
+            except RepeatedToolCallError as e:
+                logger.warning("Session %s: Stopped agent turn: %s", session_id, e)
+                self._update_session_history(session_id, message, _AGENT_RETRY_REPLY)
+                return _AGENT_RETRY_REPLY
+
+            logger.info("Agent executor response keys: %s", list(response.keys()))
+            logger.info("Agent executor output: %s", response.get('output', 'No output'))
+            
+            # Use the bureau decision tool output as the reply when it asks the next question
+            bureau_decision_tool_output = None
+            for action, observation in response.get("intermediate_steps", ()):
+                if getattr(action, "tool", None) not in _BUREAU_DECISION_TOOLS:
+                    continue
+                text = observation if isinstance(observation, str) else str(observation)
+                if _is_employment_type_prompt(text) or _is_limit_options_prompt(text):
+                    # Remove blank and duplicate lines, keeping the first occurrence
+                    bureau_decision_tool_output = '\n'.join(
+                        dict.fromkeys(line for line in map(str.strip, text.split('\n')) if line)
+                    )
+                    logger.info("Found %s tool output with next question: %s", action.tool, bureau_decision_tool_output)
+                    break
+
+            ai_message = response.get("output", "I'm processing your request. Please wait.")
+
+            if bureau_decision_tool_output:
+                # The bureau decision tool output is the reply
+                ai_message = bureau_decision_tool_output
+            elif ai_message.strip() in _AGENT_STOPPED_OUTPUTS:
+                # The iteration or time limit ended the turn; ask the user to retry instead
+                logger.warning("Session %s: Agent turn hit the iteration or time limit", session_id)
+                ai_message = _AGENT_RETRY_REPLY
+            elif ai_message.strip() in ["1. SALARIED", "2. SELF_EMPLOYED", "1", "2", "SALARIED", "SELF_EMPLOYED"]:
+                # A bare option echoed back is wrong; fetch the bureau decision directly
+                logger.error("Agent returned incorrect simplified response: %s", ai_message)
                 try:
                     bureau_result = self.get_bureau_decision(session_id)
                     if bureau_result and "Patient's employment type:" in bureau_result:
                         ai_message = bureau_result
-                        logger.info(f"Forced bureau decision call to get correct response: {ai_message}")
+                        logger.info("Forced bureau decision call to get correct response: %s", ai_message)
                 except Exception as e:
-                    logger.error(f"Error forcing bureau decision: {e}")
-
-            # Check if the response came from get_bureau_decision tool and use it directly
-            bureau_decision_tool_used = False
-            bureau_decision_tool_output = None
-            if "intermediate_steps" in response:
-                logger.info(f"Checking intermediate steps for bureau decision tool: {len(response['intermediate_steps'])} steps")
-                for i, step in enumerate(response["intermediate_steps"]):
-                    logger.info(f"Step {i}: tool={step[0].tool if len(step) > 0 else 'None'}")
-                    if len(step) >= 2 and step[0].tool == "get_bureau_decision":
-                        tool_output = step[1]
-                        logger.info(f"Found get_bureau_decision tool, output: {tool_output}")
-                        if is_employment_type_prompt(str(tool_output)):
-                            bureau_decision_tool_output = str(tool_output)
-                            # Remove duplicate lines
-                            lines = bureau_decision_tool_output.split('\n')
-                            unique_lines = []
-                            seen_lines = set()
-                            for line in lines:
-                                line = line.strip()
-                                if line and line not in seen_lines:
-                                    unique_lines.append(line)
-                                    seen_lines.add(line)
-                            bureau_decision_tool_output = '\n'.join(unique_lines)
-                            bureau_decision_tool_used = True
-                            logger.info(f"Found get_bureau_decision tool output with employment type prompt: {bureau_decision_tool_output}")
-                            break
-                        elif is_limit_options_prompt(str(tool_output)):
-                            bureau_decision_tool_output = str(tool_output)
-                            # Remove duplicate lines
-                            lines = bureau_decision_tool_output.split('\n')
-                            unique_lines = []
-                            seen_lines = set()
-                            for line in lines:
-                                line = line.strip()
-                                if line and line not in seen_lines:
-                                    unique_lines.append(line)
-                                    seen_lines.add(line)
-                            bureau_decision_tool_output = '\n'.join(unique_lines)
-                            bureau_decision_tool_used = True
-                            logger.info(f"Found get_bureau_decision tool output with limit options prompt: {bureau_decision_tool_output}")
-                            break
-            else:
-                logger.info("No intermediate_steps found in response - agent executor may not have called any tools")
-
-            # If bureau decision tool was used and prompt is present, update status and return
-            if bureau_decision_tool_used and bureau_decision_tool_output:
-                if is_employment_type_prompt(bureau_decision_tool_output):
-                    logger.info(f"Employment type prompt detected, updating session status for {session_id}")
-                    SessionManager.update_session_data_field(session_id, "status", "collecting_additional_details")
-                    SessionManager.update_session_data_field(session_id, "data.collection_step", "employment_type")
-                    updated_session = SessionManager.get_session_from_db(session_id)
-                    if not updated_session.get("data", {}).get("additional_details"):
-                        SessionManager.update_session_data_field(session_id, "data.additional_details", {})
-                    logger.info(f"Session {session_id} marked as collecting_additional_details (from bureau_decision_tool branch)")
-                    
-                    # Force verify the status was updated
-                    final_session = SessionManager.get_session_from_db(session_id)
-                    if final_session:
-                        logger.info(f"Final session status after update: {final_session.get('status')}")
-                        if final_session.get('status') != "collecting_additional_details":
-                            logger.error(f"Status update failed! Current status: {final_session.get('status')}")
-                            # Force update again
-                            SessionManager.update_session_data_field(session_id, "status", "collecting_additional_details")
-                            logger.info("Forced status update again")
-                elif is_limit_options_prompt(bureau_decision_tool_output):
-                    logger.info(f"Limit options prompt detected, updating session status for {session_id}")
-                    SessionManager.update_session_data_field(session_id, "status", "collecting_additional_details")
-                    SessionManager.update_session_data_field(session_id, "data.collection_step", "limit_options")
-                    updated_session = SessionManager.get_session_from_db(session_id)
-                    if not updated_session.get("data", {}).get("additional_details"):
-                        SessionManager.update_session_data_field(session_id, "data.additional_details", {})
-                    logger.info(f"Session {session_id} marked as collecting_additional_details (from limit_options branch)")
-                
-                self._update_session_history(session_id, message, bureau_decision_tool_output)
-                return bureau_decision_tool_output
-
-            # Check if the agent executor output contains employment type prompt (even if tool wasn't called directly)
-            employment_type_prompt_in_output = is_employment_type_prompt(ai_message)
-            
-            # Check if the agent executor output contains limit options prompt
-            limit_options_prompt_in_output = is_limit_options_prompt(ai_message)
-
-            # Check if agent should have called bureau decision tool but didn't
-            should_have_called_bureau_tool = (
-                employment_type_prompt_in_output
-                and not bureau_decision_tool_used
-                and "intermediate_steps" in response
-                and len(response["intermediate_steps"]) > 0
-            )
-
-            # ALWAYS force the bureau decision tool call if employment type prompt is detected
-            if employment_type_prompt_in_output and not bureau_decision_tool_used:
-                logger.warning(f"Employment type prompt detected but get_bureau_decision tool not used. Forcing tool call.")
+                    logger.error("Error forcing bureau decision: %s", e)
+            elif _is_employment_type_prompt(ai_message):
+                # The agent wrote the employment type prompt itself; replace it with the tool's output
+                logger.warning("Employment type prompt detected but get_bureau_decision tool not used. Forcing tool call.")
                 try:
                     bureau_result = self.get_bureau_decision(session_id)
-                    if bureau_result and is_employment_type_prompt(bureau_result):
+                    if bureau_result and _is_employment_type_prompt(bureau_result):
                         ai_message = bureau_result
-                        logger.info(f"Forced bureau decision tool call successful: {ai_message}")
-                        # Update the response to indicate tool was used
-                        bureau_decision_tool_used = True
-                        bureau_decision_tool_output = bureau_result
+                        logger.info("Forced bureau decision tool call successful: %s", ai_message)
                     else:
-                        logger.error(f"Forced bureau decision tool call returned invalid result: {bureau_result}")
+                        logger.error("Forced bureau decision tool call returned invalid result: %s", bureau_result)
                 except Exception as e:
-                    logger.error(f"Error forcing bureau decision tool call: {e}")
-
-            # If employment type prompt is present in output, update status and collection step
-            if employment_type_prompt_in_output:
-                logger.info(f"Employment type prompt detected in agent output, updating session status for {session_id}")
-                SessionManager.update_session_data_field(session_id, "status", "collecting_additional_details")
-                SessionManager.update_session_data_field(session_id, "data.collection_step", "employment_type")
-                updated_session = SessionManager.get_session_from_db(session_id)
-                if not updated_session.get("data", {}).get("additional_details"):
-                    SessionManager.update_session_data_field(session_id, "data.additional_details", {})
-                logger.info(f"Session {session_id} marked as collecting_additional_details (from agent output branch)")
-                
-                # Force verify the status was updated
-                final_session = SessionManager.get_session_from_db(session_id)
-                if final_session:
-                    logger.info(f"Final session status after update: {final_session.get('status')}")
-                    if final_session.get('status') != "collecting_additional_details":
-                        logger.error(f"Status update failed! Current status: {final_session.get('status')}")
-                        # Force update again
-                        SessionManager.update_session_data_field(session_id, "status", "collecting_additional_details")
-                        logger.info("Forced status update again")
-                
-                self._update_session_history(session_id, message, ai_message)
-                logger.info(f"Final response to user: {ai_message}")
-                return ai_message
-
-            # If limit options prompt is present in output, update status and collection step
-            if limit_options_prompt_in_output:
-                logger.info(f"Limit options prompt detected in agent output, updating session status for {session_id}")
-                SessionManager.update_session_data_field(session_id, "status", "collecting_additional_details")
-                SessionManager.update_session_data_field(session_id, "data.collection_step", "limit_options")
-                updated_session = SessionManager.get_session_from_db(session_id)
-                if not updated_session.get("data", {}).get("additional_details"):
-                    SessionManager.update_session_data_field(session_id, "data.additional_details", {})
-                logger.info(f"Session {session_id} marked as collecting_additional_details (from limit_options output branch)")
-                
-                self._update_session_history(session_id, message, ai_message)
-                logger.info(f"Final response to user: {ai_message}")
-                return ai_message
-
-            # Final check: if the response contains employment type prompt, ensure status is updated
-            if is_employment_type_prompt(ai_message) and current_status != "collecting_additional_details":
-                logger.warning(f"Employment type prompt in final response but status not updated. Forcing update.")
-                SessionManager.update_session_data_field(session_id, "status", "collecting_additional_details")
-                SessionManager.update_session_data_field(session_id, "data.collection_step", "employment_type")
-                if not session.get("data", {}).get("additional_details"):
-                    SessionManager.update_session_data_field(session_id, "data.additional_details", {})
-                logger.info(f"Forced status update to collecting_additional_details")
-            
-            # Check if user is trying to make corrections before application completion
-            correction_keywords = ["change", "correct", "update", "modify", "edit", "wrong", "mistake"]
-            is_correction_request = any(keyword in message.lower() for keyword in correction_keywords)
-            
-            
-            # Otherwise, just update the conversation history and return
-            self._update_session_history(session_id, message, ai_message)
-            logger.info(f"Final response to user: {ai_message}")
+                    logger.error("Error forcing bureau decision tool call: %s", e)
+
+            # Switch to additional details collection if the reply asks its first question
+            collection_step = None
+            if _is_employment_type_prompt(ai_message):
+                logger.info("Employment type prompt detected, updating session status for %s", session_id)
+                collection_step = "employment_type"
+            elif _is_limit_options_prompt(ai_message):
+                logger.info("Limit options prompt detected, updating session status for %s", session_id)
+                collection_step = "limit_options"
+
+            self._update_session_history(session_id, message, ai_message, collection_step=collection_step)
+            logger.info("Final response to user: %s", ai_message)
             return ai_message
         
         except Exception as e:
-            logger.error(f"Error processing message: {e}")
+            logger.error("Error processing message: %s", e)
             return "Please start a new chat session to continue our conversation."
         
+    async def arun(self, session_id: str, message: str) -> str:
+        """
+        Async entry point for processing a user message within a session.
+        Runs the blocking agent loop (LLM, CarePay API and database calls) in a
+        worker thread so ASGI callers do not block the event loop. At most
+        AGENT_MAX_CONCURRENT_RUNS turns (default 8) run at once; the rest wait.
+
+        Args:
+            session_id: Session identifier
+            message: User message
+
+        Returns:
+            Agent response
+        """
+        async with _arun_semaphore:
+            return await sync_to_async(self.run, thread_sensitive=False)(session_id, message)
+
+    def _get_agent(self, use_fast_llm: bool, forced_tool: Optional[str]) -> Any:
+        """
+        Return the agent runnable for a model and forced tool, building it on first use
+
+        Args:
+            use_fast_llm: Whether to use the smaller model
+            forced_tool: Tool to force on the first step, if any
+
+        Returns:
+            Agent runnable shared by all sessions
+        """
+        cache_key = ("fast" if use_fast_llm else "main", forced_tool)
+        with self._agent_cache_lock:
+            agent = self._agent_cache.get(cache_key)
+        if agent is not None:
+            return agent
+
+        # Only the tool schemas reach the model, so tools bound to no session will do
+        schema_tools = self._create_session_aware_tools(None)
+        llm = self.llm_fast if use_fast_llm else self.llm
+
+        # Tool-calling agent lets the model request independent tools in a single turn
+        agent = create_openai_tools_agent(llm, schema_tools, _PROMPT)
+        if forced_tool:
+            forced_llm = llm.bind(tool_choice={"type": "function", "function": {"name": forced_tool}})
+            agent = RunnableMultiActionAgent(runnable=RunnableBranch(
+                (lambda x: not x["intermediate_steps"], create_openai_tools_agent(forced_llm, schema_tools, _PROMPT)),
+                agent,
+            ))
+
+        with self._agent_cache_lock:
+            return self._agent_cache.setdefault(cache_key, agent)
+
+    def _get_session_executor(self, session_id: str, use_fast_llm: bool, forced_tool: Optional[str]) -> AgentExecutor:
+        """
+        Build the agent executor for one turn: the shared agent runnable with the
+        session's tools
+
+        Args:
+            session_id: Session identifier
+            use_fast_llm: Whether to use the smaller model for this turn
+            forced_tool: Tool to force on the first step, if any
+
+        Returns:
+            AgentExecutor bound to the session's tools
+        """
+        session_tools = self._create_session_aware_tools(session_id)
+        return AgentExecutor(
+            agent=self._get_agent(use_fast_llm, forced_tool),
+            tools=session_tools,
+            verbose=True,
+            # The deterministic chains run inside single tools, so a normal turn
+            # needs only a handful of iterations; cap runaway loops
+            max_iterations=12,
+            max_execution_time=180,
+            handle_parsing_errors=True,
+            return_intermediate_steps=True,  # Ensure we get intermediate steps
+        )
+
     def _convert_to_langchain_messages(self, history: List[Dict[str, Any]]) -> List:
         """
         Convert serializable history to LangChain message objects
@@ -1247,23 +2222,18 @@ CRITICAL CONTEXT AWARENESS RULES:
         Returns:
             List of LangChain message objects
         """
-        langchain_messages = []
-        for msg in history:
-            if isinstance(msg, dict):
-                msg_type = msg.get('type', 'HumanMessage')
-                content = msg.get('content', '')
-                if msg_type == 'AIMessage':
-                    langchain_messages.append(AIMessage(content=content))
-                else:
-                    langchain_messages.append(HumanMessage(content=content))
-            elif hasattr(msg, 'content'):  # Already a LangChain message object
-                langchain_messages.append(msg)
-            else:
-                # Fallback for any other format
-                langchain_messages.append(HumanMessage(content=str(msg)))
-        return langchain_messages
+        return [
+            (AIMessage if msg.get('type') == 'AIMessage' else HumanMessage)(content=msg.get('content', ''))
+            if isinstance(msg, dict)
+            # Already a LangChain message object
+            else msg if hasattr(msg, 'content')
+            # Fallback for any other format
+            else HumanMessage(content=str(msg))
+            for msg in history
+        ]
 
-    def _update_session_history(self, session_id: str, user_message: str, ai_message: str) -> None:
+    def _update_session_history(self, session_id: str, user_message: str, ai_message: str,
+                                collection_step: Optional[str] = None) -> None:
         """
         Efficiently update session history with new messages and track progress
         
@@ -1271,27 +2241,28 @@ CRITICAL CONTEXT AWARENESS RULES:
             session_id: Session identifier
             user_message: User's message
             ai_message: AI's response
+            collection_step: If set, also move the session into additional details
+                collection at this step
         """
         try:
-            # Get current history
-            session = SessionManager.get_session_from_db(session_id)
-            if not session:
-                return
-            
-            current_history = session.get("history", [])
-            
-            # Add new messages to history
-            current_history.append({
-                "type": "HumanMessage",
-                "content": user_message
-            })
-            current_history.append({
-                "type": "AIMessage",
-                "content": ai_message
-            })
+            # Append the new messages without rewriting the stored history
+            SessionManager.append_history(session_id, [
+                {"type": "HumanMessage", "content": user_message},
+                {"type": "AIMessage", "content": ai_message},
+            ])
             
-            # Update history in database (single operation)
-            SessionManager.update_session_data_field(session_id, "history", current_history)
+            if collection_step:
+                session = SessionManager.get_session_from_db(session_id)
+                if not session:
+                    return
+                updates = {
+                    "status": "collecting_additional_details",
+                    "data.collection_step": collection_step,
+                }
+                if not _dig(session, "data", "additional_details"):
+                    updates["data.additional_details"] = {}
+                SessionManager.update_session_data_fields(session_id, updates)
+                logger.info("Session %s marked as collecting_additional_details at step %s", session_id, collection_step)
             
             # Update conversation progress tracking
             self._update_conversation_progress(session_id, user_message, ai_message)
@@ -1299,10 +2270,10 @@ CRITICAL CONTEXT AWARENESS RULES:
             # Validate context consistency to prevent hallucination
             is_consistent = self._validate_context_consistency(session_id, user_message, ai_message)
             if not is_consistent:
-                logger.warning(f"Context inconsistency detected in session {session_id}. AI response may need review.")
+                logger.warning("Context inconsistency detected in session %s. AI response may need review.", session_id)
             
         except Exception as e:
-            logger.error(f"Error updating session history: {e}")
+            logger.error("Error updating session history: %s", e)
 
     # def get_session_data(self, session_id: str = None) -> str:
     #     """
@@ -1385,7 +2356,7 @@ CRITICAL CONTEXT AWARENESS RULES:
             }
             
             # Convert to JSON string and call the original method
-            input_str = json.dumps(data)
+            input_str = _json_dumps(data)
             return self.store_user_data(input_str, session_id)
             
         except Exception as e:
@@ -1403,7 +2374,7 @@ CRITICAL CONTEXT AWARENESS RULES:
             Confirmation message
         """
         try:
-            data = json.loads(input_str)
+            data = orjson.loads(input_str)
             
             if not session_id:
                 return "Session ID not found or invalid"
@@ -1422,8 +2393,7 @@ CRITICAL CONTEXT AWARENESS RULES:
             if treatment_cost is not None:
                 try:
                     # Convert to float, handling various formats (₹, commas, etc.)
-                    cost_str = str(treatment_cost).replace('₹', '').replace(',', '').strip()
-                    cost_value = float(cost_str)
+                    cost_value = float(str(treatment_cost).translate(_AMOUNT_STRIP))
                     
                     if cost_value < 3000:
                         return f"I understand your treatment cost is ₹{cost_value:,.0f}. Currently, I can only process loan applications for treatments costing ₹3,000 or more. Please let me know if your treatment cost is ₹3,000 or above, and I'll be happy to help you with the loan application process."
@@ -1431,27 +2401,27 @@ CRITICAL CONTEXT AWARENESS RULES:
                         return f"I understand your treatment cost is ₹{cost_value:,.0f}. Currently, I can only process loan applications for treatments costing up to ₹10,00,000. Please let me know if your treatment cost is ₹10,00,000 or below, and I'll be happy to help you with the loan application process."
                 except (ValueError, TypeError):
                     # If we can't parse the cost, continue with normal flow
-                    logger.warning(f"Could not parse treatment cost: {treatment_cost}")
+                    logger.warning("Could not parse treatment cost: %s", treatment_cost)
             
+            updates = {}
             # Check if user_id is present in the data
             if 'user_id' in data or 'userId' in data:
-                user_id = data.get('user_id') or data.get('userId')
-                # Store userId using update_session_data_field
-                SessionManager.update_session_data_field(session_id, "data.userId", user_id)
+                updates["data.userId"] = data.get('user_id') or data.get('userId')
             
             # Store each piece of user data systematically
             for key, value in data.items():
                 if key not in ['user_id']:  # Skip user_id as we handle it above as userId
-                    SessionManager.update_session_data_field(session_id, f"data.{key}", value)
+                    updates[f"data.{key}"] = value
             
             # Also store the raw input for reference
-            SessionManager.update_session_data_field(session_id, "data.user_input.store_user_data", data)
+            updates["data.user_input.store_user_data"] = data
+            SessionManager.update_session_data_fields(session_id, updates)
             
-            logger.info(f"User data stored systematically in session {session_id}: {data}")
+            logger.info("User data stored systematically in session %s: %s", session_id, data)
             
             return f"Data successfully stored in session {session_id}"
         except Exception as e:
-            logger.error(f"Error storing user data: {e}")
+            logger.error("Error storing user data: %s", e)
             return f"Error storing data: {str(e)}"
         
     def get_user_id_from_phone_number(self, phone_number: str, session_id: str) -> str:
@@ -1467,7 +2437,7 @@ CRITICAL CONTEXT AWARENESS RULES:
         """
         try:
             result = self.api_client.get_user_id_from_phone_number(phone_number)
-            logger.info(f"API response from get_user_id_from_phone_number: {result}")
+            logger.info("API response from get_user_id_from_phone_number: %s", result)
             
             # Store the complete API response in session data
             if session_id:
@@ -1482,41 +2452,41 @@ CRITICAL CONTEXT AWARENESS RULES:
                 if isinstance(data, str):
                     # First, try to parse as JSON (for the second response format with userId and prefill_data)
                     try:
-                        parsed_data = json.loads(data)
+                        parsed_data = orjson.loads(data)
                         user_id_from_api = parsed_data.get("userId")
-                        logger.info(f"Successfully parsed JSON data and extracted clean userId: {user_id_from_api}")
+                        logger.info("Successfully parsed JSON data and extracted clean userId: %s", user_id_from_api)
                     except json.JSONDecodeError as e:
-                        logger.warning(f"Could not parse 'data' field as JSON: {e}")
+                        logger.warning("Could not parse 'data' field as JSON: %s", e)
                         # Try to extract userId using regex as fallback for incomplete JSON
-                        userId_match = re.search(r'"userId"\s*:\s*"([^"]+)"', data)
+                        userId_match = _USERID_RE.search(data)
                         if userId_match:
                             user_id_from_api = userId_match.group(1)
-                            logger.info(f"Extracted userId using regex fallback: {user_id_from_api}")
+                            logger.info("Extracted userId using regex fallback: %s", user_id_from_api)
                         else:
                             # If regex also fails, treat it as a direct userId string (first response format)
                             if data and data.strip():
                                 user_id_from_api = data.strip()
-                                logger.info(f"Treating data as direct clean userId string: {user_id_from_api}")
+                                logger.info("Treating data as direct clean userId string: %s", user_id_from_api)
                             else:
                                 user_id_from_api = None
                 elif isinstance(data, dict):
                     user_id_from_api = data.get("userId")
-                    logger.info(f"Extracted userId from dict data: {user_id_from_api}")
+                    logger.info("Extracted userId from dict data: %s", user_id_from_api)
                 else:
                     user_id_from_api = None
-                    logger.warning(f"Unexpected data type: {type(data).__name__}")
+                    logger.warning("Unexpected data type: %s", type(data).__name__)
                 
                 # Ensure extracted_user_id is a non-empty string and validate it's a clean userId
                 if isinstance(user_id_from_api, str) and user_id_from_api:
                     # Additional validation to ensure we never save a JSON string as userId
                     if user_id_from_api.startswith('{') or user_id_from_api.startswith('"'):
-                        logger.error(f"Attempted to save JSON string as userId: {user_id_from_api}")
+                        logger.error("Attempted to save JSON string as userId: %s", user_id_from_api)
                         user_id_from_api = None
                     else:
                         if session_id:
                             # Store clean userId in session.data.userId
                             SessionManager.update_session_data_field(session_id, "data.userId", user_id_from_api)
-                            logger.info(f"Stored clean userId '{user_id_from_api}' in session data for session {session_id}")
+                            logger.info("Stored clean userId '%s' in session data for session %s", user_id_from_api, session_id)
                 
                 if not user_id_from_api:
                     logger.warning(
@@ -1527,16 +2497,31 @@ CRITICAL CONTEXT AWARENESS RULES:
             
             return session_id
         except Exception as e:
-            logger.error(f"Error getting user ID from phone number: {e}")
+            logger.error("Error getting user ID from phone number: %s", e)
             return f"Error getting user ID from phone number: {str(e)}"
         
-    def get_prefill_data(self, user_id: str = None, session_id: str = None) -> str:
+    def _resolve(self, session_id: Optional[str]) -> Tuple[Optional[str], Dict[str, Any]]:
+        """
+        Load the session once and return the userId with the session data dict
+        
+        Args:
+            session_id: Session identifier
+            
+        Returns:
+            Tuple of (userId or None, session data; empty if the session is missing)
+        """
+        session = SessionManager.get_session_from_db(session_id) if session_id else None
+        session_data = (session or {}).get("data") or {}
+        return session_data.get("userId"), session_data
+
+    def get_prefill_data(self, user_id: str = None, session_id: str = None, force_refresh: bool = False) -> str:
         """
         Get prefilled user data
         
         Args:
             user_id: User identifier, optional if available in session
             session_id: Session identifier
+            force_refresh: Call the API even if a recent successful response is stored
             
         Returns:
             Prefilled data as JSON string
@@ -1545,30 +2530,26 @@ CRITICAL CONTEXT AWARENESS RULES:
             if not session_id:
                 return "Session ID is required"
             
-            session = SessionManager.get_session_from_db(session_id)
-            if not session:
-                return "Session not found"
-            
-            user_id = session.get("data", {}).get("userId")
-            
+            user_id, session_data = self._resolve(session_id)
             if not user_id:
                 return "User ID is required to get prefill data"
             
-            result = self.api_client.get_prefill_data(user_id)
-            # Store the complete API response in session data
-            if session_id:
-                SessionManager.update_session_data_field(session_id, "data.api_responses.get_prefill_data", result)
+            result = None if force_refresh else _replayable_response(session_data, "get_prefill_data")
+            if result is not None:
+                logger.info(f"Using stored get_prefill_data response for session {session_id}")
+            else:
+                result = self.api_client.get_prefill_data(user_id)
+                # Store the complete API response in session data
+                SessionManager.update_session_data_fields(session_id, {
+                    "data.api_responses.get_prefill_data": result,
+                    "data.api_response_times.get_prefill_data": time.time(),
+                })
             
             # Check if the API call failed with 500 error
             if result.get("status") == 500:
                 logger.warning(f"phoneToPrefill API failed with 500 error for user_id: {user_id}")
                 # Return a specific message asking for Aadhaar upload
-                return json.dumps({
-                    "status": 500,
-                    "error": "phoneToPrefill_failed",
-                    "message": "Follow workflow B. Please provide 6-digit pincode of Patient's Current address: ",
-                    "requires_pincode_collection": True
-                })
+                return _ERR_PREFILL_FAILED
             
             # Check if the API call was successful but returned empty data
             if result.get("status") == 200:
@@ -1597,44 +2578,43 @@ CRITICAL CONTEXT AWARENESS RULES:
                 if is_empty:
                     logger.warning(f"phoneToPrefill API returned empty data for user_id: {user_id}")
                     # Return a specific message asking for Aadhaar upload
-                    return json.dumps({
-                        "status": 500,
-                        "error": "phoneToPrefill_empty_data",
-                        "message": "Follow workflow B. Please provide 6-digit pincode of Patient's Current address:",
-                        "requires_pincode_collection": True
-                    })
-            
-            return json.dumps(result)
+                    return _ERR_PREFILL_EMPTY
+            
+            return _api_response_json(result)
         except Exception as e:
             logger.error(f"Error getting prefill data: {e}")
             return f"Error getting prefill data: {str(e)}"
         
             
 
-    def get_employment_verification(self, session_id: str) -> str:
+    def get_employment_verification(self, session_id: str, force_refresh: bool = False) -> str:
         """
         Get employment verification data
         
         Args:
             session_id: Session identifier
+            force_refresh: Call the API even if a recent successful response is stored
             
         Returns:
             Employment verification data as JSON string
         """
         try:
-
-            # If user_id is not provided, try to get from session
-            if session_id:
-                session = SessionManager.get_session_from_db(session_id)
-                if session and session.get("data", {}).get("userId"):
-                    user_id = session["data"]["userId"]
-                    
-                
+            user_id, session_data = self._resolve(session_id)
+            if not user_id:
+                return "User ID is required for employment verification"
+            if not force_refresh:
+                cached = _replayable_response(session_data, "get_employment_verification")
+                if cached is not None:
+                    logger.info(f"Using stored get_employment_verification response for session {session_id}")
+                    return _json_dumps(cached)
+            
             result = self.api_client.get_employment_verification(user_id)
             
-            # Store the complete API response in session data
-            if session_id:
-                SessionManager.update_session_data_field(session_id, "data.api_responses.get_employment_verification", result)
+            # Store the complete API response, plus the employment data extracted below
+            updates = {
+                "data.api_responses.get_employment_verification": result,
+                "data.api_response_times.get_employment_verification": time.time(),
+            }
             
             # If successful, store important employment data in session
             if result.get("status") == 200 and session_id:
@@ -1642,6 +2622,12 @@ CRITICAL CONTEXT AWARENESS RULES:
                     data = result.get("data", {})
                     employment_data = {}
                     
+                    # Pull the employer name out of the raw responseBody once; it is the only
+                    # field later steps need, so the rest of the body is not kept
+                    response_body = data.get("responseBody")
+                    if response_body:
+                        updates["data.employment_establishment_name"] = _employer_establishment_name({}, response_body)
+                    
                     # Determine employment type
                     if "employmentSummary" in data:
                         summary = data["employmentSummary"]
@@ -1654,14 +2640,16 @@ CRITICAL CONTEXT AWARENESS RULES:
                         if "establishment_name" in employer_data:
                             employment_data["organizationName"] = employer_data["establishment_name"]
                     
-                    # Store in session using update_session_data_field
                     if employment_data:
-                        SessionManager.update_session_data_field(session_id, "data.employment_data", employment_data)
+                        updates["data.employment_data"] = employment_data
                         logger.info(f"Stored employment data in session: {employment_data}")
                 except Exception as e:
                     logger.warning(f"Error processing employment data: {e}")
             
-            return json.dumps(result)
+            if session_id:
+                SessionManager.update_session_data_fields(session_id, updates)
+            
+            return _api_response_json(result)
         except Exception as e:
             logger.error(f"Error getting employment verification: {e}")
             return f"Error getting employment verification: {str(e)}"
@@ -1682,14 +2670,9 @@ CRITICAL CONTEXT AWARENESS RULES:
             if not session_id:
                 return "Session ID is required"
 
-            session = SessionManager.get_session_from_db(session_id)
-            if not session or not session.get("data", {}):
+            user_id, session_data = self._resolve(session_id)
+            if not session_data:
                 return "Session data not found"
-
-            session_data = session["data"]
-
-            # Get userId from session data
-            user_id = session_data.get("userId")
             if not user_id:
                 return "User ID is required"
 
@@ -1712,36 +2695,33 @@ CRITICAL CONTEXT AWARENESS RULES:
             else:
                 return "Phone number is required"
 
-            # Add other possible fields from session data if present - comprehensive mapping
-            field_mappings = {
-                "panCard": ["panCard", "pan", "panNo", "panNumber", "pan_card", "pan_number"],
-                "gender": ["gender", "sex"],
-                "dateOfBirth": ["dateOfBirth", "dob", "birthDate", "birth_date", "date_of_birth"],
-                "emailId": ["emailId", "email", "email_id", "emailAddress", "email_address"],
-                "firstName": ["firstName", "name", "first_name", "fullName", "full_name", "givenName", "given_name"],
-                "treatmentCost": ["treatmentCost", "treatment_cost", "loanAmount", "loan_amount", "amount"],
-                "monthlyIncome": ["monthlyIncome", "monthly_income", "income", "salary", "netTakeHomeSalary", "net_take_home_salary"]
-            }
-            
-            # Apply field mappings
-            for target_field, source_fields in field_mappings.items():
-                for source_field in source_fields:
-                    if session_data.get(source_field) is not None:
-                        data[target_field] = session_data.get(source_field)
-                        break  # Use first found value
-
-            # Store the data being sent to the API
-            SessionManager.update_session_data_field(session_id, "data.api_requests.save_basic_details", {
+            # Add other possible fields from session data if present - comprehensive mapping.
+            # Only keys present in both are visited; per target the highest-priority source wins.
+            best_sources = {}
+            for source_field in session_data.keys() & _BASIC_SOURCE_TO_TARGET.keys():
+                value = session_data[source_field]
+                if value is None:
+                    continue
+                target_field, rank = _BASIC_SOURCE_TO_TARGET[source_field]
+                if target_field not in best_sources or rank < best_sources[target_field][0]:
+                    best_sources[target_field] = (rank, value)
+            for target_field, (_, value) in best_sources.items():
+                data[target_field] = value
+
+            request_record = {
                 "user_id": user_id,
                 "data": data.copy()
-            })
+            }
 
             result = self.api_client.save_basic_details(user_id, data)
 
-            # Store the API response
-            SessionManager.update_session_data_field(session_id, "data.api_responses.save_basic_details", result)
+            # Record the data sent to the API and its response (audit only)
+            SessionManager.update_session_data_fields(session_id, {
+                "data.api_requests.save_basic_details": request_record,
+                "data.api_responses.save_basic_details": result,
+            })
 
-            return json.dumps(result)
+            return _api_response_json(result)
         except Exception as e:
             logger.error(f"Error saving basic details: {e}")
             return f"Error saving basic details: {str(e)}"
@@ -1758,24 +2738,14 @@ CRITICAL CONTEXT AWARENESS RULES:
             Save result as JSON string
         """
         try:
-           
-            user_id = None
             data = {}
-            # Try to get user ID from session if not provided in input
-            if session_id:
-                session = SessionManager.get_session_from_db(session_id)
-                if session and session.get("data", {}).get("userId"):
-                    user_id = session["data"]["userId"]
-
+            # Read the session once for user ID, employment verification and income
+            user_id, session_data = self._resolve(session_id)
             if not user_id:
                 return "User ID is required"
 
             # Get employment verification API response from session
-            employment_verification = None
-            if session_id:
-                session = SessionManager.get_session_from_db(session_id)
-                if session:
-                    employment_verification = session.get("data", {}).get("api_responses", {}).get("get_employment_verification")
+            employment_verification = _dig(session_data, "api_responses", "get_employment_verification")
 
             # Default to SELF_EMPLOYED
             employment_type = "SELF_EMPLOYED"
@@ -1789,19 +2759,7 @@ CRITICAL CONTEXT AWARENESS RULES:
                     data_field = employment_verification.get("data", {})
                     response_body = data_field.get("responseBody")
                     if response_body:
-                        try:
-                            # responseBody is a JSON string, so parse it
-                            response_json = json.loads(response_body)
-                            # Traverse to result > result > summary > recentEmployerData > establishmentName
-                            result_outer = response_json.get("result", {})
-                            result_inner = result_outer.get("result", {})
-                            summary = result_inner.get("summary", {})
-                            recent_employer_data = summary.get("recentEmployerData", {})
-                            establishment_name = recent_employer_data.get("establishmentName")
-                            if establishment_name:
-                                organization_name = establishment_name
-                        except Exception as parse_exc:
-                            logger.warning(f"Could not parse establishmentName from employment_verification: {parse_exc}")
+                        organization_name = _employer_establishment_name(session_data, response_body)
 
             # Set employmentType in data
             data["employmentType"] = employment_type
@@ -1809,35 +2767,29 @@ CRITICAL CONTEXT AWARENESS RULES:
                 data["organizationName"] = organization_name
 
             # Get monthly income from session data if not in the input
-            if ('netTakeHomeSalary' not in data or 'monthlyFamilyIncome' not in data) and session_id:
-                session = SessionManager.get_session_from_db(session_id)
-                if session and 'data' in session:
-                    session_data = session['data']
-                    if session_data.get('monthlyIncome'):
-                        income = session_data.get('monthlyIncome')
-                        if 'netTakeHomeSalary' not in data:
-                            data['netTakeHomeSalary'] = income
-                        if 'monthlyFamilyIncome' not in data:
-                            data['monthlyFamilyIncome'] = income
+            income = session_data.get('monthlyIncome')
+            if income:
+                data.setdefault('netTakeHomeSalary', income)
+                data.setdefault('monthlyFamilyIncome', income)
 
             # Make sure we have the form status
             if 'formStatus' not in data:
                 data['formStatus'] = "Employment"
 
-            # Store the data being sent to the API
-            if session_id:
-                SessionManager.update_session_data_field(session_id, "data.api_requests.save_employment_details", {
-                    "user_id": user_id,
-                    "data": data.copy()
-                })
+            request_record = {
+                "user_id": user_id,
+                "data": data.copy()
+            }
 
             result = self.api_client.save_employment_details(user_id, data)
 
-            # Store the API response
-            if session_id:
-                SessionManager.update_session_data_field(session_id, "data.api_responses.save_employment_details", result)
+            # Record the data sent to the API and its response (audit only)
+            SessionManager.update_session_data_fields(session_id, {
+                "data.api_requests.save_employment_details": request_record,
+                "data.api_responses.save_employment_details": result,
+            })
 
-            return json.dumps(result)
+            return _api_response_json(result)
         except Exception as e:
             logger.error(f"Error saving employment details: {e}")
             return f"Error saving employment details: {str(e)}"
@@ -1864,7 +2816,7 @@ CRITICAL CONTEXT AWARENESS RULES:
             }
             
             # Convert to JSON string and call the original method
-            input_str = json.dumps(data)
+            input_str = _json_dumps(data)
             return self.save_loan_details(input_str, session_id)
             
         except Exception as e:
@@ -1882,7 +2834,7 @@ CRITICAL CONTEXT AWARENESS RULES:
             Save result as JSON string
         """
         try:
-            data = json.loads(input_str)
+            data = orjson.loads(input_str)
             user_id = data.get("userId")
             name = data.get("fullName")
             loan_amount = data.get("treatmentCost")
@@ -1891,37 +2843,37 @@ CRITICAL CONTEXT AWARENESS RULES:
             doctor_id = data.get("doctorId") or data.get("doctor_id")
             doctor_name = data.get("doctorName") or data.get("doctor_name")
 
-            if session_id:
-                session = SessionManager.get_session_from_db(session_id)
-                if session and "data" in session:
-                    session_data = session["data"]
-                    # Try to get doctor_id and doctor_name from session data if not already set
-                    if not doctor_id:
-                        doctor_id = session_data.get("doctorId") or session_data.get("doctor_id")
-                    if not doctor_name:
-                        doctor_name = session_data.get("doctorName") or session_data.get("doctor_name")
+            if session_id and not (doctor_id and doctor_name):
+                _, session_data = self._resolve(session_id)
+                # Try to get doctor_id and doctor_name from session data if not already set
+                if not doctor_id:
+                    doctor_id = session_data.get("doctorId") or session_data.get("doctor_id")
+                if not doctor_name:
+                    doctor_name = session_data.get("doctorName") or session_data.get("doctor_name")
 
             logger.info(f"Retrieved doctor_id {doctor_id} and doctor_name {doctor_name} from session for loan details")
 
             if not user_id or not name or not loan_amount:
                 return "User ID, name, and loan amount are required"
 
-            # Store the data being sent to the API
-            SessionManager.update_session_data_field(session_id, "data.api_requests.save_loan_details", {
+            request_record = {
                 "user_id": user_id,
                 "name": name,
                 "loan_amount": loan_amount,
                 "doctor_name": doctor_name,
                 "doctor_id": doctor_id
-            })
+            }
 
             result = self.api_client.save_loan_details(user_id, name, loan_amount, doctor_name, doctor_id)
             
-            # Store the API response
+            # Store the data sent to the API and its response in one write
             if session_id:
-                SessionManager.update_session_data_field(session_id, "data.api_responses.save_loan_details", result)
+                SessionManager.update_session_data_fields(session_id, {
+                    "data.api_requests.save_loan_details": request_record,
+                    "data.api_responses.save_loan_details": result,
+                })
             
-            return json.dumps(result)
+            return _api_response_json(result)
         except Exception as e:
             logger.error(f"Error saving loan details: {e}")
             return f"Error saving loan details: {str(e)}"
@@ -1944,19 +2896,36 @@ CRITICAL CONTEXT AWARENESS RULES:
 
             # First try to get data from session
             if session_id:
-                session = SessionManager.get_session_from_db(session_id)
-                logger.info(f"Session retrieved: {session is not None}")
+                _, session_data = self._resolve(session_id)
                 
-                if session and "data" in session:
-                    session_data = session["data"]
-                    logger.info(f"Session data keys: {list(session_data.keys())}")
+                if session_data:
+                    api_responses = session_data.get("api_responses") or {}
+                    logger.debug("Session data keys: %s", list(session_data))
                     
                     # Check if we already have bureau decision in session
-                    if "api_responses" in session_data and "get_bureau_decision" in session_data["api_responses"]:
-                        existing_decision = session_data["api_responses"]["get_bureau_decision"]
+                    existing_decision = api_responses.get("get_bureau_decision")
+                    if existing_decision:
                         if existing_decision.get("status") == 200:
+                            # The formatted reply is reused only while the name, treatment
+                            # cost and doctor it was built from are unchanged
+                            reply_hash = _bureau_reply_input_hash(session_data)
+                            formatted_response = session_data.get("bureau_decision_formatted_response")
+                            if formatted_response and session_data.get("bureau_decision_reply_input_hash") == reply_hash:
+                                logger.info(f"Using existing formatted bureau decision from session")
+                                return formatted_response
+                            bureau_result = session_data.get("bureau_decision_details")
+                            if isinstance(bureau_result, dict):
+                                # Rebuild the reply from the stored decision without calling the API again
+                                formatted_response = self._format_bureau_decision_response(bureau_result, session_id)
+                                if formatted_response != _BUREAU_FORMAT_ERROR:
+                                    SessionManager.update_session_data_fields(session_id, {
+                                        "data.bureau_decision_formatted_response": formatted_response,
+                                        "data.bureau_decision_reply_input_hash": reply_hash,
+                                    })
+                                    logger.info(f"Rebuilt formatted bureau decision from session")
+                                    return formatted_response
                             logger.info(f"Using existing bureau decision from session")
-                            return json.dumps(existing_decision)
+                            return _json_dumps(existing_decision)
                     
                     # Try to get loan_id from different possible locations in session data
                     if "loanId" in session_data:
@@ -1965,84 +2934,77 @@ CRITICAL CONTEXT AWARENESS RULES:
 
                     
                     # Also try to get from save_loan_details response
-                    if not loan_id and "api_responses" in session_data and "save_loan_details" in session_data["api_responses"]:
-                        save_loan_response = session_data["api_responses"]["save_loan_details"]
-                        logger.info(f"save_loan_details response: {save_loan_response}")
+                    if not loan_id and "save_loan_details" in api_responses:
+                        save_loan_response = api_responses["save_loan_details"]
+                        logger.debug("save_loan_details response: %s", save_loan_response)
                         if isinstance(save_loan_response, dict) and save_loan_response.get("status") == 200:
                             if "data" in save_loan_response and isinstance(save_loan_response["data"], dict):
                                 loan_id = save_loan_response["data"].get("loanId")
                                 logger.info(f"Found loan_id in save_loan_details response: {loan_id}")
                     
                     # Debug: Show what we have in api_responses
-                    if "api_responses" in session_data:
-                        logger.info(f"Available API responses: {list(session_data['api_responses'].keys())}")
+                    if api_responses:
+                        logger.debug("Available API responses: %s", list(api_responses))
                 else:
                     logger.warning(f"No session data found for session_id: {session_id}")
 
 
             # Validate required parameters
-            logger.info(f"Final loan_id before validation: '{loan_id}' (type: {type(loan_id)})")
-            
-            if not loan_id:
-                logger.error("Loan ID is missing for bureau decision")
-                logger.error(f"loan_id value: '{loan_id}', type: {type(loan_id)}")
-                return json.dumps({"status": 400, "error": "Loan ID is required"})
-                
-            # Additional validation for loan_id
-            if not isinstance(loan_id, str):
-                logger.error(f"loan_id is not a string: {type(loan_id)}")
-                return json.dumps({"status": 400, "error": "loan_id must be a string"})
-                
-            if loan_id.strip() == "":
-                logger.error(f"loan_id is empty after stripping: '{loan_id}'")
-                return json.dumps({"status": 400, "error": "loan_id is empty"})
+            invalid_reason = _validate_id(loan_id)
+            if invalid_reason:
+                logger.error("Loan ID for bureau decision is %s: %r", invalid_reason, loan_id)
+                return _ERR_LOAN_ID_REQUIRED
                 
-            logger.info(f"Making bureau decision API call with loan_id: {loan_id}")
-            logger.info(f"loan_id type: {type(loan_id)}, loan_id value: '{loan_id}'")
+            logger.info("Making bureau decision API call with loan_id: %s", loan_id)
             
             # Make the API call
             try:
                 result = self.api_client.get_bureau_decision(loan_id)
-                logger.info(f"API call successful, result type: {type(result)}")
             except Exception as api_error:
-                logger.error(f"API call failed with error: {api_error}")
-                logger.error(f"loan_id passed to API: '{loan_id}' (type: {type(loan_id)})")
+                logger.error("Bureau decision API call failed for loan_id %r: %s", loan_id, api_error)
                 raise
             
-            # Store the complete API response in session data
-            if session_id:
-                SessionManager.update_session_data_field(session_id, "data.api_responses.get_bureau_decision", result)
-            
-            # Log the raw API response for debugging
-            logger.info(f"Bureau decision API response for loan ID {loan_id}: {json.dumps(result)}")
+            # Log the raw API response for debugging (serialized only when DEBUG is enabled)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Bureau decision API response for loan ID %s: %s", loan_id, _json_dumps(result))
             
             # Process result to extract and format eligible EMI information
             if isinstance(result, dict) and result.get("status") == 200:
+                # Normalize plan amounts before the response is stored, so every later
+                # read of it sees string amounts (the 200 path returns formatted text,
+                # never the upstream bytes, so editing in place is safe)
+                _normalize_emi_plans(result)
                 bureau_result = self.extract_bureau_decision_details(result, session_id)
-                logger.info(f"Bureau result: {bureau_result}")
-                
-                # Save the extracted bureau decision details to session data
-                if session_id:
-                    SessionManager.update_session_data_field(session_id, "data.bureau_decision_details", bureau_result)
-                    logger.info(f"Session {session_id}: Saved bureau decision details to session data")
+                logger.debug("Bureau result: %s", bureau_result)
                 
                 # Format the response using the new function
                 formatted_response = self._format_bureau_decision_response(bureau_result, session_id)
-                logger.info(f"Formatted response: {formatted_response}")
+                logger.debug("Formatted response: %s", formatted_response)
                 
-                # Ensure we always return a string
-                if formatted_response is None:
-                    logger.error("Formatted response is None, returning default message")
-                    return "There was an error processing the loan decision. Please try again."
+                # Save the complete API response, the extracted details and the formatted
+                # reply in one write, so a repeat call can return the reply directly
+                if session_id:
+                    updates = {
+                        "data.api_responses.get_bureau_decision": result,
+                        "data.bureau_decision_details": bureau_result,
+                    }
+                    if formatted_response != _BUREAU_FORMAT_ERROR:
+                        updates["data.bureau_decision_formatted_response"] = formatted_response
+                        updates["data.bureau_decision_reply_input_hash"] = _bureau_reply_input_hash(session_data or {})
+                    SessionManager.update_session_data_fields(session_id, updates)
+                    logger.info(f"Session {session_id}: Saved bureau decision details to session data")
                 
                 return formatted_response
             
             # Save the raw result as bureau decision details even if it's not a successful response
             if session_id:
-                SessionManager.update_session_data_field(session_id, "data.bureau_decision_details", result)
+                SessionManager.update_session_data_fields(session_id, {
+                    "data.api_responses.get_bureau_decision": result,
+                    "data.bureau_decision_details": result,
+                })
                 logger.info(f"Session {session_id}: Saved raw bureau decision result to session data")
             
-            return json.dumps(result)
+            return _api_response_json(result)
         except Exception as e:
             logger.error(f"Error getting bureau decision: {e}")
             error_result = {
@@ -2055,7 +3017,7 @@ CRITICAL CONTEXT AWARENESS RULES:
                 SessionManager.update_session_data_field(session_id, "data.bureau_decision_details", error_result)
                 logger.info(f"Session {session_id}: Saved bureau decision error to session data")
             
-            return json.dumps(error_result)
+            return _json_dumps(error_result)
 
     def extract_bureau_decision_details(self, bureau_result: Dict[str, Any], session_id: str) -> Dict[str, Any]:
         """
@@ -2135,51 +3097,36 @@ CRITICAL CONTEXT AWARENESS RULES:
             if emi_plans_data:
                 details["emiPlans"] = emi_plans_data
                 
-                # Find maximum creditLimit from all plans
-                try:
-                    max_credit_limit = max(
-                        (float(plan.get("creditLimitCalculated", 0)) for plan in emi_plans_data if plan.get("creditLimitCalculated")),
-                        default=None
-                    )
-                    if max_credit_limit:
-                        details["creditLimitCalculated"] = str(int(max_credit_limit))
-                except (ValueError, TypeError):
-                    pass
-                
-                # Find maximum treatment amount by getting the highest grossTreatmentAmount from all plans
-                try:
-                    max_treatment_amount = max(
-                        (float(plan.get("grossTreatmentAmount", 0)) for plan in emi_plans_data if plan.get("grossTreatmentAmount")),
-                        default=None
-                    )
-                    if max_treatment_amount:
-                        details["maxTreatmentAmount"] = str(int(max_treatment_amount))
-                except (ValueError, TypeError):
-                    pass
-
-                print(f"max_treatment_amount: {max_treatment_amount}")
-                
-                # If we have plans but no max eligible EMI, use the highest EMI
-                if not details["maxEligibleEMI"] and emi_plans_data:
-                    try:
-                        highest_emi = max(
-                            (float(plan.get("emi", 0)) for plan in emi_plans_data if plan.get("emi")),
-                            default=None
-                        )
-                        if highest_emi:
-                            details["maxEligibleEMI"] = str(int(highest_emi))
-                    except (ValueError, TypeError):
-                        pass
-            
-            # Ensure credit limit, EMI, down payment, and net loan amount values are strings
-            for plan in details["emiPlans"]:
-                for key in ["creditLimitCalculated", "emi", "downPayment", "netLoanAmount"]:
-                    if key in plan and plan[key] is not None and not isinstance(plan[key], str):
-                        plan[key] = str(plan[key])
+                # Walk the plans once to track the highest credit limit, treatment amount and
+                # (when no max eligible EMI was returned) EMI. Amount fields are already strings
+                # (see _normalize_emi_plans). An unconvertible value disables that maximum.
+                max_fields = ["creditLimitCalculated", "grossTreatmentAmount"]
+                if not details["maxEligibleEMI"]:
+                    max_fields.append("emi")
+                maxima: Dict[str, Optional[float]] = dict.fromkeys(max_fields)
+                invalid = set()
+                for plan in emi_plans_data:
+                    for key in max_fields:
+                        raw_value = plan.get(key)
+                        if raw_value and key not in invalid:
+                            try:
+                                value = float(raw_value)
+                            except (ValueError, TypeError):
+                                invalid.add(key)
+                                continue
+                            if maxima[key] is None or value > maxima[key]:
+                                maxima[key] = value
+                for key in invalid:
+                    maxima[key] = None
                 
-                # Ensure grossTreatmentAmount is available and is a string
-                if "grossTreatmentAmount" in plan and plan["grossTreatmentAmount"] is not None and not isinstance(plan["grossTreatmentAmount"], str):
-                    plan["grossTreatmentAmount"] = str(plan["grossTreatmentAmount"])
+                if maxima["creditLimitCalculated"]:
+                    details["creditLimitCalculated"] = str(int(maxima["creditLimitCalculated"]))
+                if maxima["grossTreatmentAmount"]:
+                    details["maxTreatmentAmount"] = str(int(maxima["grossTreatmentAmount"]))
+                # If we have plans but no max eligible EMI, use the highest EMI
+                if maxima.get("emi"):
+                    details["maxEligibleEMI"] = str(int(maxima["emi"]))
+                logger.debug("max_treatment_amount: %s", maxima["grossTreatmentAmount"])
             
             # Log the complete details dictionary for debugging
             logger.info(f"Extracted bureau decision details: {details}")
@@ -2198,115 +3145,30 @@ CRITICAL CONTEXT AWARENESS RULES:
                 "maxTreatmentAmount": None
             }
 
-    def process_prefill_data_for_basic_details(self, session_id: str) -> str:
+    def process_prefill_data_for_basic_details(self, session_id: str, prefetched: Optional[Future] = None) -> str:
         """
         Process prefill data and check for missing details. If any required details are missing,
         always save the available details using the API client, and return a message asking the user to provide the missing ones.
 
         Args:
             session_id: Session identifier.
+            prefetched: Future from _prefetch_prefill_details_save already running the save call
 
         Returns:
             JSON string for save_basic_details or message asking for missing details
         """
         try:
             # 1. Get user_id if not provided
-            session = None
-            if session_id:
-                session = SessionManager.get_session_from_db(session_id)
-            user_id = session.get("data", {}).get("userId") if session else None
+            session = SessionManager.get_session_from_db(session_id) if session_id else None
+            session_data = (session or {}).get("data") or {}
+            user_id = session_data.get("userId")
             if not user_id:
                 return "User ID is required to process prefill data"
 
-            # 2. Get prefill data from API response in session
-            prefill_data = {}
-            session_data = {}
-            if session_id:
-                session = SessionManager.get_session_from_db(session_id)
-                if session and "data" in session:
-                    session_data = session["data"]
-                    api_responses = session_data.get("api_responses", {})
-                    prefill_api_result = api_responses.get("get_prefill_data")
-                    if prefill_api_result and isinstance(prefill_api_result, dict):
-                        prefill_data = prefill_api_result.get("data", {}).get("response", {})
-                    if not prefill_data and "prefill_api_response" in session_data:
-                        prefill_data = session_data["prefill_api_response"]
-
-            # 3. Build the data for save_basic_details
-            data = {"userId": user_id, "formStatus": "Basic"}
-
-            # 4. Get name and phone from session if available
-            if "name" in session_data and session_data["name"] is not None:
-                data["firstName"] = session_data["name"]
-            elif "fullName" in session_data and session_data["fullName"] is not None:
-                data["firstName"] = session_data["fullName"]
-
-            if "phone" in session_data and session_data["phone"] is not None:
-                data["mobileNumber"] = session_data["phone"]
-            elif "phoneNumber" in session_data and session_data["phoneNumber"] is not None:
-                data["mobileNumber"] = session_data["phoneNumber"]
-            elif "mobileNumber" in session_data and session_data["mobileNumber"] is not None:
-                data["mobileNumber"] = session_data["mobileNumber"]
-
-            # 5. Extract fields from prefill_data (from API response)
-            field_mappings = {
-                "panCard": ["pan"],
-                "gender": ["gender"],
-                "dateOfBirth": ["dob"],
-                "emailId": ["email"],
-            }
+            # 2. Build the data for save_basic_details from the session and stored prefill response
+            data, derived_entry = _prefill_details_payload(user_id, session_data)
 
-            for target_field, source_fields in field_mappings.items():
-                for source in source_fields:
-                    if source in prefill_data and prefill_data[source] is not None:
-                        value = prefill_data[source]
-                        if isinstance(value, (dict, list)):
-                            continue
-                        else:
-                            data[target_field] = str(value)
-                        break
-
-            # Special handling for email if it's a list or dict
-            if "email" in prefill_data and prefill_data["email"] is not None and "emailId" not in data:
-                email_data = prefill_data["email"]
-                if isinstance(email_data, list) and email_data:
-                    if isinstance(email_data[0], dict) and "email" in email_data[0] and email_data[0]["email"] is not None:
-                        data["emailId"] = email_data[0]["email"]
-                    else:
-                        data["emailId"] = email_data[0]
-                elif isinstance(email_data, str) and email_data.strip():
-                    data["emailId"] = email_data
-
-            # Also extract from nested "response" if it exists
-            if "response" in prefill_data and isinstance(prefill_data["response"], dict):
-                response = prefill_data["response"]
-                for target_field, source_fields in field_mappings.items():
-                    for source in source_fields:
-                        if source in response and response[source] is not None and target_field not in data:
-                            value = response[source]
-                            if isinstance(value, (dict, list)):
-                                continue
-                            else:
-                                data[target_field] = str(value)
-                            break
-                # Special handling for email in nested response
-                if "email" in response and response["email"] is not None and "emailId" not in data:
-                    email_data = response["email"]
-                    if isinstance(email_data, list):
-                        if email_data:
-                            if isinstance(email_data[0], dict) and "email" in email_data[0] and email_data[0]["email"] is not None:
-                                data["emailId"] = str(email_data[0]["email"])
-                            else:
-                                data["emailId"] = str(email_data[0])
-                    elif isinstance(email_data, dict) and "email" in email_data and email_data["email"] is not None:
-                        data["emailId"] = str(email_data["email"])
-                    elif isinstance(email_data, str) and email_data.strip():
-                        data["emailId"] = str(email_data)
-                # Handle phone number in response if needed
-                if "mobile" in response and response["mobile"] is not None and "mobileNumber" not in data:
-                    data["mobileNumber"] = response["mobile"]
-
-            # 6. Check for missing required details
+            # 3. Check for missing required details
             missing_details = []
             required_fields = ["panCard", "gender", "dateOfBirth"]
             
@@ -2315,14 +3177,23 @@ CRITICAL CONTEXT AWARENESS RULES:
                     missing_details.append(field)
 
             # Always save the available details, even if some are missing
-            logger.info(f"Saving available prefill details: user_id={user_id}, data={data}")
-            result = self.api_client.save_prefill_details(user_id, data)
-            logger.info(f"Saved (partial) prefill details: {result}")
-            if session_id:
-                SessionManager.update_session_data_field(session_id, "data.api_responses.save_prefill_details", result)
-                # Only mark as completed if nothing is missing
-                if not missing_details:
-                    SessionManager.update_session_data_field(session_id, "data.basic_details_completed", True)
+            input_hash = _input_hash(data)
+            result = None if prefetched is not None else _replayable_save(session_data, "save_prefill_details", input_hash)
+            updates = {}
+            if result is not None:
+                logger.info("Prefill details unchanged since the last successful save for user_id=%s", user_id)
+            else:
+                logger.info("Saving available prefill details: user_id=%s, data=%s", user_id, _short(data))
+                result = prefetched.result() if prefetched is not None else self.api_client.save_prefill_details(user_id, data)
+                logger.info("Saved (partial) prefill details: %s", _short(result))
+                updates["data.api_responses.save_prefill_details"] = result
+                updates["data.api_response_times.save_prefill_details"] = time.time()
+                updates["data.api_input_hashes.save_prefill_details"] = input_hash
+            if derived_entry is not None:
+                updates["data.derived.basic_fields"] = derived_entry
+            # Only mark as completed if nothing is missing
+            if not missing_details:
+                updates["data.basic_details_completed"] = True
 
             # If there are missing details, ask the user to provide them
             if missing_details:
@@ -2341,12 +3212,12 @@ CRITICAL CONTEXT AWARENESS RULES:
                 response_message = f"I need some additional information to complete Patient's application. Please provide Patient's {missing_text}."
                 
                 # Store the missing details in session for the agent to handle
-                if session_id:
-                    SessionManager.update_session_data_field(session_id, "data.missing_details", missing_details)
-                    SessionManager.update_session_data_field(session_id, "data.prefill_data_processed", data)
-                    logger.info(f"Missing details detected: {missing_details}")
+                updates["data.missing_details"] = missing_details
+                updates["data.prefill_data_processed"] = data
+                SessionManager.update_session_data_fields(session_id, updates)
+                logger.info("Missing details detected: %s", missing_details)
                 
-                return json.dumps({
+                return _json_dumps({
                     "status": "missing_details",
                     "message": response_message,
                     "missing_details": missing_details,
@@ -2355,14 +3226,15 @@ CRITICAL CONTEXT AWARENESS RULES:
                 })
 
             # All details are available, return the save result
-            logger.info(f"All basic details present and saved for user_id={user_id}")
-            return json.dumps(result)
+            SessionManager.update_session_data_fields(session_id, updates)
+            logger.info("All basic details present and saved for user_id=%s", user_id)
+            return _api_response_json(result)
         except Exception as e:
-            logger.error(f"Error processing prefill data: {e}")
+            logger.error("Error processing prefill data: %s", e)
             if 'user_id' in locals() and user_id:
-                return json.dumps({"userId": user_id, "error": str(e)})
+                return _json_dumps({"userId": user_id, "error": str(e)})
             else:
-                return json.dumps({"error": str(e)})
+                return _json_dumps({"error": str(e)})
             
     def process_address_data(self, session_id: str) -> str:
         """
@@ -2379,128 +3251,6 @@ CRITICAL CONTEXT AWARENESS RULES:
             Save result as JSON string
         """
         user_id = None  # Ensure user_id is always defined
-
-        # State code to state name mapping with pincode ranges
-        PINCODE_STATE_MAP = [
-            ("Andaman & Nicobar Islands", ["744"]),
-            ("Andhra Pradesh", [str(i) for i in range(500, 536)]),
-            ("Arunachal Pradesh", [str(i) for i in range(790, 793)]),
-            ("Assam", [str(i) for i in range(781, 789)]),
-            ("Bihar", [str(i) for i in range(800, 856)]),
-            ("Chhattisgarh", [str(i) for i in range(490, 498)]),
-            ("Chandigarh", ["160"]),
-            ("Daman & Diu", ["362", "396"]),
-            ("Delhi", ["110"]),
-            ("Dadra & Nagar Haveli", ["396"]),
-            ("Goa", ["403"]),
-            ("Gujarat", [str(i) for i in range(360, 397)]),
-            ("Himachal Pradesh", [str(i) for i in range(171, 178)]),
-            ("Haryana", [str(i) for i in range(121, 137)]),
-            ("Jharkhand", [str(i) for i in range(813, 836)]),
-            ("Jammu & Kashmir", [str(i) for i in range(180, 195)]),
-            ("Karnataka", [str(i) for i in range(560, 592)]),
-            ("Kerala", [str(i) for i in range(670, 696)]),
-            ("Lakshadweep", ["682"]),
-            ("Maharashtra", [str(i) for i in range(400, 446)]),
-            ("Meghalaya", [str(i) for i in range(793, 795)]),
-            ("Manipur", ["795"]),
-            ("Madhya Pradesh", [str(i) for i in range(450, 489)]),
-            ("Mizoram", ["796"]),
-            ("Nagaland", ["797", "798"]),
-            ("Odisha", [str(i) for i in range(751, 771)]),
-            ("Punjab", [str(i) for i in range(140, 161)]),
-            ("Pondicherry/Puducherry", ["533", "605", "607", "609"]),
-            ("Rajasthan", [str(i) for i in range(301, 346)]),
-            ("Sikkim", ["737"]),
-            ("Telangana", [str(i) for i in range(500, 510)]),
-            ("Tamil Nadu", [str(i) for i in range(600, 644)]),
-            ("Tripura", ["799"]),
-            ("Uttarakhand", [str(i) for i in range(244, 264)]),
-            ("Uttar Pradesh", [str(i) for i in range(201, 286)]),
-            ("West Bengal", [str(i) for i in range(700, 744)]),
-        ]
-
-        STATE_CODE_TO_NAME = {
-            "AN": "Andaman & Nicobar Islands",
-            "AP": "Andhra Pradesh",
-            "AR": "Arunachal Pradesh",
-            "AS": "Assam",
-            "BR": "Bihar",
-            "CG": "Chhattisgarh",
-            "CT": "Chhattisgarh",
-            "CH": "Chandigarh",
-            "DD": "Daman & Diu",
-            "DL": "Delhi",
-            "DN": "Dadra & Nagar Haveli",
-            "GA": "Goa",
-            "GJ": "Gujarat",
-            "HP": "Himachal Pradesh",
-            "HR": "Haryana",
-            "JH": "Jharkhand",
-            "JK": "Jammu & Kashmir",
-            "KA": "Karnataka",
-            "KL": "Kerala",
-            "LD": "Lakshadweep",
-            "MH": "Maharashtra",
-            "ML": "Meghalaya",
-            "MN": "Manipur",
-            "MP": "Madhya Pradesh",
-            "MZ": "Mizoram",
-            "NL": "Nagaland",
-            "OR": "Odisha",
-            "PB": "Punjab",
-            "PY": "Pondicherry/Puducherry",
-            "RJ": "Rajasthan",
-            "SK": "Sikkim",
-            "TG": "Telangana",
-            "TS": "Telangana",
-            "TN": "Tamil Nadu",
-            "TR": "Tripura",
-            "UL": "Uttarakhand",
-            "UP": "Uttar Pradesh",
-            "WB": "West Bengal",
-        }
-
-        def get_state_from_pincode(pincode):
-            if not pincode or len(pincode) < 3:
-                return None
-            prefix = pincode[:3]
-            for state_name, ranges in PINCODE_STATE_MAP:
-                for rng in ranges:
-                    if "-" in rng:
-                        start, end = rng.split("-")
-                        if start.strip().isdigit() and end.strip().isdigit():
-                            if int(start) <= int(prefix) <= int(end):
-                                return state_name
-                    else:
-                        if prefix == rng:
-                            return state_name
-            return None
-
-        def is_valid_pincode(pincode):
-            """Check if a string is a valid 6-digit pincode"""
-            if not pincode:
-                return False
-            # Clean the pincode string
-            clean_pincode = ''.join(filter(str.isdigit, str(pincode)))
-            return len(clean_pincode) == 6 and clean_pincode.isdigit()
-
-        def extract_pincode_from_postal(postal):
-            """Extract valid pincode from postal field"""
-            if not postal:
-                return None
-            # Clean the postal string and extract digits
-            clean_postal = ''.join(filter(str.isdigit, str(postal)))
-            if len(clean_postal) == 6:
-                return clean_postal
-            # If we have more than 6 digits, try to find 6-digit sequence
-            if len(clean_postal) > 6:
-                for i in range(len(clean_postal) - 5):
-                    potential_pincode = clean_postal[i:i+6]
-                    if potential_pincode.isdigit():
-                        return potential_pincode
-            return None
-
         try:
             if not session_id:
                 return "Session ID is required"
@@ -2509,77 +3259,22 @@ CRITICAL CONTEXT AWARENESS RULES:
             if not session:
                 return "Session not found"
 
-            user_id = session.get("data", {}).get("userId")
-
-            # Get prefill data from session if available
-            prefill_data = None
-            if session_id:
-                session = SessionManager.get_session_from_db(session_id)
-                if session and "data" in session:
-                    session_data = session["data"]
-                    # Try to get from data.api_responses.get_prefill_data first
-                    api_responses = session_data.get("api_responses", {})
-                    prefill_api_result = api_responses.get("get_prefill_data")
-                    if prefill_api_result and isinstance(prefill_api_result, dict):
-                        # Try to get the nested response
-                        prefill_data = prefill_api_result.get("data", {}).get("response")
-                    # Fallback to prefill_api_response if not found above
-                    if not prefill_data and "prefill_api_response" in session_data:
-                        prefill_data = session_data["prefill_api_response"]
-
-            # Extract address information
-            address_data = {}
-
-            # Check if it's already in the right format
-            if isinstance(prefill_data, dict) and "address" in prefill_data and isinstance(prefill_data["address"], list):
-                address_list = prefill_data["address"]
-                primary_address = None
-                valid_pincode = None
-
-                # First, try to find address with Type "Primary" or "Permanent"
-                for addr in address_list:
-                    addr_type = addr.get("Type", "").lower()
-                    if addr_type in ["primary", "permanent"]:
-                        primary_address = addr
-                        # Check if this address has a valid pincode
-                        postal = addr.get("Postal", "")
-                        extracted_pincode = extract_pincode_from_postal(postal)
-                        if is_valid_pincode(extracted_pincode):
-                            valid_pincode = extracted_pincode
-                            break
-
-                # If no primary address with valid pincode found, search all addresses for valid pincode
-                if not valid_pincode:
-                    for addr in address_list:
-                        postal = addr.get("Postal", "")
-                        extracted_pincode = extract_pincode_from_postal(postal)
-                        if is_valid_pincode(extracted_pincode):
-                            primary_address = addr
-                            valid_pincode = extracted_pincode
-                            break
-
-                # If still no valid pincode found, use the first address in the list
-                if not primary_address and address_list:
-                    primary_address = address_list[0]
+            session_data = session.get("data") or {}
+            user_id = session_data.get("userId")
 
-                if primary_address:
-                    # Extract address details
-                    address_data["address"] = primary_address.get("Address", "")
-                    
-                    # Use the valid pincode we found, or try to extract from current address
-                    if valid_pincode:
-                        address_data["pincode"] = valid_pincode
-                    else:
-                        postal = primary_address.get("Postal", "")
-                        extracted_pincode = extract_pincode_from_postal(postal)
-                        address_data["pincode"] = extracted_pincode if extracted_pincode else ""
+            # Extract address information from the stored prefill API response
+            address_fields, derived_entry = _derived_from_prefill(session_data, "address_fields", _extract_address_fields)
 
-                    address_data["state"] = primary_address.get("State", "")
+            if address_fields is not None:
+                address_data = dict(address_fields)
+                # State as given by the prefill data, used when the pincode API has none
+                prefill_state = address_data.get("state", "")
 
+                if address_data:
                     # Check if pincode is missing or invalid
-                    if not address_data["pincode"] or not is_valid_pincode(address_data["pincode"]):
+                    if not address_data["pincode"] or not _is_valid_pincode(address_data["pincode"]):
                         # Return special status to ask for pincode
-                        return json.dumps({
+                        return _json_dumps({
                             "status": "missing_pincode",
                             "message": "Please provide your 6-digit pincode to continue with the loan application process. Follow workflow A",
                             "extracted_address_data": address_data
@@ -2592,7 +3287,7 @@ CRITICAL CONTEXT AWARENESS RULES:
                     # If we have a valid pincode, get city and state from API
                     try:
                         pincode_data = self.api_client.state_and_city_by_pincode(address_data["pincode"])
-                        logger.info(f"Pincode API response for pincode {address_data['pincode']}: {pincode_data}")
+                        logger.info("Pincode API response for pincode %s: status=%s city=%s state=%s", address_data['pincode'], *_pincode_log_fields(pincode_data))
                         city_set = False
                         state_set = False
                         if pincode_data and pincode_data.get("status") == "success":
@@ -2605,16 +3300,15 @@ CRITICAL CONTEXT AWARENESS RULES:
                                 state_set = True
                         # If state is not set from API, use state from prefill data, but crosswalk code if needed
                         if not state_set:
-                            prefill_state = primary_address.get("State", "")
                             # If prefill_state is a code, map to name
-                            state_name = STATE_CODE_TO_NAME.get(prefill_state.strip().upper())
+                            state_name = _STATE_CODE_TO_NAME.get(prefill_state.strip().upper())
                             if state_name:
                                 address_data["state"] = state_name
                             else:
                                 # If not a code, try to use as is, but if still not a valid state, use pincode mapping
                                 if prefill_state and len(prefill_state) <= 3:
                                     # Try pincode mapping
-                                    state_from_pin = get_state_from_pincode(address_data["pincode"])
+                                    state_from_pin = _state_from_pincode(address_data["pincode"])
                                     if state_from_pin:
                                         address_data["state"] = state_from_pin
                                     else:
@@ -2623,65 +3317,77 @@ CRITICAL CONTEXT AWARENESS RULES:
                                     address_data["state"] = prefill_state
                                 else:
                                     # As last resort, use pincode mapping
-                                    state_from_pin = get_state_from_pincode(address_data["pincode"])
+                                    state_from_pin = _state_from_pincode(address_data["pincode"])
                                     if state_from_pin:
                                         address_data["state"] = state_from_pin
                         # If city is not set from API, use last word of address as city
                         if not city_set:
-                            address_str = address_data.get("address", "")
-                            if address_str:
-                                # Split address by whitespace and take last word
-                                address_words = address_str.strip().split()
-                                if address_words:
-                                    # Save city in title case
-                                    address_data["city"] = address_words[-1].title()
+                            city = _city_from_address(address_data.get("address") or "")
+                            if city:
+                                address_data["city"] = city
                     except Exception as e:
-                        logger.warning(f"Failed to get city/state from pincode API: {e}")
+                        logger.warning("Failed to get city/state from pincode API: %s", e)
                         # If API call fails, try to set city from address as fallback
-                        address_str = address_data.get("address", "")
-                        if address_str:
-                            address_words = address_str.strip().split()
-                            if address_words:
-                                address_data["city"] = address_words[-1].title()
+                        city = _city_from_address(address_data.get("address") or "")
+                        if city:
+                            address_data["city"] = city
                         # For state, use prefill state or pincode mapping
-                        prefill_state = primary_address.get("State", "")
-                        state_name = STATE_CODE_TO_NAME.get(prefill_state.strip().upper())
+                        state_name = _STATE_CODE_TO_NAME.get(prefill_state.strip().upper())
                         if state_name:
                             address_data["state"] = state_name
                         else:
-                            state_from_pin = get_state_from_pincode(address_data["pincode"])
+                            state_from_pin = _state_from_pincode(address_data["pincode"])
                             if state_from_pin:
                                 address_data["state"] = state_from_pin
                             elif prefill_state:
                                 address_data["state"] = prefill_state
 
-                logger.info(f"Extracted address data: {address_data}")
+                logger.info("Extracted address data: %s", _short(address_data))
 
                 # Store the extracted address data in session
-                if session_id:
-                    SessionManager.update_session_data_field(session_id, "data.extracted_address_data", address_data)
-
-                # Save the address details
+                updates = {"data.extracted_address_data": address_data}
+                if derived_entry is not None:
+                    updates["data.derived.address_fields"] = derived_entry
+                SessionManager.update_session_data_fields(session_id, updates)
+
+                # Both addresses were already saved with this data: return the stored response
+                input_hash = _input_hash(address_data)
+                result = _replayable_save(session_data, "process_address_data", input_hash)
+                if result is not None and _replayable_save(session_data, "save_permanent_address_details", input_hash) is not None:
+                    logger.info("Address details unchanged since the last successful save for session %s", session_id)
+                    return _api_response_json(result)
+
+                # Save the current and permanent address together; neither depends on the other
+                permanent_future = _API_SAVE_EXECUTOR.submit(
+                    self.api_client.save_permanent_address_details, user_id, address_data
+                )
                 result = self.api_client.save_address_details(user_id, address_data)
-                permanent_result = self.api_client.save_permanent_address_details(user_id, address_data)
-                logger.info(f"Permanent address details saved: {permanent_result}")
-
-                # Store the API response
-                if session_id:
-                    SessionManager.update_session_data_field(session_id, "data.api_responses.process_address_data", result)
+                permanent_result = permanent_future.result()
+                logger.info("Permanent address details saved: %s", _short(permanent_result))
+
+                # Record the API responses; _replayable_save reads the times and hashes back
+                saved_at = time.time()
+                SessionManager.update_session_data_fields(session_id, {
+                    "data.api_responses.process_address_data": result,
+                    "data.api_responses.save_permanent_address_details": permanent_result,
+                    "data.api_response_times.process_address_data": saved_at,
+                    "data.api_response_times.save_permanent_address_details": saved_at,
+                    "data.api_input_hashes.process_address_data": input_hash,
+                    "data.api_input_hashes.save_permanent_address_details": input_hash,
+                })
 
-                return json.dumps(result)
+                return _api_response_json(result)
             else:
                 # No address found in prefill data, ask for pincode
-                return json.dumps({
+                return _json_dumps({
                     "status": "missing_pincode",
                     "message": "Please provide your 6-digit pincode to continue with the loan application process. Follow workflow A",
                     "extracted_address_data": {}
                 })
 
         except Exception as e:
-            logger.error(f"Error processing address data: {e}")
-            return json.dumps({
+            logger.error("Error processing address data: %s", e)
+            return _json_dumps({
                 "error": f"Error processing address data: {str(e)}",
                 "userId": user_id
             })
@@ -2698,18 +3404,23 @@ CRITICAL CONTEXT AWARENESS RULES:
             Verification result as JSON string
         """
         try:
-            user_id = None  # Initialize user_id variable
-            
-            # Try to get user ID from session
-            if session_id:
-                session = SessionManager.get_session_from_db(session_id)
-                if session and session.get("data", {}).get("userId"):
-                    user_id = session["data"]["userId"]
-            
-            if not user_id:
-                return json.dumps({"status": 400, "error": "User ID is required for PAN verification"})
+            user_id, session_data = self._resolve(session_id)
+            if _validate_id(user_id):
+                return _ERR_PAN_USER_ID_REQUIRED
+            
+            # The PAN checked is the one saved upstream, so the input covers every way it is set
+            input_hash = _input_hash([
+                user_id,
+                session_data.get("panCard"),
+                _dig(session_data, "api_input_hashes", "save_prefill_details"),
+            ])
+            result = _replayable_save(session_data, "pan_verification", input_hash)
+            # Only a verification that succeeded is replayed
+            if result is not None and _dig(result, "data", "status") == 200:
+                logger.info("Using stored PAN verification for user ID: %s", user_id)
+                return _json_dumps({"status": 200, "data": result})
             
-            logger.info(f"Performing PAN verification for user ID: {user_id}")
+            logger.info("Performing PAN verification for user ID: %s", user_id)
             
             # # For testing purposes, return a mock success response
             # # TODO: Replace with actual API call when ready
@@ -2726,13 +3437,17 @@ CRITICAL CONTEXT AWARENESS RULES:
             result = self.api_client.pan_verification(user_id)
         
             if session_id:
-                SessionManager.update_session_data_field(session_id, "data.api_responses.pan_verification", result)
-            return json.dumps({"status": 200, "data": result})
+                SessionManager.update_session_data_fields(session_id, {
+                    "data.api_responses.pan_verification": result,
+                    "data.api_response_times.pan_verification": time.time(),
+                    "data.api_input_hashes.pan_verification": input_hash,
+                })
+            return _json_dumps({"status": 200, "data": result})
                 
         except Exception as e:
-            logger.error(f"Error verifying PAN: {e}")
+            logger.error("Error verifying PAN: %s", e)
             # Return a clear error response that the LLM should not ignore
-            return json.dumps({
+            return _json_dumps({
                 "status": 500,
                 "error": f"PAN verification failed: {str(e)}",
                 "should_stop": True  # Flag to indicate this should stop the flow
@@ -2749,7 +3464,7 @@ CRITICAL CONTEXT AWARENESS RULES:
             Confirmation message
         """
         try:
-            data = json.loads(input_str)
+            data = orjson.loads(input_str)
             
             session = SessionManager.get_session_from_db(session_id)
             if not session:
@@ -2765,10 +3480,8 @@ CRITICAL CONTEXT AWARENESS RULES:
             workplace_pincode = data.get('workplacePincode', '')
             
             # Create additional_details field if it doesn't exist
-            current_additional_details = {}
-            current_session = SessionManager.get_session_from_db(session_id)
-            if current_session and "data" in current_session and "additional_details" in current_session["data"]:
-                current_additional_details = current_session["data"]["additional_details"]
+            session_data = session.setdefault("data", {})
+            current_additional_details = session_data.setdefault("additional_details", {})
             
             # Update additional details
             additional_details = {
@@ -2791,49 +3504,38 @@ CRITICAL CONTEXT AWARENESS RULES:
             # Use update_session_data_field to preserve existing API audit trail data
             SessionManager.update_session_data_field(session_id, "data.additional_details", current_additional_details)
             
-            # Get user ID from current session (fetch fresh data)
-            current_session = SessionManager.get_session_from_db(session_id)
-            user_id = None
-            if current_session and "data" in current_session:
-                user_id = current_session["data"].get("userId")
+            # The merged details are already in session, so it doubles as the fresh copy
+            user_id = session_data.get("userId")
             
-            # If we have a user ID, send employment details to API
+            # If we have a user ID, send employment, loan and basic details to the API.
+            # The payloads are built here from the session; the saves don't depend on
+            # each other, so they run concurrently and each failure is logged on its own.
             if user_id:
-                employment_data = self._process_employment_data_from_additional_details(session_id)
+                saves = []
+                employment_data = self._process_employment_data_from_additional_details(session_id, session)
                 if employment_data:
-                    try:
-                        self.api_client.save_employment_details(user_id, employment_data)
-                        # print(f"Successfully saved employment details for user {user_id}: {result}")
-                        logger.info(f"Successfully saved employment details for user {user_id}: {employment_data}")
-                    except Exception as e:
-                        logger.error(f"Error saving employment details for user {user_id}: {e}")
-
-            if user_id:
-                loan_data = self._process_loan_data_from_additional_details(session_id)
+                    saves.append(("employment", self.api_client.save_employment_details, employment_data))
+                loan_data = self._process_loan_data_from_additional_details(session_id, session)
                 if loan_data:
+                    saves.append(("loan", self.api_client.save_loan_details_again, loan_data))
+                basic_data = self._process_basic_details_from_additional_details(session_id, session)
+                if basic_data:
+                    saves.append(("basic", self.api_client.save_basic_details, basic_data))
+
+                futures = [
+                    (label, _API_SAVE_EXECUTOR.submit(save, user_id, payload))
+                    for label, save, payload in saves
+                ]
+                for label, future in futures:
                     try:
-                        # Convert loan_data to JSON string for save_loan_details
-                        self.api_client.save_loan_details_again(user_id, loan_data)
-                        # print(f"Successfully saved loan details for user {user_id}: {result}")
-                        logger.info(f"Successfully saved loan details for user {user_id}")
-
-                        # logger.info(f"Successfully saved loan details for user {user_id}: {loan_data}")
-                    except Exception as e:
-                        logger.error(f"Error saving loan details for user {user_id}: {e}")
-
-            if user_id:
-                data = self._process_basic_details_from_additional_details(session_id)
-                if data:
-                    try:
-                        self.api_client.save_basic_details(user_id, data)
-                        # print(f"Successfully saved basic details for user {user_id}: {result}")
-                        logger.info(f"Successfully saved basic details for user {user_id}: {data}")
+                        future.result()
+                        logger.info("Successfully saved %s details for user %s", label, user_id)
                     except Exception as e:
-                        logger.error(f"Error saving basic details for user {user_id}: {e}")
+                        logger.error("Error saving %s details for user %s: %s", label, user_id, e)
 
             return f"Additional details saved successfully for session {session_id}"
         except Exception as e:
-            logger.error(f"Error saving additional user details: {e}")
+            logger.error("Error saving additional user details: %s", e)
             return f"Error saving details: {str(e)}"
 
     def _handle_additional_details_collection(self, session_id: str, message: str) -> str:
@@ -2849,17 +3551,9 @@ CRITICAL CONTEXT AWARENESS RULES:
         """
         import json
         try:
-            # Helper function to detect limit options prompt
-            def is_limit_options_prompt(text: str) -> bool:
-                return (
-                    "Continue with this limit" in text
-                    and "Continue with limit enhancement" in text
-                    and ("1." in text and "2." in text)
-                )
-            
             session = SessionManager.get_session_from_db(session_id)
             if not session:
-                logger.error(f"Session {session_id} not found")
+                logger.error("Session %s not found", session_id)
                 return "Session not found. Please start a new conversation."
             
             # Ensure additional_details exists in session data
@@ -2879,176 +3573,136 @@ CRITICAL CONTEXT AWARENESS RULES:
                 for hist_item in reversed(session_history[-5:]):  # Check last 5 messages
                     if isinstance(hist_item, dict) and hist_item.get("type") == "AIMessage":
                         content = hist_item.get("content", "")
-                        if is_limit_options_prompt(content):
+                        if _is_limit_options_prompt(content):
                             collection_step = "limit_options"
                             SessionManager.update_session_data_field(session_id, "data.collection_step", "limit_options")
-                            logger.info(f"Session {session_id}: Detected limit options in history, setting collection step to limit_options")
+                            logger.info("Session %s: Detected limit options in history, setting collection step to limit_options", session_id)
                             break
             
             # Log current step for debugging
-            logger.info(f"Session {session_id}: Processing step '{collection_step}' with message: {message.strip()}")
-            logger.info(f"Session {session_id}: Current collection step from session data: {session['data'].get('collection_step', 'not_set')}")
+            logger.info("Session %s: Processing step '%s' with message: %s", session_id, collection_step, message.strip())
+            logger.info("Session %s: Current collection step from session data: %s", session_id, session['data'].get('collection_step', 'not_set'))
             
             # Function to save the current collection step and refresh session
-            def update_collection_step(new_step):
-                # Use update_session_data_field to preserve existing data
-                SessionManager.update_session_data_field(session_id, "data.collection_step", new_step)
-                SessionManager.update_session_data_field(session_id, "status", "collecting_additional_details")
-                logger.info(f"Session {session_id}: Updated collection step to '{new_step}'")
+            def update_collection_step(new_step, details=None):
+                # Write the step, status and any newly collected details together
+                updates = {"data.collection_step": new_step, "status": "collecting_additional_details"}
+                if details is not None:
+                    updates["data.additional_details"] = details
+                SessionManager.update_session_data_fields(session_id, updates)
+                logger.info("Session %s: Updated collection step to '%s'", session_id, new_step)
             
             # Handle limit options input (first step when limit options are presented)
             if collection_step == "limit_options":
                 # Check for both number and word inputs
-                message_lower = message.lower().strip()
+                message_lower = message.strip().lower()
                 message_stripped = message.strip()
                 
-                if (message_stripped == "1" or 
-                    "continue with this limit" in message_lower or 
-                    "this limit" in message_lower):
+                # "this limit" and "enhancement" cover the longer option phrasings
+                if message_stripped == "1" or "this limit" in message_lower:
                     additional_details["limit_choice"] = "continue_with_limit"
                     selected_option = "Continue with this limit"
-                    logger.info(f"Limit choice input: message='{message}', stored_value='continue_with_limit', selected_option='{selected_option}'")
-                elif (message_stripped == "2" or 
-                      "continue with limit enhancement" in message_lower or 
-                      "limit enhancement" in message_lower or 
-                      "enhancement" in message_lower):
+                    logger.info("Limit choice input: message='%s', stored_value='continue_with_limit', selected_option='%s'", message, selected_option)
+                elif message_stripped == "2" or "enhancement" in message_lower:
                     additional_details["limit_choice"] = "continue_with_enhancement"
                     selected_option = "Continue with limit enhancement"
-                    logger.info(f"Limit choice input: message='{message}', stored_value='continue_with_enhancement', selected_option='{selected_option}'")
+                    logger.info("Limit choice input: message='%s', stored_value='continue_with_enhancement', selected_option='%s'", message, selected_option)
                 else:
                     return "Please select a valid option: 1. Continue with this limit or 2. Continue with limit enhancement"
                 
-                # Update session data with limit choice using update_session_data_field
-                SessionManager.update_session_data_field(session_id, "data.additional_details", additional_details)
-                
                 # Update collection step and ask for employment type
-                update_collection_step("employment_type")
+                update_collection_step("employment_type", additional_details)
                 return f"""
 
 To proceed, please help me with a few more details.
 
-Patient's employment type:   
-1. SALARIED
-2. SELF_EMPLOYED
-Please Enter input 1 or 2 only"""
+{EMPLOYMENT_TYPE_PROMPT}"""
 
             # Handle employment type input (first step)
             elif collection_step == "employment_type":
-                # Check for both number and word inputs
-                if "1" in message or "salaried" in message.lower():
+                # Exact option first, then number and word inputs inside a longer reply
+                message_lower = message.strip().lower()
+                selected_option = _EMPLOYMENT_TYPE_OPTIONS.get(message_lower)
+                found = set() if selected_option else set(_EMPLOYMENT_TYPE_KEYWORDS_RE.findall(message_lower))
+                if selected_option:
+                    additional_details["employment_type"] = selected_option
+                elif "1" in found or "salaried" in found:
                     additional_details["employment_type"] = "SALARIED"
                     selected_option = "SALARIED"
-                elif "2" in message or "self" in message.lower() and "employed" in message.lower():
+                elif "2" in found or {"self", "employed"} <= found:
                     additional_details["employment_type"] = "SELF_EMPLOYED"
                     selected_option = "SELF_EMPLOYED"
                 else:
                     return "Please select a valid option for Employment Type: 1. SALARIED or 2. SELF_EMPLOYED"
                 
-                # Update session data with employment type using update_session_data_field
-                SessionManager.update_session_data_field(session_id, "data.additional_details", additional_details)
-                
                 # Update collection step and ask for marital status
-                update_collection_step("marital_status")
-                return f"""
-
-Patient's marital status:
-1. Married
-2. Unmarried/Single\n
-Please Enter input 1 or 2 only"""
+                update_collection_step("marital_status", additional_details)
+                return MARITAL_PROMPT
             
             # Handle marital status input
             elif collection_step == "marital_status":
                 # Check for both number and word inputs
-                message_lower = message.lower().strip()
+                message_lower = message.strip().lower()
                 
                 # Check for exact number matches first
                 if message.strip() == "1" or message_lower == "married":
                     additional_details["marital_status"] = "1"
                     selected_option = "Married"
-                    logger.info(f"Marital status input: message='{message}', stored_value='1', selected_option='{selected_option}'")
-                elif message.strip() == "2" or message_lower in ["unmarried", "single", "unmarried/single"]:
+                    logger.info("Marital status input: message='%s', stored_value='1', selected_option='%s'", message, selected_option)
+                elif message.strip() == "2" or message_lower in _UNMARRIED_OPTION_WORDS:
                     additional_details["marital_status"] = "2"
                     selected_option = "Unmarried/Single"
-                    logger.info(f"Marital status input: message='{message}', stored_value='2', selected_option='{selected_option}'")
+                    logger.info("Marital status input: message='%s', stored_value='2', selected_option='%s'", message, selected_option)
                 else:
                     return "Please select a valid option for Marital Status: 1. Married or 2. Unmarried/Single"
                 
-                # Update session data with marital status using update_session_data_field
-                SessionManager.update_session_data_field(session_id, "data.additional_details", additional_details)
-                
                 # Update collection step and ask for education qualification
-                update_collection_step("education_qualification")
-                return f"""
-Patient's education qualification: 
-1. Less than 10th
-2. Passed 10th
-3. Passed 12th
-4. Diploma
-5. Graduation
-6. Post graduation
-7. P.H.D\n
-Please Enter input between 1 to 7 only"""
+                update_collection_step("education_qualification", additional_details)
+                return EDUCATION_PROMPT
             
             # Handle education qualification input
             elif collection_step == "education_qualification":
-                education_options = {
-                    "1": "Less than 10th",
-                    "2": "Passed 10th", 
-                    "3": "Passed 12th",
-                    "4": "Diploma",
-                    "5": "Graduation",
-                    "6": "Post graduation",
-                    "7": "P.H.D"
-                }
-                
                 # Check for both number and word inputs
                 selected_key = None
-                message_lower = message.lower().strip()
+                message_lower = message.strip().lower()
                 
                 # First check if it's a number
-                if message.strip() in education_options:
+                if message.strip() in _EDUCATION_OPTIONS:
                     selected_key = message.strip()
-                # Then check for word matches
-                elif "less" in message_lower and "10th" in message_lower:
-                    selected_key = "1"
-                elif "passed 10th" in message_lower or "10th" in message_lower:
-                    selected_key = "2"
-                elif "passed 12th" in message_lower or "12th" in message_lower:
-                    selected_key = "3"
-                elif "diploma" in message_lower:
-                    selected_key = "4"
-                elif "graduation" in message_lower and "post" not in message_lower:
-                    selected_key = "5"
-                elif "post graduation" in message_lower or "postgraduation" in message_lower:
-                    selected_key = "6"
-                elif "phd" in message_lower or "p.h.d" in message_lower:
-                    selected_key = "7"
+                # Then check for word matches, in option priority order
+                else:
+                    found = set(_EDUCATION_KEYWORDS_RE.findall(message_lower))
+                    if "less" in found and "10th" in found:
+                        selected_key = "1"
+                    elif "10th" in found:
+                        selected_key = "2"
+                    elif "12th" in found:
+                        selected_key = "3"
+                    elif "diploma" in found:
+                        selected_key = "4"
+                    elif "graduation" in found and not any(keyword.startswith("post") for keyword in found):
+                        selected_key = "5"
+                    elif "post graduation" in found or "postgraduation" in found:
+                        selected_key = "6"
+                    elif "phd" in found or "p.h.d" in found:
+                        selected_key = "7"
                 
                 if selected_key:
                     additional_details["education_qualification"] = selected_key
-                    selected_option = education_options[selected_key]
+                    selected_option = _EDUCATION_OPTIONS[selected_key]
                 else:
                     return "Please select a valid option for Education Qualification (1-7)"
                 
-                # Update session data with education qualification using update_session_data_field
-                SessionManager.update_session_data_field(session_id, "data.additional_details", additional_details)
-                
                 # Update collection step and ask for treatment reason
-                update_collection_step("treatment_reason")
-                return f"""
-
-What is the name of treatment?"""
+                update_collection_step("treatment_reason", additional_details)
+                return TREATMENT_NAME_PROMPT
             
             # Handle treatment reason input
             elif collection_step == "treatment_reason":
                 additional_details["treatment_reason"] = message.strip()
-                
-                # Update session data with treatment reason using update_session_data_field
-                SessionManager.update_session_data_field(session_id, "data.additional_details", additional_details)
 
                 # Check if email was already saved during prefill data processing
-                session = SessionManager.get_session_from_db(session_id)
-                session_data = session.get("data", {}) if session else {}
+                session_data = session["data"]
                 api_responses = session_data.get("api_responses", {})
                 
                 # Check if email was saved in prefill data processing
@@ -3063,7 +3717,7 @@ What is the name of treatment?"""
                         email_value = saved_data.get("emailId")
                         if email_value and "@" in str(email_value):
                             email_already_saved = True
-                            logger.info(f"Email already saved during prefill processing: {email_value}")
+                            logger.info("Email already saved during prefill processing: %s", email_value)
                 
                 if email_already_saved:
                     # Skip email collection, proceed directly to employment type check
@@ -3071,10 +3725,6 @@ What is the name of treatment?"""
                     
                     # Check if employment_type is SALARIED and if employment_verification API response is status 200
                     if additional_details.get("employment_type") == "SALARIED":
-                        # Fetch session to get api_responses
-                        session = SessionManager.get_session_from_db(session_id)
-                        session_data = session.get("data", {}) if session else {}
-                        api_responses = session_data.get("api_responses", {})
                         employment_verification = api_responses.get("get_employment_verification")
                         organization_name = None
 
@@ -3087,55 +3737,31 @@ What is the name of treatment?"""
                             data_field = employment_verification.get("data", {})
                             response_body = data_field.get("responseBody")
                             if response_body:
-                                try:
-                                    import json
-                                    response_json = json.loads(response_body)
-                                    # Traverse to result > result > summary > recentEmployerData > establishmentName
-                                    result_outer = response_json.get("result", {})
-                                    result_inner = result_outer.get("result", {})
-                                    summary = result_inner.get("summary", {})
-                                    recent_employer_data = summary.get("recentEmployerData", {})
-                                    establishment_name = recent_employer_data.get("establishmentName")
-                                    if establishment_name:
-                                        organization_name = establishment_name
-                                except Exception as parse_exc:
-                                    logger.warning(f"Could not parse establishmentName from employment_verification: {parse_exc}")
+                                organization_name = _employer_establishment_name(session_data, response_body)
 
                         if organization_name:
                             additional_details["organization_name"] = organization_name
-                            # Update session data with organization name
-                            SessionManager.update_session_data_field(session_id, "data.additional_details", additional_details)
                             # Skip asking for organization name, go directly to workplace pincode
-                            update_collection_step("workplace_pincode")
-                            return f"""
-
-Patient's 6-digit workplace/office pincode"""
+                            update_collection_step("workplace_pincode", additional_details)
+                            return WORKPLACE_PINCODE_PROMPT
                         else:
                             # If not found, ask for organization name as usual
                             additional_details["organization_name"] = ""  # Initialize organization name
-                            update_collection_step("organization_name")
-                            return f"""
-
-Organization Name where the patient works?"""
+                            update_collection_step("organization_name", additional_details)
+                            return ORGANIZATION_NAME_PROMPT
                     else:
                         additional_details["business_name"] = ""  # Initialize business name
-                        update_collection_step("business_name")
-                        return f"""
-
-Business Name where the patient works?"""
+                        update_collection_step("business_name", additional_details)
+                        return BUSINESS_NAME_PROMPT
                 else:
                     # Email not saved during prefill, ask for it now
-                    update_collection_step("email_address")
-                    return f"""
-
-Patient's email address"""
+                    update_collection_step("email_address", additional_details)
+                    return EMAIL_PROMPT
             
             # Handle email address input
             elif collection_step == "email_address":
                 # Validate email format
-                import re
-                email_pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-                if not re.match(email_pattern, message.strip()):
+                if not _EMAIL_RE.fullmatch(message.strip()):
                     return "Please provide a valid email address."
                 
                 # Save email address using handle_email_address
@@ -3144,7 +3770,7 @@ Patient's email address"""
                 # Parse the result
                 if isinstance(email_result, str):
                     try:
-                        email_result_data = json.loads(email_result)
+                        email_result_data = orjson.loads(email_result)
                     except json.JSONDecodeError:
                         email_result_data = {"status": "error", "message": "Invalid response from email handler"}
                 else:
@@ -3155,13 +3781,11 @@ Patient's email address"""
                 
                 # Store email in additional details
                 additional_details["email_address"] = message.strip()
-                SessionManager.update_session_data_field(session_id, "data.additional_details", additional_details)
                 
                 # Check if employment_type is SALARIED and if employment_verification API response is status 200
                 if additional_details.get("employment_type") == "SALARIED":
-                    # Fetch session to get api_responses
-                    session = SessionManager.get_session_from_db(session_id)
-                    session_data = session.get("data", {}) if session else {}
+                    # The session read at the start of this turn already holds api_responses
+                    session_data = session["data"]
                     api_responses = session_data.get("api_responses", {})
                     employment_verification = api_responses.get("get_employment_verification")
                     organization_name = None
@@ -3175,129 +3799,102 @@ Patient's email address"""
                         data_field = employment_verification.get("data", {})
                         response_body = data_field.get("responseBody")
                         if response_body:
-                            try:
-                                import json
-                                response_json = json.loads(response_body)
-                                # Traverse to result > result > summary > recentEmployerData > establishmentName
-                                result_outer = response_json.get("result", {})
-                                result_inner = result_outer.get("result", {})
-                                summary = result_inner.get("summary", {})
-                                recent_employer_data = summary.get("recentEmployerData", {})
-                                establishment_name = recent_employer_data.get("establishmentName")
-                                if establishment_name:
-                                    organization_name = establishment_name
-                            except Exception as parse_exc:
-                                logger.warning(f"Could not parse establishmentName from employment_verification: {parse_exc}")
+                            organization_name = _employer_establishment_name(session_data, response_body)
 
                     if organization_name:
                         additional_details["organization_name"] = organization_name
-                        # Update session data with organization name
-                        SessionManager.update_session_data_field(session_id, "data.additional_details", additional_details)
                         # Skip asking for organization name, go directly to workplace pincode
-                        update_collection_step("workplace_pincode")
-                        return f"""
-
-Patient's 6-digit workplace/office pincode"""
+                        update_collection_step("workplace_pincode", additional_details)
+                        return WORKPLACE_PINCODE_PROMPT
                     else:
                         # If not found, ask for organization name as usual
                         additional_details["organization_name"] = ""  # Initialize organization name
-                        update_collection_step("organization_name")
-                        return f"""
-
-Organization Name where the patient works?"""
+                        update_collection_step("organization_name", additional_details)
+                        return ORGANIZATION_NAME_PROMPT
                 else:
                     additional_details["business_name"] = ""  # Initialize business name
-                    update_collection_step("business_name")
-                    return f"""
-
-Business Name where the patient works?"""
+                    update_collection_step("business_name", additional_details)
+                    return BUSINESS_NAME_PROMPT
             
             # Handle organization name input (for SALARIED)
             elif collection_step == "organization_name":
                 additional_details["organization_name"] = message.strip()
                 
-                # Update session data using update_session_data_field
-                SessionManager.update_session_data_field(session_id, "data.additional_details", additional_details)
-                
                 # Update collection step to ask for workplace pincode
-                update_collection_step("workplace_pincode")
-                return f"""
-
-Patient's 6-digit workplace/office pincode"""
+                update_collection_step("workplace_pincode", additional_details)
+                return WORKPLACE_PINCODE_PROMPT
             
             # Handle business name input (for SELF_EMPLOYED)
             elif collection_step == "business_name":
                 additional_details["business_name"] = message.strip()
                 
-                # Update session data using update_session_data_field
-                SessionManager.update_session_data_field(session_id, "data.additional_details", additional_details)
-                
                 # Update collection step to ask for workplace pincode
-                update_collection_step("workplace_pincode")
-                return f"""
-
-Patient's 6-digit business location pincode"""
+                update_collection_step("workplace_pincode", additional_details)
+                return BUSINESS_PINCODE_PROMPT
 
             # Handle workplace pincode input
             elif collection_step == "workplace_pincode":
                 # Validate pincode (6 digit number)
                 pincode = message.strip()
-                if not pincode.isdigit() or len(pincode) != 6:
+                if not _PINCODE_RE.fullmatch(pincode):
                     return "Please enter a valid 6-digit workplace pincode (numbers only)."
                 
                 additional_details["workplacePincode"] = pincode
                 
-                # Update session data using update_session_data_field
-                SessionManager.update_session_data_field(session_id, "data.additional_details", additional_details)
-                
                 # Mark collection as complete
-                update_collection_step("complete")
+                update_collection_step("complete", additional_details)
                 
                 # Save all collected details using the tool
                 # Make sure to create a new copy to avoid reference issues
                 details_to_save = dict(additional_details)
-                result = self.save_additional_user_details(json.dumps(details_to_save), session_id)
+                result = self.save_additional_user_details(_json_dumps(details_to_save), session_id)
                 
-                # Use update_session_data_field to preserve existing data instead of overwriting
-                SessionManager.update_session_data_field(session_id, "status", "additional_details_completed")
-                SessionManager.update_session_data_field(session_id, "data.details_collection_timestamp", datetime.now().isoformat())
+                # Use update_session_data_fields to preserve existing data instead of overwriting
+                SessionManager.update_session_data_fields(session_id, {
+                    "status": "additional_details_completed",
+                    "data.details_collection_timestamp": datetime.now().isoformat(),
+                })
                 
                 # Get necessary IDs from session
                 doctor_id = session["data"].get("doctorId") or session["data"].get("doctor_id")
                 user_id = session["data"].get("userId")
-                logger.info(f"Session {session_id}: Doctor ID: {doctor_id}, User ID: {user_id}")
+                logger.info("Session %s: Doctor ID: %s, User ID: %s", session_id, doctor_id, user_id)
                 
                 if user_id:
                     # Get loan details by user ID
                     loan_details_response = self.api_client.get_loan_details_by_user_id(user_id)
-                    logger.info(f"Session {session_id}: Loan details response for user_id {user_id}: {json.dumps(loan_details_response) if loan_details_response else 'None'}")
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("Session %s: Loan details response for user_id %s: %s", session_id, user_id, _json_dumps(loan_details_response) if loan_details_response else 'None')
                     
                     loan_id = None
                     if loan_details_response and loan_details_response.get("status") == 200:
                         loan_data = loan_details_response.get("data", {})
                         loan_id = loan_data.get("loanId")
-                        logger.info(f"Session {session_id}: Extracted loan ID: {loan_id}")
+                        logger.info("Session %s: Extracted loan ID: %s", session_id, loan_id)
                     
                     if loan_id:
                         # Check if doctor is mapped by FIBE
                         
                         if doctor_id and hasattr(self.api_client, 'check_doctor_mapped_by_nbfc'):
                             check_doctor_mapped_by_nbfc_response = self.api_client.check_doctor_mapped_by_nbfc(doctor_id)
-                            logger.info(f"Session {session_id}: Check doctor mapped by FIBE response for doctor_id {doctor_id}: {json.dumps(check_doctor_mapped_by_nbfc_response)}")
+                            if logger.isEnabledFor(logging.DEBUG):
+                                logger.debug("Session %s: Check doctor mapped by FIBE response for doctor_id %s: %s", session_id, doctor_id, _json_dumps(check_doctor_mapped_by_nbfc_response))
 
                             if check_doctor_mapped_by_nbfc_response.get("status") == 200:
                                 doctor_mapped_by_nbfc = check_doctor_mapped_by_nbfc_response.get("data")
                                 if doctor_mapped_by_nbfc == "true":
                                    
-                                    logger.info(f"Session {session_id}: Doctor {doctor_id} is mapped by FIBE.")
+                                    logger.info("Session %s: Doctor %s is mapped by FIBE.", session_id, doctor_id)
                                     
                                     # Call profile ingestion for Fibe with loan ID
                                     profile_ingestion_response = self.api_client.profile_ingestion_for_fibe_loanId(loan_id)
-                                    logger.info(f"Session {session_id}: Profile ingestion response for loan_id {loan_id}: {json.dumps(profile_ingestion_response) if profile_ingestion_response else 'None'}")
+                                    if logger.isEnabledFor(logging.DEBUG):
+                                        logger.debug("Session %s: Profile ingestion response for loan_id %s: %s", session_id, loan_id, _json_dumps(profile_ingestion_response) if profile_ingestion_response else 'None')
                         
                         # Always call BRE decision API regardless of doctor mapping
                         bre_decision_response = self.api_client.get_bre_decision(loan_id)
-                        logger.info(f"Session {session_id}: BRE decision response for loan_id {loan_id}: {json.dumps(bre_decision_response) if bre_decision_response else 'None'}")
+                        if logger.isEnabledFor(logging.DEBUG):
+                            logger.debug("Session %s: BRE decision response for loan_id %s: %s", session_id, loan_id, _json_dumps(bre_decision_response) if bre_decision_response else 'None')
                         
                         # Process BRE decision response
                         if bre_decision_response and bre_decision_response.get("status") == 200:
@@ -3305,9 +3902,9 @@ Patient's 6-digit business location pincode"""
                             selected_lender = bre_data.get("selectedLender")
                             lender_decision = bre_data.get("lenderDecision")
                             
-                            logger.info(f"Session {session_id}: Selected lender: {selected_lender}, Lender decision: {lender_decision}")
+                            logger.info("Session %s: Selected lender: %s, Lender decision: %s", session_id, selected_lender, lender_decision)
                             
-                            patient_name = session.get("data", {}).get("fullName", "")
+                            patient_name = _dig(session, "data", "fullName", default="")
                             
                             # Handle different lender and decision combinations
                             if selected_lender == "FIBE" and lender_decision == "APPROVED":
@@ -3326,7 +3923,7 @@ Continue with payment plan selection."""
                             
                             elif selected_lender == "FINDOC" and lender_decision == "INCOME VERIFICATION REQUIRED":
                                 bank_statement_link = f"https://carepay.money/patient/digibankstatement/{user_id}"
-                                logger.info(f"Session {session_id}: Using FINDOC income verification flow with bank statement link: {bank_statement_link}")
+                                logger.info("Session %s: Using FINDOC income verification flow with bank statement link: %s", session_id, bank_statement_link)
                                 return f"""Patient {patient_name} has a fair chance of approval, we need their last 3 months' bank statement to assess their application.
 
 Upload bank statement by clicking on the link below.
@@ -3336,7 +3933,8 @@ Upload bank statement by clicking on the link below.
                             elif selected_lender == "FIBE" and lender_decision == "INCOME VERIFICATION REQUIRED":
                                 # Get bank statement webview URL for FIBE
                                 bank_statement_webview_response = self.api_client.get_bank_statement_webview_url(loan_id)
-                                logger.info(f"Session {session_id}: Bank statement webview response for loan_id {loan_id}: {json.dumps(bank_statement_webview_response) if bank_statement_webview_response else 'None'}")
+                                if logger.isEnabledFor(logging.DEBUG):
+                                    logger.debug("Session %s: Bank statement webview response for loan_id %s: %s", session_id, loan_id, _json_dumps(bank_statement_webview_response) if bank_statement_webview_response else 'None')
                                 
                                 redirection_url = None
                                 if bank_statement_webview_response and bank_statement_webview_response.get("status") == 200:
@@ -3344,7 +3942,7 @@ Upload bank statement by clicking on the link below.
                                     redirection_url = webview_data.get("redirectionUrl")
                                 
                                 if redirection_url:
-                                    logger.info(f"Session {session_id}: Using FIBE income verification flow with redirection URL: {redirection_url}")
+                                    logger.info("Session %s: Using FIBE income verification flow with redirection URL: %s", session_id, redirection_url)
                                     return f"""Patient {patient_name} has a fair chance of approval, we need their last 3 months' bank statement to assess their application.
 
 Upload bank statement by clicking on the link below.
@@ -3353,7 +3951,7 @@ Upload bank statement by clicking on the link below.
                                 else:
                                     # Fallback to default bank statement link if redirection URL not available
                                     bank_statement_link = f"https://carepay.money/patient/digibankstatement/{user_id}"
-                                    logger.info(f"Session {session_id}: Fallback to default bank statement link: {bank_statement_link}")
+                                    logger.info("Session %s: Fallback to default bank statement link: %s", session_id, bank_statement_link)
                                     return f"""Patient {patient_name} has a fair chance of approval, we need their last 3 months' bank statement to assess their application.
 
 Upload bank statement by clicking on the link below.
@@ -3373,7 +3971,7 @@ No-cost Credit & Debit Card EMI
 Re-enquire with your family member's details."""
                 
                 # Fallback: If no specific flow is triggered, use default logic
-                patient_name = session.get("data", {}).get("fullName", "")
+                patient_name = _dig(session, "data", "fullName", default="")
                 return f"""We regret to inform you that Patient {patient_name} is not eligible for the proposed loan amount.
 
 {patient_name} can try financing their treatment via No-Cost Credit & Debit Card EMI or someone from their immediate family can apply on their behalf.
@@ -3385,7 +3983,7 @@ No-cost Credit & Debit Card EMI
 Re-enquire with your family member's details."""
                 
         except Exception as e:
-            logger.error(f"Error handling additional details collection: {e}")
+            logger.error("Error handling additional details collection: %s", e)
             return "There was an error processing Patient's information. Please try again."
 
     def _get_profile_link(self, session_id: str) -> str:
@@ -3410,7 +4008,8 @@ Re-enquire with your family member's details."""
             
             # Call API to get profile completion link
             profile_link_response = self.api_client.get_profile_completion_link(doctor_id)
-            logger.info(f"Profile completion link response: {json.dumps(profile_link_response)}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Profile completion link response: %s", _json_dumps(profile_link_response))
             
             # Extract link from response
             if isinstance(profile_link_response, dict) and profile_link_response.get("status") == 200:
@@ -3447,13 +4046,13 @@ Re-enquire with your family member's details."""
                 return "Session not found. Please start a new conversation."
             
             # Get user_id from session data
-            user_id = session.get("data", {}).get("userId")
+            session_data = session.get("data") or {}
+            user_id = session_data.get("userId")
             if not user_id:
                 logger.error(f"Session {session_id}: User ID not found in session data")
                 return "User ID not found. Please start a new conversation."
             
             # Get loan_id from session data
-            session_data = session.get("data", {})
             loan_id = session_data.get("loanId")
             
             # Try to get loanId from API response with safe access
@@ -3508,8 +4107,10 @@ Re-enquire with your family member's details."""
                                     logger.info(f"Session {session_id}: Got redirection URL: {redirection_url}")
                                     
                                     # Update status to post_approval_address_details
-                                    SessionManager.update_session_data_field(session_id, "status", "post_approval_address_details")
-                                    SessionManager.update_session_data_field(session_id, "data.post_approval_address_details", datetime.now().isoformat())
+                                    SessionManager.update_session_data_fields(session_id, {
+                                        "status": "post_approval_address_details",
+                                        "data.post_approval_address_details": datetime.now().isoformat(),
+                                    })
                                     
                                     response_message = f"""
 Treatment is now just 3 steps away\n\n
@@ -3544,8 +4145,10 @@ Kindly confirm patient's address details by clicking below button.
 """
                 
                 # Update status to KYC pending
-                SessionManager.update_session_data_field(session_id, "status", "post_approval_address_details")
-                SessionManager.update_session_data_field(session_id, "data.post_approval_address_details", datetime.now().isoformat())
+                SessionManager.update_session_data_fields(session_id, {
+                    "status": "post_approval_address_details",
+                    "data.post_approval_address_details": datetime.now().isoformat(),
+                })
                 
                 logger.info(f"Session {session_id}: Updated status to post_approval_address_details and provided address details link")
                 
@@ -3589,7 +4192,7 @@ Kindly confirm patient's address details by clicking below button.
                 return "Session not found. Please start a new conversation."
             
             # Check if user message indicates address details are complete
-            if message.lower().strip() == "address details complete":
+            if message.strip().lower() == "address details complete":
                 # Get session data to construct URLs with session ID
                 session_data = session.get("data", {})
                 user_id = session_data.get("userId", "")
@@ -3648,8 +4251,10 @@ E-sign agreement using this link.
 [Agreement E-signing]{agreement_esigning_url}"""
                 
                 # Update status to kyc_step
-                SessionManager.update_session_data_field(session_id, "status", "kyc_step")
-                SessionManager.update_session_data_field(session_id, "data.address_details_completed", datetime.now().isoformat())
+                SessionManager.update_session_data_fields(session_id, {
+                    "status": "kyc_step",
+                    "data.address_details_completed": datetime.now().isoformat(),
+                })
                 
                 logger.info(f"Session {session_id}: Address details completed, status updated to kyc_step")
                 
@@ -3663,18 +4268,20 @@ E-sign agreement using this link.
             return "There was an error processing your request. Please try again."
 
 
-    def _process_employment_data_from_additional_details(self, session_id: str) -> Dict[str, Any]:
+    def _process_employment_data_from_additional_details(self, session_id: str, session: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
         Process employment data from additional details collected
         
         Args:
             session_id: Session identifier
+            session: Already-loaded session to build from instead of reading it again
             
         Returns:
             Employment data dict ready for API
         """
         try:
-            session = SessionManager.get_session_from_db(session_id)
+            if session is None:
+                session = SessionManager.get_session_from_db(session_id)
             if not session:
                 logger.error(f"Session {session_id} not found")
                 return {}
@@ -3714,19 +4321,21 @@ E-sign agreement using this link.
             logger.error(f"Error processing employment data from additional details: {e}")
             return {}
 
-    def _process_loan_data_from_additional_details(self, session_id: str) -> Dict[str, Any]:
+    def _process_loan_data_from_additional_details(self, session_id: str, session: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
         Process loan data from additional details collected
         
         Args:
             session_id: Session identifier
+            session: Already-loaded session to build from instead of reading it again
 
         Returns:
             Loan data dict ready for API
         """
         try:
-            # Get session from database instead of self.sessions
-            session = SessionManager.get_session_from_db(session_id)
+            if session is None:
+                # Get session from database instead of self.sessions
+                session = SessionManager.get_session_from_db(session_id)
             if not session:
                 logger.error(f"Session {session_id} not found")
                 return {}
@@ -3772,18 +4381,20 @@ E-sign agreement using this link.
             return {}
         
 
-    def _process_basic_details_from_additional_details(self, session_id: str) -> Dict[str, Any]:
+    def _process_basic_details_from_additional_details(self, session_id: str, session: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
         Process basic details from additional details collected
         
         Args:
             session_id: Session identifier
+            session: Already-loaded session to build from instead of reading it again
 
         Returns:
             Basic details dict ready for API
         """
         try:
-            session = SessionManager.get_session_from_db(session_id)
+            if session is None:
+                session = SessionManager.get_session_from_db(session_id)
             if not session:
                 logger.error(f"Session {session_id} not found")
                 return {}
@@ -3809,25 +4420,12 @@ E-sign agreement using this link.
             
             # Map marital status: 1 -> Yes, 2 -> No
             if "marital_status" in additional_details:
-                marital_status_map = {
-                    "1": "Yes",
-                    "2": "No"
-                }
-                logger.info(f"Processing marital status: raw_value='{additional_details['marital_status']}', mapped_value='{marital_status_map.get(additional_details['marital_status'], additional_details['marital_status'])}'")
-                basic_details["maritalStatus"] = marital_status_map.get(additional_details["marital_status"], additional_details["marital_status"])
+                logger.info(f"Processing marital status: raw_value='{additional_details['marital_status']}', mapped_value='{_MARITAL_STATUS_API_VALUES.get(additional_details['marital_status'], additional_details['marital_status'])}'")
+                basic_details["maritalStatus"] = _MARITAL_STATUS_API_VALUES.get(additional_details["marital_status"], additional_details["marital_status"])
             
             # Map education qualification to appropriate values
             if "education_qualification" in additional_details:
-                education_level_map = {
-                    "1": "LESS THAN 10TH",
-                    "2": "PASSED 10TH",
-                    "3": "PASSED 12TH",
-                    "4": "DIPLOMA",
-                    "5": "GRADUATION",
-                    "6": "POST GRADUATION",
-                    "7": "P.H.D."
-                }
-                basic_details["educationLevel"] = education_level_map.get(additional_details["education_qualification"], additional_details["education_qualification"])
+                basic_details["educationLevel"] = _EDUCATION_LEVEL_API_VALUES.get(additional_details["education_qualification"], additional_details["education_qualification"])
             
             return basic_details
 
@@ -3835,22 +4433,29 @@ E-sign agreement using this link.
             logger.error(f"Error processing basic details from additional details: {e}")
             return {}
 
-    def _create_session_aware_tools(self, session_id: str):
+    def _create_session_aware_tools(self, session_id: Optional[str]):
         """
         Create tools that are aware of the current session_id
         
         Args:
-            session_id: Current session identifier
+            session_id: Current session identifier (None for tools only used for their schemas)
             
         Returns:
             List of tools with session_id bound
         """
-        logger.info(f"Creating session-aware tools for session_id: {session_id}")
+        logger.debug("Creating session-aware tools for session_id: %s", session_id)
         tools = [
             StructuredTool.from_function(
                 func=lambda fullName, phoneNumber, treatmentCost, monthlyIncome: self.store_user_data_structured(fullName, phoneNumber, treatmentCost, monthlyIncome, session_id),
                 name="store_user_data",
                 description="Store user data in session with the four parameters: fullName, phoneNumber, treatmentCost, monthlyIncome",
+                args_schema=InitialUserData,
+                handle_validation_error=True,
+            ),
+            Tool(
+                name="start_loan_application",
+                func=lambda _: self.start_loan_application(session_id),
+                description="Run Workflow A steps 2-5 (get_user_id_from_phone_number, save_basic_details, save_loan_details, check_jp_cardless) in one call using session_id. Call this once right after store_user_data.",
             ),
             Tool(
                 name="get_user_id_from_phone_number",
@@ -3866,12 +4471,19 @@ E-sign agreement using this link.
                 func=lambda fullName, treatmentCost, userId: self.save_loan_details_structured(fullName, treatmentCost, userId, session_id),
                 name="save_loan_details",
                 description="Save user's loan details with fullName, treatmentCost, and userId parameters.",
+                args_schema=LoanDetailsInput,
+                handle_validation_error=True,
             ),
             Tool(
                 name="check_jp_cardless",
                 func=lambda _: self.check_jp_cardless(session_id),
                 description="Check eligibility for Juspay Cardless",
             ),
+            Tool(
+                name="run_post_prefill_chain",
+                func=lambda _: self.run_post_prefill_chain(session_id),
+                description="Run Workflow A steps 6-12 (get_prefill_data, process_address_data, process_prefill_data, pan_verification, get_employment_verification, save_employment_details, get_bureau_decision) in one call using session_id. CRITICAL: When it returns the bureau decision, that is the FINAL formatted message and MUST be returned to the user EXACTLY as provided.",
+            ),
             Tool(
                 name="get_prefill_data",
                 func=lambda user_id=None: self.get_prefill_data(user_id, session_id),
@@ -3929,6 +4541,8 @@ E-sign agreement using this link.
                       pincode, session_id
                 ),
                 name="save_missing_basic_and_address_details",
+                args_schema=PincodeInput,
+                handle_validation_error=True,
                 description=(
                     "Save address details when pincode is provided. Use this in two scenarios: "
                     "1. When user needs to provide pincode (Workflow B) - collect 6-digit pincode. "
@@ -3956,6 +4570,13 @@ E-sign agreement using this link.
                 func=lambda education_level: self.save_education_level_details(education_level, session_id),
                 description="Save user's education level details. Use this when user provides their education level information like 'P.H.D', 'Graduation', 'Post graduation', 'Diploma', 'Passed 12th', 'Passed 10th', 'Less than 10th', or numbers 1-7. The system will automatically format it to the correct API format (LESS THAN 10TH, PASSED 10TH, etc.). Call this tool immediately when user provides education level selection.",
             ),
+            StructuredTool.from_function(
+                func=lambda gender=None, marital_status=None, education_level=None: self.save_profile_details(session_id, gender, marital_status, education_level),
+                name="save_profile_details",
+                description="Save two or more of the user's gender, marital status and education level with one call. Use this instead of calling save_gender_details, save_marital_status_details and save_education_level_details separately when the user provides several of them in one message.",
+                args_schema=ProfileDetailsInput,
+                handle_validation_error=True,
+            ),
             Tool(
                 name="correct_treatment_reason",
                 func=lambda new_treatment_reason: self.correct_treatment_name(new_treatment_reason, session_id),
@@ -4057,6 +4678,8 @@ E-sign agreement using this link.
                     logger.info(f"Session {session_id}: Found bureau decision in api_responses: {api_bureau_decision}")
                     # Try to extract and save it
                     if isinstance(api_bureau_decision, dict) and api_bureau_decision.get("status") == 200:
+                        # Responses stored before plans were normalized on arrival
+                        _normalize_emi_plans(api_bureau_decision)
                         extracted_bureau = self.extract_bureau_decision_details(api_bureau_decision, session_id)
                         SessionManager.update_session_data_field(session_id, "data.bureau_decision_details", extracted_bureau)
                         logger.info(f"Session {session_id}: Extracted and saved bureau decision from api_responses")
@@ -4252,6 +4875,153 @@ Continue your journey with the link here:\n\n
             SessionManager.update_session_data_field(session_id, "data.juspay_cardless_status", "ERROR")
             return {"status": "EXCEPTION", "message": "An unexpected error occurred while checking Juspay Cardless eligibility."}
 
+
+
+    def start_loan_application(self, session_id: str) -> str:
+        """
+        Run Workflow A steps 2-5 (user ID creation, basic details, loan details and
+        Juspay Cardless check) in sequence without an LLM turn between each step
+
+        Args:
+            session_id: Session identifier
+
+        Returns:
+            JSON string with the Juspay Cardless result, or the step that failed
+        """
+        try:
+            session = SessionManager.get_session_from_db(session_id)
+            if not session:
+                return _ERR_SESSION_NOT_FOUND
+            data = session.get("data") or {}
+
+            # Step 2: User ID creation
+            phone_number = data.get("phoneNumber") or data.get("mobileNumber")
+            if not phone_number:
+                return _ERR_PHONE_REQUIRED
+            self.get_user_id_from_phone_number(str(phone_number), session_id)
+
+            session = SessionManager.get_session_from_db(session_id)
+            data = (session or {}).get("data") or {}
+            user_id = data.get("userId")
+            if not user_id:
+                api_status = _dig(data, "api_responses", "get_user_id_from_phone_number", "status", default=500)
+                return _json_dumps({"status": api_status, "failed_step": "get_user_id_from_phone_number", "message": "Please ask for a valid phone number"})
+
+            # Step 3: Basic details submission
+            basic_result = self.save_basic_details(session_id)
+
+            # Step 4: Save loan details
+            loan_result = self.save_loan_details(_json_dumps({
+                "fullName": data.get("fullName"),
+                "treatmentCost": data.get("treatmentCost"),
+                "userId": user_id
+            }), session_id)
+
+            # Step 5: Check for cardless loan
+            cardless_result = self.check_jp_cardless(session_id)
+
+            return _json_dumps({
+                "status": cardless_result.get("status"),
+                "message": cardless_result.get("message"),
+                "userId": user_id,
+                "save_basic_details": basic_result,
+                "save_loan_details": loan_result
+            })
+        except Exception as e:
+            logger.error(f"Error starting loan application for session {session_id}: {e}")
+            return _json_dumps({"status": "error", "message": f"Error starting loan application: {str(e)}"})
+
+
+    def _prefetch_prefill_details_save(self, session_id: str) -> Optional[Future]:
+        """
+        Start step 8's save_prefill_details call in the background so it overlaps
+        step 7's pincode lookup and address saves. The payload is built here from
+        the stored prefill response; process_prefill_data_for_basic_details stores
+        the response when it consumes the future.
+
+        Args:
+            session_id: Session identifier
+
+        Returns:
+            Future resolving to the API response, or None if there is no userId, the
+            prefill address lacks a valid pincode (step 7 would stop the chain) or the
+            same details were saved successfully a moment ago
+        """
+        user_id, session_data = self._resolve(session_id)
+        if not user_id:
+            return None
+        address_fields, _ = _derived_from_prefill(session_data, "address_fields", _extract_address_fields)
+        if not address_fields or not _is_valid_pincode(address_fields["pincode"]):
+            return None
+        data, _ = _prefill_details_payload(user_id, session_data)
+        if _replayable_save(session_data, "save_prefill_details", _input_hash(data)) is not None:
+            return None
+        return _API_PREFETCH_EXECUTOR.submit(self.api_client.save_prefill_details, user_id, data)
+
+    def run_post_prefill_chain(self, session_id: str) -> str:
+        """
+        Run Workflow A steps 6-12 (prefill, address, basic details, PAN verification,
+        employment verification, employment details and bureau decision) in sequence
+        without an LLM turn between each step. Stops at the first step that needs
+        user input and returns that step's result. The step 8 save only needs the
+        prefill response, so it overlaps step 7. Employment verification runs only
+        once the PAN is saved and verified, since its result depends on the PAN.
+
+        Args:
+            session_id: Session identifier
+
+        Returns:
+            Formatted bureau decision response, or JSON string of the step that stopped the chain
+        """
+        def parse(result: str) -> Dict[str, Any]:
+            try:
+                parsed = orjson.loads(result)
+                return parsed if isinstance(parsed, dict) else {}
+            except (TypeError, ValueError):
+                return {}
+
+        prefill_save_future = None
+        try:
+            # Step 6: Data prefill (status 500 switches to Workflow B)
+            prefill_result = self.get_prefill_data(None, session_id)
+            if parse(prefill_result).get("status") != 200:
+                return prefill_result
+
+            # Step 7: Address processing
+            prefill_save_future = self._prefetch_prefill_details_save(session_id)
+            address_result = self.process_address_data(session_id)
+            if parse(address_result).get("status") in ("missing_pincode", "invalid_pincode"):
+                return address_result
+
+            # Step 8: Basic details from prefill data
+            basic_result = self.process_prefill_data_for_basic_details(session_id, prefetched=prefill_save_future)
+            prefill_save_future = None
+            if parse(basic_result).get("status") == "missing_details":
+                return basic_result
+
+            # Step 9: PAN verification
+            pan_result = parse(self.pan_verification(session_id))
+            pan_data = pan_result.get("data")
+            if pan_result.get("status") != 200 or (isinstance(pan_data, dict) and pan_data.get("status") != 200):
+                return _json_dumps({
+                    "status": "need_pan",
+                    "failed_step": "pan_verification",
+                    "pan_verification": pan_result
+                })
+
+            # Steps 10-11: Employment verification (continue even if it fails) and details
+            self.get_employment_verification(session_id)
+            self.save_employment_details(session_id)
+
+            # Step 12: Bureau decision
+            return self.get_bureau_decision(session_id)
+        except Exception as e:
+            logger.error(f"Error running post-prefill chain for session {session_id}: {e}")
+            return _json_dumps({"status": "error", "message": f"Error running post-prefill chain: {str(e)}"})
+        finally:
+            # Chain stopped early: store the prefetched save's response so step 8 sees it
+            if prefill_save_future is not None:
+                self.process_prefill_data_for_basic_details(session_id, prefetched=prefill_save_future)
     
     def _format_bureau_decision_response(self, bureau_decision: Dict[str, Any], session_id: str) -> str:
         """
@@ -4262,7 +5032,7 @@ Continue your journey with the link here:\n\n
             session_id: Session identifier
             
         Returns:
-            Formatted response message
+            Formatted response message; every path, including errors, returns a string
         """
         try:
             session = SessionManager.get_session_from_db(session_id)
@@ -4278,7 +5048,7 @@ Continue your journey with the link here:\n\n
             
             if treatment_cost:
                 try:
-                    cost_value = float(str(treatment_cost).replace(',', '').replace('₹', ''))
+                    cost_value = float(str(treatment_cost).translate(_AMOUNT_STRIP))
                     show_detailed_approval = cost_value > 100000
                 except (ValueError, TypeError):
                     show_detailed_approval = False
@@ -4292,7 +5062,7 @@ Continue your journey with the link here:\n\n
                 
                     max_treatment_amount = bureau_decision.get("maxTreatmentAmount", 0)
                     try:
-                        max_treatment_amount = float(str(max_treatment_amount).replace(',', '').replace('₹', '')) if max_treatment_amount else 0
+                        max_treatment_amount = float(str(max_treatment_amount).translate(_AMOUNT_STRIP)) if max_treatment_amount else 0
                     except (ValueError, TypeError):
                         max_treatment_amount = 0
                     
@@ -4304,10 +5074,7 @@ payment plan for amount up to ₹{max_treatment_amount:,.0f}
 
 To proceed, please help me with a few more details.
 
-Patient's employment type:   
-1. SALARIED
-2. SELF_EMPLOYED
-Please Enter input 1 or 2 only"""
+{EMPLOYMENT_TYPE_PROMPT}"""
                     else:
                         return f"""
 We were only able to approve payment plans
@@ -4325,7 +5092,8 @@ for a treatment amount up to
                     try:
                         if hasattr(self.api_client, 'check_doctor_mapped_by_nbfc'):
                             check_doctor_mapped_by_nbfc_response = self.api_client.check_doctor_mapped_by_nbfc(doctor_id)
-                            logger.info(f"Session {session_id}: Check doctor mapped by FIBE response for REJECTED status - doctor_id {doctor_id}: {json.dumps(check_doctor_mapped_by_nbfc_response)}")
+                            if logger.isEnabledFor(logging.DEBUG):
+                                logger.debug("Session %s: Check doctor mapped by FIBE response for REJECTED status - doctor_id %s: %s", session_id, doctor_id, _json_dumps(check_doctor_mapped_by_nbfc_response))
                             
                             if check_doctor_mapped_by_nbfc_response.get("status") == 200:
                                 doctor_mapped_by_nbfc = check_doctor_mapped_by_nbfc_response.get("data")
@@ -4349,32 +5117,23 @@ Re-enquire with your family member's details."""
                     return f"""
 We need a few more details to better assess patient {patient_name}'s application.
 
-Patient's employment type:
-1. SALARIED
-2. SELF_EMPLOYED
-Please Enter input 1 or 2 only"""
+{EMPLOYMENT_TYPE_PROMPT}"""
             
             elif status and "income verification" in status.lower():
                 return f"""
 We need a few more details to better assess patient {patient_name}'s application.
 
-Patient's employment type:
-1. SALARIED
-2. SELF_EMPLOYED
-Please Enter input 1 or 2 only"""
+{EMPLOYMENT_TYPE_PROMPT}"""
             
             else:
                 # Default case for unknown status
                 logger.warning(f"Unknown bureau decision status: '{status}'")
                 return f"""Dear {patient_name}! We are processing Patient's loan application. Please wait while we check Patient's eligibility.
-Patient's employment type:
-1. SALARIED
-2. SELF_EMPLOYED
-Please Enter input 1 or 2 only"""
+{EMPLOYMENT_TYPE_PROMPT}"""
                 
         except Exception as e:
             logger.error(f"Error formatting bureau decision response: {e}")
-            return "There was an error processing the loan decision. Please try again."
+            return _BUREAU_FORMAT_ERROR
         
 
     def handle_pan_card_number(self, pan_number: str, session_id: str) -> dict:
@@ -4390,9 +5149,7 @@ Please Enter input 1 or 2 only"""
         """
         try:
             # Validate PAN card number format before processing
-            import re
-            pan_pattern = r'^[A-Z]{5}[0-9]{4}[A-Z]$'
-            if not pan_number or not re.match(pan_pattern, pan_number.strip().upper()):
+            if not pan_number or not _PAN_RE.fullmatch(pan_number.strip().upper()):
                 return {
                     'status': 'error',
                     'message': "Please provide a valid PAN card number (e.g., ABCDE1234F)."
@@ -4410,7 +5167,7 @@ Please Enter input 1 or 2 only"""
             user_id = None
             if isinstance(session_data.get('data'), str):
                 try:
-                    data = json.loads(session_data['data'])
+                    data = orjson.loads(session_data['data'])
                     user_id = data.get('userId')
                 except json.JSONDecodeError:
                     user_id = session_data.get('data')
@@ -4458,7 +5215,7 @@ Please Enter input 1 or 2 only"""
             # Parse the save result
             if isinstance(save_result, str):
                 try:
-                    save_result_data = json.loads(save_result)
+                    save_result_data = orjson.loads(save_result)
                 except json.JSONDecodeError:
                     save_result_data = {"status": 500, "message": "Invalid response from save_panCard_details"}
             else:
@@ -4470,6 +5227,9 @@ Please Enter input 1 or 2 only"""
                     'message': "Failed to save PAN card details. Please try again."
                 }
             
+            # Record the saved PAN; pan_verification keys its stored result on it
+            SessionManager.update_session_data_field(session_id, "data.panCard", pan_number)
+            
             return {
                 'status': 'success',
                 'session_id': session_id,
@@ -4506,16 +5266,17 @@ Please Enter input 1 or 2 only"""
             if not session:
                 return {"status": "error", "message": "Session not found"}
 
-            user_id = session.get("data", {}).get("userId")
+            session_data = session.get("data") or {}
+            user_id = session_data.get("userId")
             if not user_id:
                 return {"status": "error", "message": "User ID missing in session"}
 
             # Validate pincode
-            if not pincode or not re.match(r"^\d{6}$", pincode.strip()):
+            if not pincode or not _PINCODE_RE.fullmatch(pincode.strip()):
                 return {"status": "error", "message": "Pincode must be a 6-digit number."}
 
             # Check if we have extracted address data from process_address_data
-            extracted_address_data = session.get("data", {}).get("extracted_address_data", {})
+            extracted_address_data = session_data.get("extracted_address_data", {})
             
             # Prepare and enrich address data
             address_data = {
@@ -4545,7 +5306,7 @@ Please Enter input 1 or 2 only"""
             addr_resp = self.api_client.save_address_details(user_id, address_data)
             if isinstance(addr_resp, str):
                 try:
-                    addr_resp = json.loads(addr_resp)
+                    addr_resp = orjson.loads(addr_resp)
                 except json.JSONDecodeError:
                     addr_resp = {"status": 500}
             if addr_resp.get("status") != 200:
@@ -4558,8 +5319,8 @@ Please Enter input 1 or 2 only"""
             except Exception:
                 pass
 
-            # Store the API response
-            SessionManager.update_session_data_field(session_id, "data.api_responses.save_missing_address_details", addr_resp)
+            # Record the API response (audit only)
+            SessionManager.update_session_data_fields(session_id, {"data.api_responses.save_missing_address_details": addr_resp})
 
             return {
                 "status": "success",
@@ -4584,9 +5345,7 @@ Please Enter input 1 or 2 only"""
         """
         try:
             # Basic email validation
-            import re
-            email_pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-            if not re.match(email_pattern, email_address):
+            if not _EMAIL_RE.fullmatch(email_address):
                 return {
                     'status': 'error',
                     'message': "Please provide a valid email address."
@@ -4604,7 +5363,7 @@ Please Enter input 1 or 2 only"""
             user_id = None
             if isinstance(session_data.get('data'), str):
                 try:
-                    data = json.loads(session_data['data'])
+                    data = orjson.loads(session_data['data'])
                     user_id = data.get('userId')
                 except json.JSONDecodeError:
                     user_id = session_data.get('data')
@@ -4652,7 +5411,7 @@ Please Enter input 1 or 2 only"""
             # Parse the save result
             if isinstance(save_result, str):
                 try:
-                    save_result_data = json.loads(save_result)
+                    save_result_data = orjson.loads(save_result)
                 except json.JSONDecodeError:
                     save_result_data = {"status": 500, "message": "Invalid response from save_emailaddress_details"}
             else:
@@ -4665,7 +5424,7 @@ Please Enter input 1 or 2 only"""
                 }
             
             import json
-            return json.dumps({
+            return _json_dumps({
                 'status': 'success',
                 'message': "Email address saved successfully. Now continuing with the remaining verification steps automatically...",
                 'data': {'emailId': email_address},
@@ -4677,7 +5436,7 @@ Please Enter input 1 or 2 only"""
         except Exception as e:
             logger.error(f"Error handling email address: {e}")
             import json
-            return json.dumps({
+            return _json_dumps({
                 'status': 'error',
                 'message': f"Error processing email address: {str(e)}"
             })
@@ -4686,8 +5445,10 @@ Please Enter input 1 or 2 only"""
         try:
             logger.info(f"Starting Aadhaar upload processing for session {session_id}")
             
-            # Extract Aadhaar details using OCR service
-            result = extract_aadhaar_details(document_path)
+            # Run OCR on the bounded pool and load the session while it is in flight
+            ocr_future = _OCR_EXECUTOR.submit(extract_aadhaar_details, document_path)
+            session_data = SessionManager.get_session_from_db(session_id)
+            result = ocr_future.result()
             logger.info(f"OCR extraction result: {result}")
             
             # Store the OCR result in session data
@@ -4701,8 +5462,6 @@ Please Enter input 1 or 2 only"""
                     'data': result
                 }
             
-            # Get session data
-            session_data = SessionManager.get_session_from_db(session_id)
             if not session_data:
                 return {
                     'status': 'error',
@@ -4713,7 +5472,7 @@ Please Enter input 1 or 2 only"""
             user_id = None
             if isinstance(session_data.get('data'), str):
                 try:
-                    data = json.loads(session_data['data'])
+                    data = orjson.loads(session_data['data'])
                     user_id = data.get('userId')
                 except json.JSONDecodeError:
                     user_id = session_data.get('data')
@@ -4766,7 +5525,7 @@ Please Enter input 1 or 2 only"""
             # Parse the save result
             if isinstance(save_result, str):
                 try:
-                    save_result_data = json.loads(save_result)
+                    save_result_data = orjson.loads(save_result)
                 except json.JSONDecodeError:
                     save_result_data = {"status": 500, "message": "Invalid response from save_basic_details"}
             else:
@@ -4790,7 +5549,7 @@ Please Enter input 1 or 2 only"""
                 if address_data.get('pincode') and len(address_data['pincode']) == 6:
                     try:
                         pincode_data = self.api_client.state_and_city_by_pincode(address_data['pincode'])
-                        logger.info(f"Pincode API response for pincode {address_data['pincode']}: {pincode_data}")
+                        logger.info("Pincode API response for pincode %s: status=%s city=%s state=%s", address_data['pincode'], *_pincode_log_fields(pincode_data))
                         if pincode_data and pincode_data.get("status") == "success":
                             # Only update if we get valid non-null data
                             if pincode_data.get("city") and pincode_data["city"] is not None:
@@ -4801,20 +5560,20 @@ Please Enter input 1 or 2 only"""
                         logger.warning(f"Failed to get city/state from pincode API: {e}")
                         # Continue with original data if API call fails
                 
-                logger.info(f"Final address data to save: {address_data}")
+                logger.info("Final address data to save: %s", _short(address_data))
                 
                 # Save address details
                 address_result = self.api_client.save_address_details(user_id, address_data)
                 address_permanent_result = self.api_client.save_permanent_address_details(user_id, address_data)
                 if isinstance(address_result, str):
                     try:
-                        address_result_data = json.loads(address_result)
+                        address_result_data = orjson.loads(address_result)
                     except json.JSONDecodeError:
                         address_result_data = {"status": 500, "message": "Invalid response from save_address_details"}
                 else:
                     address_result_data = address_result
 
-                logger.info(f"Address result: {address_result} and address_permanent_result: {address_permanent_result}")
+                logger.info("Address result: %s and address_permanent_result: %s", _short(address_result), _short(address_permanent_result))
                 
                 if address_result_data.get('status') != 200:
                     return {
@@ -4854,12 +5613,13 @@ Please Enter input 1 or 2 only"""
             if not session:
                 return "Session not found"
 
-            user_id = session.get("data", {}).get("userId")
+            session_data = session.get("data") or {}
+            user_id = session_data.get("userId")
             if not user_id:
                 return "User ID not found in session"
 
             # Get mobile number from session
-            mobile_number = session.get("data", {}).get("mobileNumber") or session.get("data", {}).get("phoneNumber")
+            mobile_number = session_data.get("mobileNumber") or session_data.get("phoneNumber")
 
             # Prepare data for API
             details = {
@@ -4868,20 +5628,20 @@ Please Enter input 1 or 2 only"""
                 "userId": user_id
             }
 
-            # Store the data being sent to the API
-            SessionManager.update_session_data_field(session_id, "data.api_requests.save_gender_details", {
-                "user_id": user_id,
-                "details": details.copy()
-            })
-
             # Call API
             result = self.api_client.save_gender_details(user_id, details)
 
-            # Store the API response
-            SessionManager.update_session_data_field(session_id, "data.api_responses.save_gender_details", result)
+            # Record the data sent to the API and its response (audit only)
+            SessionManager.update_session_data_fields(session_id, {
+                "data.api_requests.save_gender_details": {
+                    "user_id": user_id,
+                    "details": details.copy()
+                },
+                "data.api_responses.save_gender_details": result,
+            })
 
             import json
-            return json.dumps({
+            return _json_dumps({
                 'status': 'success',
                 'message': "Gender saved successfully. Now proceeding to PAN verification and employment verification steps. Please wait while I process the next steps automatically.",
                 'data': result,
@@ -4891,7 +5651,7 @@ Please Enter input 1 or 2 only"""
         except Exception as e:
             logger.error(f"Error saving gender details: {e}")
             import json
-            return json.dumps({
+            return _json_dumps({
                 'status': 'error',
                 'message': f"Error saving gender details: {str(e)}"
             })
@@ -4914,12 +5674,13 @@ Please Enter input 1 or 2 only"""
             if not session:
                 return "Session not found"
 
-            user_id = session.get("data", {}).get("userId")
+            session_data = session.get("data") or {}
+            user_id = session_data.get("userId")
             if not user_id:
                 return "User ID not found in session"
 
             # Get mobile number from session
-            mobile_number = session.get("data", {}).get("mobileNumber") or session.get("data", {}).get("phoneNumber")
+            mobile_number = session_data.get("mobileNumber") or session_data.get("phoneNumber")
 
             # Format marital status to correct API format
             formatted_marital_status = self._format_marital_status(marital_status)
@@ -4933,19 +5694,19 @@ Please Enter input 1 or 2 only"""
                 "userId": user_id
             }
 
-            # Store the data being sent to the API
-            SessionManager.update_session_data_field(session_id, "data.api_requests.save_marital_status_details", {
-                "user_id": user_id,
-                "details": details.copy()
-            })
-
             # Call API
             result = self.api_client.save_marital_status_details(user_id, details)
 
-            # Store the API response
-            SessionManager.update_session_data_field(session_id, "data.api_responses.save_marital_status_details", result)
+            # Record the data sent to the API and its response (audit only)
+            SessionManager.update_session_data_fields(session_id, {
+                "data.api_requests.save_marital_status_details": {
+                    "user_id": user_id,
+                    "details": details.copy()
+                },
+                "data.api_responses.save_marital_status_details": result,
+            })
 
-            return json.dumps(result)
+            return _api_response_json(result)
 
         except Exception as e:
             logger.error(f"Error saving marital status details: {e}")
@@ -4969,12 +5730,13 @@ Please Enter input 1 or 2 only"""
             if not session:
                 return "Session not found"
 
-            user_id = session.get("data", {}).get("userId")
+            session_data = session.get("data") or {}
+            user_id = session_data.get("userId")
             if not user_id:
                 return "User ID not found in session"
 
             # Get mobile number from session
-            mobile_number = session.get("data", {}).get("mobileNumber") or session.get("data", {}).get("phoneNumber")
+            mobile_number = session_data.get("mobileNumber") or session_data.get("phoneNumber")
 
             # Format education level to correct API format
             formatted_education_level = self._format_education_level(education_level)
@@ -4987,24 +5749,78 @@ Please Enter input 1 or 2 only"""
                 "userId": user_id
             }
 
-            # Store the data being sent to the API
-            SessionManager.update_session_data_field(session_id, "data.api_requests.save_education_level_details", {
-                "user_id": user_id,
-                "details": details.copy()
-            })
-
             # Call API
             result = self.api_client.save_education_level_details(user_id, details)
 
-            # Store the API response
-            SessionManager.update_session_data_field(session_id, "data.api_responses.save_education_level_details", result)
+            # Record the data sent to the API and its response (audit only)
+            SessionManager.update_session_data_fields(session_id, {
+                "data.api_requests.save_education_level_details": {
+                    "user_id": user_id,
+                    "details": details.copy()
+                },
+                "data.api_responses.save_education_level_details": result,
+            })
 
-            return json.dumps(result)
+            return _api_response_json(result)
 
         except Exception as e:
             logger.error(f"Error saving education level details: {e}")
             return f"Error saving education level details: {str(e)}"
 
+    def save_profile_details(self, session_id: str, gender: Optional[str] = None, marital_status: Optional[str] = None,
+                             education_level: Optional[str] = None) -> str:
+        """
+        Save any of gender, marital status and education level with a single API call
+
+        Args:
+            session_id: Session identifier
+            gender: User's gender (Male/Female/Other), optional
+            marital_status: User's marital status input, optional
+            education_level: User's education level input, optional
+
+        Returns:
+            Save result as JSON string
+        """
+        logger.info(f"save_profile_details called with: gender='{gender}', marital_status='{marital_status}', education_level='{education_level}', session_id='{session_id}'")
+        try:
+            session = SessionManager.get_session_from_db(session_id)
+            if not session:
+                return "Session not found"
+
+            data = session.get("data") or {}
+            user_id = data.get("userId")
+            if not user_id:
+                return "User ID not found in session"
+
+            # Prepare data for API, formatting the values the same way as the single-field tools
+            details = {
+                "gender": gender or None,
+                "maritalStatus": self._format_marital_status(marital_status) if marital_status else None,
+                "educationLevel": self._format_education_level(education_level) if education_level else None,
+                "mobileNumber": data.get("mobileNumber") or data.get("phoneNumber"),
+                "userId": user_id
+            }
+            if not (details["gender"] or details["maritalStatus"] or details["educationLevel"]):
+                return _ERR_NO_PROFILE_DETAILS
+
+            # Call API
+            result = self.api_client.save_profile_details(user_id, details)
+
+            # Record the data sent to the API and its response (audit only)
+            SessionManager.update_session_data_fields(session_id, {
+                "data.api_requests.save_profile_details": {
+                    "user_id": user_id,
+                    "details": details
+                },
+                "data.api_responses.save_profile_details": result,
+            })
+
+            return _api_response_json(result)
+
+        except Exception as e:
+            logger.error(f"Error saving profile details: {e}")
+            return f"Error saving profile details: {str(e)}"
+
     def correct_treatment_name(self, new_treatment_reason: str, session_id: str) -> str:
         """
         Correct/update the treatment reason in the loan application
@@ -5260,7 +6076,7 @@ Please Enter input 1 or 2 only"""
             pan_response = self.api_client.save_panCard_details(user_id, pan_details)
             
             if pan_response.get("status") != 200:
-                logger.error(f"Failed to save PAN card number: {pan_response}")
+                logger.error("Failed to save PAN card number: %s", pan_response)
                 return {
                     'status': 'error',
                     'message': f'Failed to save PAN card number: {pan_response.get("error", "Unknown error")}'
@@ -5285,32 +6101,27 @@ Please Enter input 1 or 2 only"""
                 basic_response = self.api_client.save_basic_details(user_id, details_to_save)
                 
                 if basic_response.get("status") != 200:
-                    logger.warning(f"Failed to save additional PAN details: {basic_response}")
+                    logger.warning("Failed to save additional PAN details: %s", basic_response)
                     # Continue anyway as PAN card number was saved successfully
             
-            # Update session with extracted data
-            SessionManager.update_session_data_field(session_id, "data.panCard", pan_card_number)
+            # Update session with extracted data and the OCR result in one write
+            updates = {"data.panCard": pan_card_number}
             if person_name:
-                SessionManager.update_session_data_field(session_id, "data.fullName", person_name)
+                updates["data.fullName"] = person_name
             if date_of_birth:
-                SessionManager.update_session_data_field(session_id, "data.dateOfBirth", date_of_birth)
-
+                updates["data.dateOfBirth"] = date_of_birth
             if father_name:
-                SessionManager.update_session_data_field(session_id, "data.fatherName", father_name)
-            
-            # Store OCR result in session
-            SessionManager.update_session_data_field(session_id, "data.pan_ocr_result", ocr_result)
+                updates["data.fatherName"] = father_name
+            updates["data.pan_ocr_result"] = ocr_result
+            SessionManager.update_session_data_fields(session_id, updates)
             
             # Prepare success message
-            success_parts = [f"✅ PAN card number: {pan_card_number}"]
-            if person_name:
-                success_parts.append(f"Name: {person_name}")
-            if date_of_birth:
-                success_parts.append(f"Date of Birth: {date_of_birth}")
-            if father_name:
-                success_parts.append(f"Father's Name: {father_name}")
-            
-            success_message = " | ".join(success_parts)
+            success_message = " | ".join(part for part in (
+                f"✅ PAN card number: {pan_card_number}",
+                f"Name: {person_name}" if person_name else None,
+                f"Date of Birth: {date_of_birth}" if date_of_birth else None,
+                f"Father's Name: {father_name}" if father_name else None,
+            ) if part)
             
             return {
                 'status': 'success',
@@ -5319,7 +6130,7 @@ Please Enter input 1 or 2 only"""
             }
             
         except Exception as e:
-            logger.error(f"Error in handle_pan_card_upload: {e}")
+            logger.error("Error in handle_pan_card_upload: %s", e)
             return {
                 'status': 'error',
                 'message': f'Error processing PAN card: {str(e)}'
@@ -5335,33 +6146,29 @@ Please Enter input 1 or 2 only"""
         Returns:
             Formatted marital status for API
         """
-        logger.info(f"_format_marital_status called with: '{marital_status}'")
+        logger.debug("_format_marital_status called with: %r", marital_status)
         
         if not marital_status:
-            logger.info("Empty marital status, returning 'No'")
+            logger.debug("Empty marital status, returning 'No'")
             return "No"
         
         # Convert to lowercase for easier comparison
-        status_lower = marital_status.lower().strip()
-        logger.info(f"Lowercase status: '{status_lower}'")
-        
-        # Map various inputs to correct API format
-        married_variants = ["married", "yes", "1", "marriage"]
-        unmarried_variants = ["unmarried", "single", "no", "2", "unmarried/single", "unmarried or single"]
+        status_lower = marital_status.strip().lower()
+        logger.debug("Lowercase status: %r", status_lower)
         
-        if status_lower in married_variants:
-            logger.info(f"Matched married variant: '{status_lower}' -> 'Yes'")
+        if status_lower in _MARRIED:
+            logger.debug("Matched married variant: %r -> 'Yes'", status_lower)
             return "Yes"
-        elif status_lower in unmarried_variants:
-            logger.info(f"Matched unmarried variant: '{status_lower}' -> 'No'")
+        elif status_lower in _UNMARRIED:
+            logger.debug("Matched unmarried variant: %r -> 'No'", status_lower)
             return "No"
         else:
             # If it's already in correct format, return as-is
-            if marital_status in ["Yes", "No"]:
-                logger.info(f"Already in correct format: '{marital_status}'")
+            if marital_status in _MS_CANONICAL:
+                logger.debug("Already in correct format: %r", marital_status)
                 return marital_status
             # Default to "No" for unrecognized values
-            logger.warning(f"Unrecognized marital status: '{marital_status}', defaulting to 'No'")
+            logger.warning("Unrecognized marital status: %r, defaulting to 'No'", marital_status)
             return "No"
 
     def _format_education_level(self, education_level: str) -> str:
@@ -5378,93 +6185,26 @@ Please Enter input 1 or 2 only"""
             return "LESS THAN 10TH"
         
         # Convert to lowercase for easier comparison
-        level_lower = education_level.lower().strip()
+        level_lower = education_level.strip().lower()
         
-        # Map various inputs to correct API format
-        education_mapping = {
-            # Number mappings
-            "1": "LESS THAN 10TH",
-            "2": "PASSED 10TH", 
-            "3": "PASSED 12TH",
-            "4": "DIPLOMA",
-            "5": "GRADUATION",
-            "6": "POST GRADUATION",
-            "7": "P.H.D.",
-            
-            # Text mappings
-            "less than 10th": "LESS THAN 10TH",
-            "less than 10": "LESS THAN 10TH",
-            "below 10th": "LESS THAN 10TH",
-            "below 10": "LESS THAN 10TH",
-            "under 10th": "LESS THAN 10TH",
-            "under 10": "LESS THAN 10TH",
-            
-            "passed 10th": "PASSED 10TH",
-            "10th": "PASSED 10TH",
-            "10th standard": "PASSED 10TH",
-            "sslc": "PASSED 10TH",
-            
-            "passed 12th": "PASSED 12TH",
-            "12th": "PASSED 12TH",
-            "12th standard": "PASSED 12TH",
-            "hsc": "PASSED 12TH",
-            "higher secondary": "PASSED 12TH",
-            
-            "diploma": "DIPLOMA",
-            "diploma course": "DIPLOMA",
-            
-            "graduation": "GRADUATION",
-            "graduate": "GRADUATION",
-            "bachelor": "GRADUATION",
-            "bachelor's": "GRADUATION",
-            "bachelors": "GRADUATION",
-            "b.tech": "GRADUATION",
-            "b.e": "GRADUATION",
-            "b.com": "GRADUATION",
-            "b.sc": "GRADUATION",
-            "b.a": "GRADUATION",
-            "b.b.a": "GRADUATION",
-            "b.c.a": "GRADUATION",
-            
-            "post graduation": "POST GRADUATION",
-            "post graduate": "POST GRADUATION",
-            "postgraduate": "POST GRADUATION",
-            "master": "POST GRADUATION",
-            "master's": "POST GRADUATION",
-            "masters": "POST GRADUATION",
-            "m.tech": "POST GRADUATION",
-            "m.e": "POST GRADUATION",
-            "m.com": "POST GRADUATION",
-            "m.sc": "POST GRADUATION",
-            "m.a": "POST GRADUATION",
-            "m.b.a": "POST GRADUATION",
-            "m.c.a": "POST GRADUATION",
-            
-            "p.h.d": "P.H.D.",
-            "phd": "P.H.D.",
-            "doctorate": "P.H.D.",
-            "doctor of philosophy": "P.H.D.",
-            "ph.d": "P.H.D.",
-            "ph.d.": "P.H.D.",
-        }
-        
-        # Check if it's already in correct format
-        if education_level in ["LESS THAN 10TH", "PASSED 10TH", "PASSED 12TH", "DIPLOMA", "GRADUATION", "POST GRADUATION", "P.H.D."]:
-            return education_level
-        
-        # Try to find a match
-        for key, value in education_mapping.items():
-            if level_lower == key.lower():
-                return value
+        # Already in correct format or a known alias
+        mapped = _EDU_UNIFIED.get(level_lower)
+        if mapped:
+            return mapped
         
         # If no exact match, try partial matching
-        for key, value in education_mapping.items():
-            if key.lower() in level_lower or level_lower in key.lower():
-                logger.info(f"Partial match found for education level: '{education_level}' -> '{value}'")
+        match = _EDU_RE.search(level_lower)
+        if match:
+            value = _EDU_MAP[match.group(0)]
+            logger.info("Partial match found for education level: %r -> %r", education_level, value)
+            return value
+        for key, value in _EDU_MAP.items():
+            if level_lower in key:
+                logger.info("Partial match found for education level: %r -> %r", education_level, value)
                 return value
         
         # Default to "LESS THAN 10TH" for unrecognized values
-        logger.warning(f"Unrecognized education level: '{education_level}', defaulting to 'LESS THAN 10TH'")
+        logger.warning("Unrecognized education level: %r, defaulting to 'LESS THAN 10TH'", education_level)
         return "LESS THAN 10TH"
 
     def save_gender_B_details(self, gender: str, session_id: str) -> str:
@@ -5478,19 +6218,20 @@ Please Enter input 1 or 2 only"""
         Returns:
             Save result as JSON string
         """
-        logger.info(f"save_gender_B_details called with: gender='{gender}', session_id='{session_id}'")
+        logger.info("save_gender_B_details called with: gender=%r, session_id=%r", gender, session_id)
         try:
             # Get user ID from session
             session = SessionManager.get_session_from_db(session_id)
             if not session:
                 return "Session not found"
 
-            user_id = session.get("data", {}).get("userId")
+            data = session.get("data") or {}
+            user_id = data.get("userId")
             if not user_id:
                 return "User ID not found in session"
 
             # Get mobile number from session
-            mobile_number = session.get("data", {}).get("mobileNumber") or session.get("data", {}).get("phoneNumber")
+            mobile_number = data.get("mobileNumber") or data.get("phoneNumber")
 
             # Prepare data for API
             details = {
@@ -5499,20 +6240,19 @@ Please Enter input 1 or 2 only"""
                 "userId": user_id
             }
 
-            # Store the data being sent to the API
-            SessionManager.update_session_data_field(session_id, "data.api_requests.save_gender_B_details", {
-                "user_id": user_id,
-                "details": details.copy()
-            })
-
             # Call API
             result = self.api_client.save_gender_details(user_id, details)
 
-            # Store the API response
-            SessionManager.update_session_data_field(session_id, "data.api_responses.save_gender_B_details", result)
+            # Store the data sent to the API and its response in one write
+            SessionManager.update_session_data_fields(session_id, {
+                "data.api_requests.save_gender_B_details": {
+                    "user_id": user_id,
+                    "details": details
+                },
+                "data.api_responses.save_gender_B_details": result,
+            })
 
-            import json
-            return json.dumps({
+            return _json_dumps({
                 'status': 'success',
                 'message': "Gender saved successfully. process next steps(step 3)",
                 'data': result,
@@ -5520,9 +6260,29 @@ Please Enter input 1 or 2 only"""
             })
 
         except Exception as e:
-            logger.error(f"Error saving gender details: {e}")
-            import json
-            return json.dumps({
+            logger.error("Error saving gender details: %s", e)
+            return _json_dumps({
                 'status': 'error',
                 'message': f"Error saving gender details: {str(e)}"
-            })
\ No newline at end of file
+            })
+
+
+_agent_instance: Optional[CarepayAgent] = None
+_agent_instance_lock = threading.Lock()
+
+
+def get_agent() -> CarepayAgent:
+    """
+    Get the shared CarepayAgent instance, creating it on first use.
+    The agent keeps all per-session state in SessionManager, so one instance
+    can serve every request.
+
+    Returns:
+        Shared CarepayAgent instance
+    """
+    global _agent_instance
+    if _agent_instance is None:
+        with _agent_instance_lock:
+            if _agent_instance is None:
+                _agent_instance = CarepayAgent()
+    return _agent_instance
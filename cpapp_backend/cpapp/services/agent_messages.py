@@ -0,0 +1,46 @@
+"""
+Fixed user-facing messages returned verbatim by the CarepayAgent tools.
+
+The system prompt tells the model to relay formatted tool responses exactly as
+provided, so these strings are defined once here instead of being rebuilt in
+every handler.
+"""
+from typing import Final
+
+EMPLOYMENT_TYPE_PROMPT: Final[str] = (
+    "Patient's employment type:\n"
+    "1. SALARIED\n"
+    "2. SELF_EMPLOYED\n"
+    "Please Enter input 1 or 2 only"
+)
+
+MARITAL_PROMPT: Final[str] = (
+    "\n\nPatient's marital status:\n"
+    "1. Married\n"
+    "2. Unmarried/Single\n\n"
+    "Please Enter input 1 or 2 only"
+)
+
+EDUCATION_PROMPT: Final[str] = (
+    "\nPatient's education qualification: \n"
+    "1. Less than 10th\n"
+    "2. Passed 10th\n"
+    "3. Passed 12th\n"
+    "4. Diploma\n"
+    "5. Graduation\n"
+    "6. Post graduation\n"
+    "7. P.H.D\n\n"
+    "Please Enter input between 1 to 7 only"
+)
+
+TREATMENT_NAME_PROMPT: Final[str] = "\n\nWhat is the name of treatment?"
+
+EMAIL_PROMPT: Final[str] = "\n\nPatient's email address"
+
+ORGANIZATION_NAME_PROMPT: Final[str] = "\n\nOrganization Name where the patient works?"
+
+BUSINESS_NAME_PROMPT: Final[str] = "\n\nBusiness Name where the patient works?"
+
+WORKPLACE_PINCODE_PROMPT: Final[str] = "\n\nPatient's 6-digit workplace/office pincode"
+
+BUSINESS_PINCODE_PROMPT: Final[str] = "\n\nPatient's 6-digit business location pincode"
@@ -2,10 +2,38 @@ import os
 import requests
 import json
 import logging
-from typing import Dict, Any, Optional
+import orjson
+import threading
+import time
+from typing import Dict, Any, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
+# Short-lived cache of successful lookup responses shared by all client instances
+_RESPONSE_CACHE_TTL = 300  # seconds
+_RESPONSE_CACHE_MAX_SIZE = 4096
+_response_cache: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+_response_cache_lock = threading.Lock()
+# Pincode -> city/state mappings practically never change; unknown pincodes are retried sooner
+_PINCODE_CACHE_TTL = 30 * 24 * 3600  # seconds
+_PINCODE_MISS_CACHE_TTL = 3600  # seconds
+
+
+class APIResponse(dict):
+    """
+    Parsed JSON object from the Carepay API that keeps the body bytes it was
+    decoded from, so a caller passing the response on unchanged can return
+    the original JSON instead of serializing the dict again. The raw bytes
+    describe the response as received; callers that modify it must serialize
+    the dict instead.
+    """
+    __slots__ = ("raw",)
+    
+    def __init__(self, parsed: Dict[str, Any], raw: bytes):
+        super().__init__(parsed)
+        self.raw = raw
+
+
 class CarepayAPIClient:
     """
     Client for interacting with the Carepay API endpoints
@@ -13,8 +41,12 @@ class CarepayAPIClient:
     
     def __init__(self):
         self.base_url = 'https://backend.carepay.money'
-       
-    
+        
+        # Reuse TCP/TLS connections to the backend across requests
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=10, pool_maxsize=50)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
         
     def _make_request(self, method: str, endpoint: str, params: Optional[Dict[str, Any]] = None, 
                      data: Optional[Dict[str, Any]] = None, headers: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
@@ -45,9 +77,9 @@ class CarepayAPIClient:
             
             response = None
             if method.upper() == "GET":
-                response = requests.get(url, params=params, headers=headers, timeout=60)
+                response = self.session.get(url, params=params, headers=headers, timeout=60)
             elif method.upper() == "POST":
-                response = requests.post(url, params=params, json=data, headers=headers, timeout=60)
+                response = self.session.post(url, params=params, json=data, headers=headers, timeout=60)
             else:
                 error_msg = f"Unsupported method: {method}"
                 logger.error(error_msg)
@@ -76,8 +108,11 @@ class CarepayAPIClient:
             
             # Try to parse JSON response
             try:
-                json_response = response.json()
+                # orjson.JSONDecodeError subclasses json.JSONDecodeError, so the handler below still applies
+                json_response = orjson.loads(response.content)
                 logger.debug(f"Successfully parsed JSON response")
+                if isinstance(json_response, dict):
+                    return APIResponse(json_response, response.content)
                 return json_response
             except json.JSONDecodeError as e:
                 logger.warning(f"Could not parse JSON response: {e}")
@@ -105,6 +140,59 @@ class CarepayAPIClient:
             logger.error(error_msg, exc_info=True)
             return {"status": 500, "error": error_msg, "url": url, "method": method}
         
+    def _cached_request(self, cache_key: str, method: str, endpoint: str, params: Optional[Dict[str, Any]] = None,
+                        headers: Optional[Dict[str, Any]] = None, ok_status: Any = 200,
+                        ttl: float = _RESPONSE_CACHE_TTL, miss_ttl: float = 0) -> Dict[str, Any]:
+        """
+        Make a request, reusing a recent response for the same cache key.
+        Responses with ok_status are cached for ttl seconds. Other well-formed replies
+        are cached for miss_ttl seconds (not at all by default). Transport and HTTP
+        errors are never cached, so they are always retried.
+        
+        Args:
+            cache_key: Key identifying the lookup
+            method: HTTP method
+            endpoint: API endpoint
+            params: Query parameters
+            headers: Request headers
+            ok_status: Status value of a successful response
+            ttl: Seconds to keep a successful response
+            miss_ttl: Seconds to keep a well-formed unsuccessful response
+            
+        Returns:
+            API response
+        """
+        now = time.monotonic()
+        with _response_cache_lock:
+            cached = _response_cache.get(cache_key)
+            if cached and cached[0] > now:
+                logger.info(f"Using cached response for {cache_key}")
+                return dict(cached[1])
+        
+        response = self._make_request(method, endpoint, params=params, headers=headers)
+        
+        if isinstance(response, dict) and response.get("status") == ok_status:
+            expires = now + ttl
+        elif miss_ttl and isinstance(response, dict) and "error" not in response:
+            expires = now + miss_ttl
+        else:
+            expires = None
+        
+        if expires is not None:
+            with _response_cache_lock:
+                if len(_response_cache) >= _RESPONSE_CACHE_MAX_SIZE:
+                    # Drop expired entries first, then the oldest entry if still full
+                    for key in [k for k, (expires, _) in _response_cache.items() if expires <= now]:
+                        del _response_cache[key]
+                    if len(_response_cache) >= _RESPONSE_CACHE_MAX_SIZE:
+                        del _response_cache[next(iter(_response_cache))]
+                _response_cache[cache_key] = (expires, dict(response))
+        else:
+            with _response_cache_lock:
+                _response_cache.pop(cache_key, None)
+        
+        return response
+        
     def send_otp(self, phone_number: str) -> Dict[str, Any]:
         """
         Send OTP to phone number
@@ -173,7 +261,9 @@ class CarepayAPIClient:
         """Get user ID from phone number"""
         endpoint = f"userDetails/registerUsingMobileNo"
         headers = {'X-API-KEY': 'carepay'}
-        return self._make_request('GET', endpoint, params={"mobileNo": phone_number}, headers=headers)
+        # Key on the normalized 10-digit number so formatting differences share an entry
+        digits = "".join(ch for ch in str(phone_number) if ch.isdigit())[-10:]
+        return self._cached_request(f"{endpoint}:{digits}", 'GET', endpoint, params={"mobileNo": phone_number}, headers=headers)
     
     def save_basic_details(self, user_id: str, details: Dict[str, Any]) -> Dict[str, Any]:
         """Save basic personal details"""
@@ -411,7 +501,7 @@ class CarepayAPIClient:
         endpoint = "jp/checkEligibilityForJPCardless"
         params = {"loanId": loan_id}
         logger.info(f"Checking eligibility for Juspay Cardless for loanId: {loan_id}")
-        return self._make_request('GET', endpoint, params=params)
+        return self._cached_request(f"{endpoint}:{loan_id}", 'GET', endpoint, params=params)
 
     def establish_eligibility(self, loan_id: str) -> Dict[str, Any]:
         """
@@ -446,7 +536,8 @@ class CarepayAPIClient:
             "type": "zip"
         }
         logger.info(f"Getting state and city for pincode: {pincode}")
-        return self._make_request('GET', endpoint, params=params)
+        return self._cached_request(f"{endpoint}:{pincode}", 'GET', endpoint, params=params, ok_status="success",
+                                    ttl=_PINCODE_CACHE_TTL, miss_ttl=_PINCODE_MISS_CACHE_TTL)
     
     def login_with_password(self, doctor_code: str, password: str) -> Dict[str, Any]:
         """
@@ -580,6 +671,18 @@ class CarepayAPIClient:
         }
         return self._make_request('POST', endpoint, data=data)
     
+    def save_profile_details(self, user_id: str, details: Dict[str, Any]) -> Dict[str, Any]:
+        """Save gender, marital status and education level in one call (only the fields provided)"""
+        endpoint = f"userDetails/basicDetail"
+        data = {
+            key: details[key]
+            for key in ("gender", "maritalStatus", "educationLevel")
+            if details.get(key) is not None
+        }
+        data["mobileNumber"] = details.get("mobileNumber")
+        data["userId"] = user_id
+        return self._make_request('POST', endpoint, data=data)
+    
     def save_change_treatment_name_details(self, user_id: str, loan_data: Dict[str, Any]) -> Dict[str, Any]:
         """Save loan details"""
         endpoint = f"userDetails/saveLoanDetails"
@@ -1,6 +1,7 @@
 import openai
 import base64
 import json
+import orjson
 import numpy as np
 from PIL import Image
 import io
@@ -129,7 +130,7 @@ def extract_aadhaar_details(image_path: str) -> dict:
             logger.error(f"Response is not valid JSON format: {content}")
             raise Exception(f"Response is not valid JSON format: {content}")
         
-        result = json.loads(content)
+        result = orjson.loads(content)
         
         # Map the extracted fields to the expected format
         mapped_result = {
@@ -247,7 +248,7 @@ def extract_pan_details(image_path: str) -> dict:
             logger.error(f"PAN card response is not valid JSON format: {content}")
             raise Exception(f"PAN card response is not valid JSON format: {content}")
         
-        result = json.loads(content)
+        result = orjson.loads(content)
         
         # Map the extracted fields to the expected format
         mapped_result = {
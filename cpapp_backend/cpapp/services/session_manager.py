@@ -1,7 +1,17 @@
+import copy
+import json
+import orjson
+import os
+import threading
+import time
 import uuid
 import logging
-from typing import Dict, Any, Optional
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Tuple
 from datetime import datetime
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
 from langchain_core.messages import HumanMessage, AIMessage
 from cpapp.models.session_data import SessionData
 
@@ -9,6 +19,35 @@ logger = logging.getLogger(__name__)
 logger.addHandler(logging.StreamHandler())
 logger.setLevel(logging.DEBUG)
 
+# Session loaded for the current request by SessionManager.session_scope
+_session_scope: ContextVar[Optional[Dict[str, Any]]] = ContextVar("session_scope", default=None)
+
+# Top-level session fields stored as plain columns, which can be set without reading the row
+_IN_PLACE_COLUMNS = frozenset(("status", "phone_number"))
+
+# Cache of sessions read outside session_scope, keyed by session ID to
+# (expiry, row updated_at, session). A cached copy is only used while the stored
+# updated_at still matches, which every write bumps, so writes from other processes
+# invalidate it too; the TTL just bounds how long an idle entry is kept.
+_SESSION_CACHE_TTL = float(os.environ.get("SESSION_CACHE_TTL", "300"))  # seconds
+_SESSION_CACHE_MAX_SIZE = 1024
+_session_cache: Dict[str, Tuple[float, datetime, Dict[str, Any]]] = {}
+_session_cache_lock = threading.Lock()
+
+
+def _jsonb_param(value: Any) -> str:
+    """
+    Serialize value for a %s::jsonb query parameter with orjson, falling back to
+    the json module for values orjson rejects (e.g. integers beyond 64 bits).
+    Datetimes and other unsupported values go through str, as with json's default=str.
+    """
+    try:
+        return orjson.dumps(
+            value, default=str, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        ).decode()
+    except TypeError:
+        return json.dumps(value, default=str)
+
 
 class SessionManager:
     """
@@ -16,23 +55,185 @@ class SessionManager:
     """
     
     @staticmethod
-    def get_session_from_db(session_id: str) -> Optional[Dict[str, Any]]:
+    @contextmanager
+    def session_scope(session_id: str) -> Iterator[None]:
+        """
+        Load the session at most once for the enclosed block and flush the
+        changes made to it once on exit. Inside the block, reads and field
+        updates for this session work on an in-memory copy.
+        
+        Only the field paths and history entries changed inside the block are
+        written back (merged into the stored row), so writes made meanwhile
+        outside the scope, e.g. by the document upload endpoints, are kept.
+        Nested scopes reuse the outer one.
+        
+        Args:
+            session_id: Session ID
+        """
+        if _session_scope.get() is not None:
+            yield
+            return
+        
+        scope = {
+            "session_id": str(session_id),
+            "loaded": False,
+            "session": None,
+            # Field paths set inside the scope (a dict used as an ordered set)
+            "fields": {},
+            # History entries appended inside the scope
+            "history": [],
+            # Set when the whole session was replaced with update_session_in_db
+            "replaced": False,
+        }
+        token = _session_scope.set(scope)
+        try:
+            yield
+        finally:
+            _session_scope.reset(token)
+            if scope["session"] is not None:
+                SessionManager._flush_scope(session_id, scope)
+    
+    @staticmethod
+    def _flush_scope(session_id: str, scope: Dict[str, Any]) -> None:
         """
-        Retrieve session data from the database
+        Write what changed inside a session scope: the field paths set in it with
+        their final values, then the history entries appended in it
         
         Args:
             session_id: Session ID
+            scope: The scope being closed
+        """
+        if scope["replaced"]:
+            SessionManager._write_session_to_db(session_id, scope["session"])
+            return
+        
+        paths = scope["fields"]
+        if paths:
+            # A path below another path set in the scope is written as part of that one
+            updates = {
+                path: SessionManager._get_path(scope["session"], path)
+                for path in paths
+                if not any(path.startswith(other + ".") for other in paths)
+            }
+            SessionManager._set_fields_in_db(session_id, updates)
+        if scope["history"]:
+            SessionManager.append_history(session_id, scope["history"])
+    
+    @staticmethod
+    def _scope_session(scope: Dict[str, Any], session_id: str) -> Optional[Dict[str, Any]]:
+        """Return the scope's in-memory session, reading it on first use"""
+        if not scope["loaded"]:
+            scope["session"] = SessionManager._read_session_from_db(session_id)
+            scope["loaded"] = True
+        return scope["session"]
+    
+    @staticmethod
+    def _get_scope(session_id: Any) -> Optional[Dict[str, Any]]:
+        """Return the active session scope if it belongs to session_id"""
+        scope = _session_scope.get()
+        if scope is not None and scope["session_id"] == str(session_id):
+            return scope
+        return None
+    
+    @staticmethod
+    def get_session_from_db(session_id: str, use_cache: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        Retrieve session data from the database (or the active session scope)
+        
+        Args:
+            session_id: Session ID
+            use_cache: Outside a scope, reuse a cached copy if the stored row has not
+                been updated since it was read (pass False before a read-modify-write)
             
         Returns:
             Session data dictionary or None if not found
         """
+        scope = SessionManager._get_scope(session_id)
+        if scope is None:
+            if use_cache:
+                return SessionManager._read_session_cached(session_id)
+            return SessionManager._read_session_from_db(session_id)
+        
+        # Callers mutate the returned dict, so hand out a copy
+        return copy.deepcopy(SessionManager._scope_session(scope, session_id))
+    
+    @staticmethod
+    def _read_session_cached(session_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Read a session through the process-local cache. A cached copy is checked
+        against the row's updated_at, which only reads that one column, and the
+        full row is read when it has changed
+        
+        Args:
+            session_id: Session ID
+            
+        Returns:
+            Session data dictionary (the caller's own copy) or None if not found
+        """
+        key = str(session_id)
+        now = time.monotonic()
+        with _session_cache_lock:
+            cached = _session_cache.get(key)
+        if cached and cached[0] > now:
+            try:
+                updated_at = SessionData.objects.filter(
+                    session_id=uuid.UUID(key)
+                ).values_list("updated_at", flat=True).first()
+            except Exception as e:
+                logger.error(f"Error checking cached session {session_id}: {e}")
+                updated_at = None
+            if updated_at is not None and updated_at == cached[1]:
+                return copy.deepcopy(cached[2])
+        
+        session, updated_at = SessionManager._read_session_row(session_id)
+        if session is not None:
+            with _session_cache_lock:
+                if len(_session_cache) >= _SESSION_CACHE_MAX_SIZE:
+                    # Drop expired entries first, then the oldest entry if still full
+                    for stale_key in [k for k, (expires, _, _) in _session_cache.items() if expires <= now]:
+                        del _session_cache[stale_key]
+                    if len(_session_cache) >= _SESSION_CACHE_MAX_SIZE:
+                        del _session_cache[next(iter(_session_cache))]
+                _session_cache[key] = (now + _SESSION_CACHE_TTL, updated_at, copy.deepcopy(session))
+        return session
+    
+    @staticmethod
+    def _invalidate_cached_session(session_id: Any) -> None:
+        """Drop the cached copy of a session after it is written"""
+        with _session_cache_lock:
+            _session_cache.pop(str(session_id), None)
+    
+    @staticmethod
+    def _read_session_from_db(session_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Read session data from the database
+        
+        Args:
+            session_id: Session ID
+            
+        Returns:
+            Session data dictionary or None if not found
+        """
+        return SessionManager._read_session_row(session_id)[0]
+    
+    @staticmethod
+    def _read_session_row(session_id: str) -> Tuple[Optional[Dict[str, Any]], Optional[datetime]]:
+        """
+        Read session data from the database along with the row's updated_at
+        
+        Args:
+            session_id: Session ID
+            
+        Returns:
+            Tuple of (session data dictionary or None if not found, updated_at or None)
+        """
         try:
             session_uuid = uuid.UUID(session_id)
             session_data = SessionData.objects.get(session_id=session_uuid)
             logger.debug(f"Session {session_id} retrieved from database.")
             if not session_data:
                 logger.warning(f"Session {session_id} not found in database")
-                return None
+                return None, None
             
             # History is already in serializable format, no conversion needed
             session = {
@@ -44,18 +245,38 @@ class SessionManager:
                 "phone_number": session_data.phone_number
             }
             
-            return session
+            return session, session_data.updated_at
         except SessionData.DoesNotExist:
             logger.warning(f"Session {session_id} not found in database.")
-            return None
+            return None, None
         except Exception as e:
             logger.error(f"Error retrieving session from database: {e}")
-            return None
+            return None, None
     
     @staticmethod
     def update_session_in_db(session_id: str, session_data: Dict[str, Any]) -> None:
         """
-        Update session data in the database
+        Update session data in the database (deferred to scope exit inside session_scope,
+        where the whole stored row is then replaced)
+        
+        Args:
+            session_id: Session ID
+            session_data: Session data dictionary
+        """
+        scope = SessionManager._get_scope(session_id)
+        if scope is None:
+            SessionManager._write_session_to_db(session_id, session_data)
+            return
+        
+        scope["session"] = copy.deepcopy(session_data)
+        scope["loaded"] = True
+        scope["replaced"] = True
+        logger.debug(f"Session {session_id} updated in session scope")
+    
+    @staticmethod
+    def _write_session_to_db(session_id: str, session_data: Dict[str, Any]) -> None:
+        """
+        Write session data to the database
         
         Args:
             session_id: Session ID
@@ -81,6 +302,7 @@ class SessionManager:
                     'phone_number': session_data.get('phone_number'),
                 }
             )
+            SessionManager._invalidate_cached_session(session_id)
             
             logger.info(f"Session {session_id} updated in database")
         except Exception as e:
@@ -96,28 +318,190 @@ class SessionManager:
             field_path: Dot-separated path to the field (e.g., "data.userId")
             value: Value to set
         """
+        SessionManager.update_session_data_fields(session_id, {field_path: value})
+    
+    @staticmethod
+    def update_session_data_fields(session_id: str, updates: Dict[str, Any]) -> None:
+        """
+        Update several fields in session data with a single read and write
+        
+        Args:
+            session_id: Session ID
+            updates: Mapping of dot-separated field paths (e.g., "data.userId") to values
+        """
+        if not updates:
+            return
+        scope = SessionManager._get_scope(session_id)
+        if scope is not None:
+            SessionManager._update_in_scope(scope, session_id, updates)
+            return
+        if SessionManager._can_set_in_place(updates):
+            SessionManager._set_fields_in_db(session_id, updates)
+            return
         try:
-            session = SessionManager.get_session_from_db(session_id)
+            session = SessionManager.get_session_from_db(session_id, use_cache=False)
             if not session:
                 logger.error(f"Session {session_id} not found for field update")
                 return
             
-            # Navigate to the field using the path
-            path_parts = field_path.split('.')
-            current = session
-            
-            # Navigate to the parent of the target field
-            for part in path_parts[:-1]:
-                if part not in current:
-                    current[part] = {}
-                current = current[part]
-            
-            # Set the value
-            current[path_parts[-1]] = value
+            for field_path, value in updates.items():
+                SessionManager._set_path(session, field_path, value)
             
             # Save back to database
             SessionManager.update_session_in_db(session_id, session)
             
-            logger.info(f"Updated field {field_path} in session {session_id}")
+            logger.info(f"Updated fields {', '.join(updates)} in session {session_id}")
+        except Exception as e:
+            logger.error(f"Error updating session fields {', '.join(updates)}: {e}")
+    
+    @staticmethod
+    def _update_in_scope(scope: Dict[str, Any], session_id: str, updates: Dict[str, Any]) -> None:
+        """
+        Apply field updates to a scope's in-memory session and record their paths
+        for the flush on scope exit
+        
+        Args:
+            scope: Active scope for session_id
+            session_id: Session ID
+            updates: Mapping of dot-separated field paths to values
+        """
+        try:
+            session = SessionManager._scope_session(scope, session_id)
+            if session is None:
+                logger.error(f"Session {session_id} not found for field update")
+                return
+            for field_path, value in updates.items():
+                SessionManager._set_path(session, field_path, copy.deepcopy(value))
+                scope["fields"][field_path] = None
+            if not SessionManager._can_set_in_place(updates):
+                # Paths outside data.* and the plain columns cannot be merged in place
+                scope["replaced"] = True
+            logger.debug(f"Updated fields {', '.join(updates)} in session scope {session_id}")
+        except Exception as e:
+            logger.error(f"Error updating session fields {', '.join(updates)}: {e}")
+    
+    @staticmethod
+    def _set_path(session: Dict[str, Any], field_path: str, value: Any) -> None:
+        """Set the value at a dot-separated path, creating missing parent dicts"""
+        path_parts = field_path.split('.')
+        current = session
+        for part in path_parts[:-1]:
+            if part not in current:
+                current[part] = {}
+            current = current[part]
+        current[path_parts[-1]] = value
+    
+    @staticmethod
+    def _get_path(session: Dict[str, Any], field_path: str) -> Any:
+        """Return the value at a dot-separated path set with _set_path"""
+        current = session
+        for part in field_path.split('.'):
+            current = current[part]
+        return current
+    
+    @staticmethod
+    def _can_set_in_place(field_paths: Iterable[str]) -> bool:
+        """Whether every path is a data.* path or a plain column _set_fields_in_db can write"""
+        return all(
+            path.startswith("data.") or path in _IN_PLACE_COLUMNS
+            for path in field_paths
+        )
+    
+    @staticmethod
+    def _set_fields_in_db(session_id: str, updates: Dict[str, Any]) -> None:
+        """
+        Apply field updates with a single UPDATE and no prior read: data.* paths
+        are merged into the stored JSONB (every other key is left untouched) and
+        plain columns such as status are assigned directly
+        
+        Args:
+            session_id: Session ID
+            updates: Mapping of field paths accepted by _can_set_in_place to values
+        """
+        try:
+            tree: Dict[str, Any] = {}
+            columns: Dict[str, Any] = {}
+            for field_path, value in updates.items():
+                if field_path in _IN_PLACE_COLUMNS:
+                    columns[field_path] = value
+                    continue
+                path_parts = field_path.split('.')
+                if path_parts[0] != "data" or len(path_parts) < 2:
+                    raise ValueError(f"Field cannot be updated in place: {field_path}")
+                node = tree
+                for part in path_parts[1:-1]:
+                    node = node.setdefault(part, {})
+                node[path_parts[-1]] = (value,)
+            
+            if tree:
+                sql, params = SessionManager._jsonb_merge_sql(tree, [])
+                columns["data"] = RawSQL(sql, params)
+            updated = SessionData.objects.filter(session_id=uuid.UUID(str(session_id))).update(
+                **columns,
+                updated_at=timezone.now(),
+            )
+            SessionManager._invalidate_cached_session(session_id)
+            if not updated:
+                logger.error(f"Session {session_id} not found for field update")
+                return
+            logger.info(f"Updated fields {', '.join(updates)} in session {session_id}")
+        except Exception as e:
+            logger.error(f"Error updating session fields {', '.join(updates)}: {e}")
+    
+    @staticmethod
+    def _jsonb_merge_sql(tree: Dict[str, Any], prefix: List[str]) -> Tuple[str, List[Any]]:
+        """
+        Build the SQL expression for the data object at prefix with the leaves
+        in tree (1-tuples wrapping the new values) merged in, creating missing
+        parent objects on the way
+        """
+        pairs = []
+        params: List[Any] = []
+        for key, child in tree.items():
+            if isinstance(child, tuple):
+                child_sql, child_params = "%s::jsonb", [_jsonb_param(child[0])]
+            else:
+                child_sql, child_params = SessionManager._jsonb_merge_sql(child, prefix + [key])
+            pairs.append(f"%s, {child_sql}")
+            params.extend([key, *child_params])
+        
+        current = "data #> %s::text[]"
+        base = f"CASE WHEN jsonb_typeof({current}) = 'object' THEN {current} ELSE '{{}}'::jsonb END"
+        return f"({base} || jsonb_build_object({', '.join(pairs)}))", [prefix, prefix] + params
+    
+    @staticmethod
+    def append_history(session_id: str, messages: List[Dict[str, Any]]) -> None:
+        """
+        Append messages to the session history without reading or rewriting
+        the stored list (appended in memory inside session_scope)
+        
+        Args:
+            session_id: Session ID
+            messages: Serializable history entries to append
+        """
+        if not messages:
+            return
+        try:
+            scope = SessionManager._get_scope(session_id)
+            if scope is not None:
+                session = SessionManager._scope_session(scope, session_id)
+                if session is None:
+                    logger.error(f"Session {session_id} not found for history append")
+                    return
+                messages = copy.deepcopy(messages)
+                session.setdefault("history", []).extend(messages)
+                scope["history"].extend(messages)
+                return
+            
+            session_uuid = uuid.UUID(str(session_id))
+            updated = SessionData.objects.filter(session_id=session_uuid).update(
+                history=RawSQL("COALESCE(history, '[]'::jsonb) || %s::jsonb", (_jsonb_param(messages),)),
+                updated_at=timezone.now(),
+            )
+            SessionManager._invalidate_cached_session(session_id)
+            if not updated:
+                logger.error(f"Session {session_id} not found for history append")
+                return
+            logger.info(f"Appended {len(messages)} history messages to session {session_id}")
         except Exception as e:
-            logger.error(f"Error updating session field {field_path}: {e}") 
\ No newline at end of file
+            logger.error(f"Error appending session history: {e}")
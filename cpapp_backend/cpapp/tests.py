@@ -1,3 +1,207 @@
-from django.test import TestCase
+import uuid
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase, TestCase
+from langchain.agents import AgentExecutor, Tool
+from langchain.agents.agent import RunnableMultiActionAgent
+from langchain_core.agents import AgentAction, AgentFinish
+from langchain_core.runnables import RunnableLambda
+
+from cpapp.models.session_data import SessionData
+from cpapp.services import agent
+from cpapp.services.session_manager import SessionManager
+
+
+class JsonbMergeSqlTests(SimpleTestCase):
+    """SQL built by SessionManager._jsonb_merge_sql for nested field paths"""
+
+    def test_nested_paths_merge_into_their_parent_objects(self):
+        tree = {"a": {"b": (1,)}, "c": ("x",)}
+        sql, params = SessionManager._jsonb_merge_sql(tree, [])
+
+        # Each level keeps its stored object (or starts from {}) and merges its children in
+        self.assertEqual(sql.count("jsonb_build_object("), 2)
+        self.assertEqual(sql.count("CASE WHEN jsonb_typeof("), 2)
+        self.assertEqual(params, [[], [], "a", ["a"], ["a"], "b", "1", "c", '"x"'])
+
+
+class SessionFieldsDbTests(TestCase):
+    """Field updates applied in place by SessionManager._set_fields_in_db (needs PostgreSQL)"""
+
+    def setUp(self):
+        self.session_id = str(uuid.uuid4())
+        SessionData.objects.create(
+            session_id=uuid.UUID(self.session_id),
+            data={"keep": 1, "api_responses": {"a": {"status": 200}}, "scalar": "s"},
+            history=[{"type": "AIMessage", "content": "hi"}],
+            status="active",
+        )
+
+    def _row(self):
+        return SessionData.objects.get(session_id=uuid.UUID(self.session_id))
+
+    def test_nested_paths_merge_without_touching_other_keys(self):
+        SessionManager._set_fields_in_db(self.session_id, {
+            "data.api_responses.b": {"status": 500},
+            "data.new.deep.leaf": [1, 2],
+            "data.scalar.child": True,
+            "status": "collecting_additional_details",
+        })
+
+        row = self._row()
+        self.assertEqual(row.data["keep"], 1)
+        self.assertEqual(row.data["api_responses"], {"a": {"status": 200}, "b": {"status": 500}})
+        self.assertEqual(row.data["new"], {"deep": {"leaf": [1, 2]}})
+        # A non-object parent is replaced by an object holding the new key
+        self.assertEqual(row.data["scalar"], {"child": True})
+        self.assertEqual(row.status, "collecting_additional_details")
+
+    def test_session_scope_flushes_only_changed_paths(self):
+        with SessionManager.session_scope(self.session_id):
+            SessionManager.update_session_data_fields(self.session_id, {
+                "data.collection_step": "employment_type",
+                "data.api_responses.a.status": 201,
+            })
+            SessionManager.append_history(self.session_id, [{"type": "HumanMessage", "content": "1"}])
+            # Reads inside the scope see the scope's own writes
+            session = SessionManager.get_session_from_db(self.session_id)
+            self.assertEqual(session["data"]["collection_step"], "employment_type")
+            self.assertNotIn("collection_step", self._row().data)
+
+            # Written meanwhile outside the scope, e.g. by a document upload
+            SessionData.objects.filter(session_id=uuid.UUID(self.session_id)).update(
+                data={**self._row().data, "panCard": "ABCDE1234F"},
+            )
+
+        row = self._row()
+        self.assertEqual(row.data["panCard"], "ABCDE1234F")
+        self.assertEqual(row.data["collection_step"], "employment_type")
+        self.assertEqual(row.data["api_responses"]["a"], {"status": 201})
+        self.assertEqual([m["content"] for m in row.history], ["hi", "1"])
+
+
+class ReplayableSaveTests(SimpleTestCase):
+    """Replay of a stored save response by input hash and age"""
+
+    def setUp(self):
+        self.payload = {"userId": "u1", "panCard": "ABCDE1234F"}
+        self.data = {
+            "api_responses": {"save_prefill_details": {"status": 200, "data": "ok"}},
+            "api_response_times": {"save_prefill_details": 1000.0},
+            "api_input_hashes": {"save_prefill_details": agent._input_hash(self.payload)},
+        }
+
+    def test_same_input_within_ttl_is_replayed(self):
+        input_hash = agent._input_hash(dict(reversed(list(self.payload.items()))))
+        with mock.patch.object(agent.time, "time", return_value=1000.0 + agent._API_REPLAY_TTL):
+            result = agent._replayable_save(self.data, "save_prefill_details", input_hash)
+        self.assertEqual(result, {"status": 200, "data": "ok"})
+
+    def test_changed_input_is_not_replayed(self):
+        input_hash = agent._input_hash({**self.payload, "panCard": "ZZZZZ9999Z"})
+        with mock.patch.object(agent.time, "time", return_value=1001.0):
+            self.assertIsNone(agent._replayable_save(self.data, "save_prefill_details", input_hash))
+
+    def test_expired_or_failed_response_is_not_replayed(self):
+        input_hash = agent._input_hash(self.payload)
+        with mock.patch.object(agent.time, "time", return_value=1000.0 + agent._API_REPLAY_TTL + 1):
+            self.assertIsNone(agent._replayable_save(self.data, "save_prefill_details", input_hash))
+
+        self.data["api_responses"]["save_prefill_details"]["status"] = 500
+        with mock.patch.object(agent.time, "time", return_value=1001.0):
+            self.assertIsNone(agent._replayable_save(self.data, "save_prefill_details", input_hash))
+
+
+class PrefillFastPathTests(SimpleTestCase):
+    """The common-shape prefill extractors agree with the generic ones"""
+
+    BASIC_CASES = [
+        {"pan": "ABCDE1234F", "gender": "Male", "dob": "1990-01-01", "email": "a@b.com"},
+        {"pan": "ABCDE1234F", "gender": "Female", "dob": "1990-01-01", "email": [{"email": "c@d.com"}, {"email": "e@f.com"}]},
+        # Not the common shape: the generic extractor handles these
+        {"pan": "ABCDE1234F", "gender": None, "dob": "1990-01-01", "email": "a@b.com"},
+        {"pan": "ABCDE1234F", "gender": "Male", "dob": 19900101, "email": ["a@b.com"]},
+        {"pan": "ABCDE1234F", "email": [{"email": None}], "response": {"gender": "Male", "mobile": "9999999999"}},
+    ]
+
+    ADDRESS_CASES = [
+        [{"Type": "Primary", "Address": "12 MG Road Bengaluru", "Postal": "560001", "State": "KA"}],
+        [{"Type": "PERMANENT", "Address": "4 Park St", "Postal": "700016", "State": "WB"}, {"Type": "Other", "Postal": "110001"}],
+        # Not the common shape: the generic extractor handles these
+        [{"Type": "Primary", "Address": "1 Road", "Postal": "560 001", "State": "KA"}],
+        [{"Type": "Other", "Address": "1 Road", "Postal": "110001", "State": "DL"}, {"Type": "Primary", "Postal": "5600"}],
+        [{"Type": "Primary", "Postal": "560001"}],
+        [],
+    ]
+
+    def test_basic_fields_match_generic_extractor(self):
+        for prefill in self.BASIC_CASES:
+            with self.subTest(prefill=prefill):
+                with mock.patch.object(agent, "_fast_extract_basic", side_effect=KeyError):
+                    expected = agent._extract_basic_fields(prefill)
+                self.assertEqual(agent._extract_basic_fields(prefill), expected)
+
+    def test_address_fields_match_generic_extractor(self):
+        for address_list in self.ADDRESS_CASES:
+            prefill = {"address": address_list}
+            with self.subTest(address=address_list):
+                with mock.patch.object(agent, "_fast_extract_address", side_effect=KeyError):
+                    expected = agent._extract_address_fields(prefill)
+                self.assertEqual(agent._extract_address_fields(prefill), expected)
+
+    def test_common_shape_takes_the_fast_path(self):
+        before = agent._prefill_fast_path_counts[("address_fields", True)]
+        agent._extract_address_fields({"address": self.ADDRESS_CASES[0]})
+        self.assertEqual(agent._prefill_fast_path_counts[("address_fields", True)], before + 1)
+
+
+class TreatmentCostPrecheckTests(SimpleTestCase):
+    """Out-of-range treatment costs answered without an LLM turn"""
+
+    def precheck(self, message):
+        # _precheck_user_input does not use the agent instance
+        return agent.CarepayAgent._precheck_user_input(None, message)
+
+    def test_labelled_out_of_range_cost_is_rejected(self):
+        self.assertIn("₹2,500", self.precheck("Treatment cost: ₹2,500"))
+        self.assertIn("₹2,000,000", self.precheck("my treatment cost is 2000000"))
+        self.assertIsNotNone(self.precheck("treatment cost - rs 2000000"))
+
+    def test_in_range_or_unit_amounts_go_to_the_agent(self):
+        self.assertIsNone(self.precheck("treatment cost is 50,000"))
+        self.assertIsNone(self.precheck("treatment cost 2 lakh"))
+
+    def test_emi_wording_is_not_a_treatment_cost(self):
+        for message in (
+            "I want the no cost 6 month plan",
+            "no-cost 12 EMI",
+            "monthly cost 2000 emi",
+            "no treatment cost 6 month plan",
+        ):
+            with self.subTest(message=message):
+                self.assertIsNone(self.precheck(message))
+
+
+class RepeatedToolCallGuardTests(SimpleTestCase):
+    """Agent turns stopped when the same tool call repeats"""
+
+    def run_agent(self, actions):
+        calls = []
+        tool = Tool(name="lookup", func=lambda value: calls.append(value) or "ok", description="Look up a value")
+        steps = iter(actions)
+        agent_runnable = RunnableMultiActionAgent(runnable=RunnableLambda(lambda _: next(steps)))
+        executor = AgentExecutor(agent=agent_runnable, tools=[tool], max_iterations=5)
+        executor.invoke({"input": "hi"}, config={"callbacks": [agent.RepeatedToolCallGuard()]})
+        return calls
+
+    def test_identical_call_in_a_row_stops_the_turn(self):
+        with self.assertRaises(agent.RepeatedToolCallError):
+            self.run_agent([[AgentAction("lookup", "a", "")], [AgentAction("lookup", "a", "")]])
+
+    def test_changed_input_continues(self):
+        calls = self.run_agent([
+            [AgentAction("lookup", "a", "")],
+            [AgentAction("lookup", "b", "")],
+            AgentFinish({"output": "done"}, ""),
+        ])
+        self.assertEqual(calls, ["a", "b"])